@@ -0,0 +1,449 @@
+# agents/llm_gateway.py
+"""
+One gateway in front of every LLM client (supervisor and agents alike), so the
+process talks to Groq as a single well-behaved caller:
+
+- single-flight: identical prompts already in flight (same client config) wait
+  for that call instead of paying for their own
+- token buckets on requests and on tokens per minute; a call is admitted only
+  when both have room (tokens are estimated up front and settled with the
+  usage the API reports)
+- priority queue: interactive calls (invoke/ainvoke) are admitted before batch
+  calls (batch), FIFO within a priority; at most MAX_INFLIGHT calls run at once
+- retries with exponential backoff and full jitter on 429 / 5xx / connection
+  errors; a 429 pauses admission for everybody (Retry-After when given), so a
+  rate limit does not turn into a retry storm
+
+Queue depth, in-flight calls and wait times are exported as the "llm_gateway"
+metrics source; each admission wait is also an "llm_queue" span.
+
+  NL2DB_LLM_GATEWAY            enable (default 1; read by agents/registry.py)
+  NL2DB_LLM_RPM                requests per minute (default 30; 0 = unlimited)
+  NL2DB_LLM_TPM                tokens per minute (default 30000; 0 = unlimited)
+  NL2DB_LLM_MAX_INFLIGHT       concurrent calls (default 8)
+  NL2DB_LLM_COMPLETION_TOKENS  completion tokens assumed per call before usage is known (default 256)
+  NL2DB_LLM_RETRIES            retries per call (default 3)
+  NL2DB_LLM_BACKOFF_S          first backoff step in seconds (default 0.5, doubling, capped at 20)
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from db.tracing import annotate, metrics, span
+
+RPM = float(os.getenv("NL2DB_LLM_RPM", "30"))
+TPM = float(os.getenv("NL2DB_LLM_TPM", "30000"))
+MAX_INFLIGHT = int(os.getenv("NL2DB_LLM_MAX_INFLIGHT", "8"))
+COMPLETION_TOKENS = int(os.getenv("NL2DB_LLM_COMPLETION_TOKENS", "256"))
+RETRIES = int(os.getenv("NL2DB_LLM_RETRIES", "3"))
+BACKOFF_S = float(os.getenv("NL2DB_LLM_BACKOFF_S", "0.5"))
+BACKOFF_MAX_S = 20.0
+
+INTERACTIVE, BATCH = 0, 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_RETRY_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+class TokenBucket:
+    """`rate` units per minute, burst up to one minute's worth; rate <= 0 never limits."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.level = rate
+        self._t = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.rate, self.level + (now - self._t) * self.rate / 60.0)
+        self._t = now
+
+    def delay(self, n: float, now: float) -> float:
+        """Seconds until `n` units are available (a request larger than the burst waits for a full bucket)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        need = min(n, self.rate) - self.level
+        return max(0.0, need * 60.0 / self.rate)
+
+    def take(self, n: float) -> None:
+        if self.rate > 0:
+            self.level -= n
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _retryable(exc: BaseException) -> bool:
+    return (
+        getattr(exc, "status_code", None) in _RETRY_STATUS
+        or type(exc).__name__ in _RETRY_ERRORS
+        or isinstance(exc, (TimeoutError, ConnectionError))
+    )
+
+def _rate_limited(exc: BaseException) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+def _used_tokens(resp) -> Optional[int]:
+    usage = (getattr(resp, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("total_tokens")
+
+class _Waiter:
+    __slots__ = ("priority", "cost", "wake", "admitted")
+
+    def __init__(self, priority: int, cost: float, wake: Callable[[], None]):
+        self.priority = priority
+        self.cost = cost
+        self.wake = wake
+        self.admitted = False
+
+class LLMGateway:
+    """Admission control (buckets + priority queue), single-flight and retries for LLM calls."""
+
+    def __init__(self, rpm: float = RPM, tpm: float = TPM, max_inflight: int = MAX_INFLIGHT,
+                 retries: int = RETRIES, backoff_s: float = BACKOFF_S):
+        self.max_inflight = max(1, max_inflight)
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self._queue: List[tuple] = []          # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._paused_until = 0.0               # set by a 429: nobody is admitted before this
+        self._flights: Dict[tuple, Future] = {}
+        self._waiters: Dict[Future, int] = {}   # callers waiting on each flight (leader included)
+        self._tasks: Dict[Future, "asyncio.Future"] = {}  # flight -> the acall task running it
+        self._stats = {"calls": 0, "coalesced": 0, "retries": 0, "rate_limited": 0, "failures": 0,
+                       "throttled": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    # --- admission ---
+    def _wake_head(self) -> None:
+        # Caller holds the lock.
+        if self._queue:
+            self._queue[0][2].wake()
+
+    def _try_admit(self, w: _Waiter) -> Optional[float]:
+        """0 = admitted; seconds to wait for a refill; None = wait for a wake-up. Caller holds the lock."""
+        if self._queue[0][2] is not w or self._inflight >= self.max_inflight:
+            return None
+        now = time.monotonic()
+        wait = max(self._paused_until - now, self._requests.delay(1, now), self._tokens.delay(w.cost, now))
+        if wait > 0:
+            return wait
+        self._requests.take(1)
+        self._tokens.take(w.cost)
+        heapq.heappop(self._queue)
+        self._inflight += 1
+        w.admitted = True
+        self._wake_head()
+        return 0.0
+
+    def _enqueue(self, priority: int, cost: float, wake: Callable[[], None]) -> _Waiter:
+        w = _Waiter(priority, cost, wake)
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._seq), w))
+        return w
+
+    def _abandon(self, w: _Waiter) -> None:
+        # A waiter that gave up (cancelled / timed out) leaves the queue.
+        with self._lock:
+            if not w.admitted:
+                self._queue = [e for e in self._queue if e[2] is not w]
+                heapq.heapify(self._queue)
+                self._wake_head()
+
+    def _admitted(self, started: float) -> None:
+        ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["wait_ms_total"] += ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], ms)
+            if ms >= 1:
+                self._stats["throttled"] += 1
+
+    def acquire(self, priority: int, cost: float) -> None:
+        started = time.perf_counter()
+        event = threading.Event()
+        w = self._enqueue(priority, cost, event.set)
+        try:
+            with span("llm_queue", priority=_PRIORITY_NAMES[priority]):
+                while True:
+                    event.clear()
+                    with self._lock:
+                        wait = self._try_admit(w)
+                    if wait == 0:
+                        break
+                    event.wait(wait)
+        except BaseException:
+            self._abandon(w)
+            raise
+        self._admitted(started)
+
+    async def aacquire(self, priority: int, cost: float) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        w = self._enqueue(priority, cost, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            with span("llm_queue", priority=_PRIORITY_NAMES[priority]):
+                while True:
+                    event.clear()
+                    with self._lock:
+                        wait = self._try_admit(w)
+                    if wait == 0:
+                        break
+                    try:
+                        await asyncio.wait_for(event.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            self._abandon(w)
+            raise
+        self._admitted(started)
+
+    def release(self, cost: float, resp=None, error: BaseException = None) -> Optional[float]:
+        """Free the slot, settle token usage; returns the backoff before a retry (None = don't retry)."""
+        used = _used_tokens(resp) if resp is not None else None
+        retry = error is not None and _retryable(error)
+        hint = (_retry_after(error) or 0.0) if retry else None
+        with self._lock:
+            self._inflight -= 1
+            if used is not None:
+                self._tokens.take(used - cost)
+            if retry and _rate_limited(error):
+                self._stats["rate_limited"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + (hint or self.backoff_s))
+            self._wake_head()
+        return hint
+
+    def _backoff(self, attempt: int, hint: float) -> float:
+        # Full jitter: uniform(0, base * 2^attempt), at least the server's Retry-After.
+        return max(hint, random.uniform(0, min(BACKOFF_MAX_S, self.backoff_s * (2 ** attempt))))
+
+    # --- calls ---
+    def call(self, client, prompt, priority: int = INTERACTIVE, **kwargs):
+        """
+        client.invoke(prompt, **kwargs) through admission, retries and
+        single-flight (kwargs include the caller's LangChain `config`; a caller
+        coalesced onto another's call gets its answer, not its own callbacks).
+        """
+        key = (id(client), prompt) if isinstance(prompt, str) else None
+        fut, leader = self._join(key)
+        if not leader:
+            annotate(llm_coalesced=True)
+            return fut.result()
+        try:
+            resp = self._call(client, prompt, priority, kwargs)
+        except BaseException as e:
+            self._land(key, fut, error=e)
+            raise
+        self._land(key, fut, resp)
+        return resp
+
+    async def acall(self, client, prompt, priority: int = INTERACTIVE, **kwargs):
+        """
+        Async twin of call (client.ainvoke). A caller that is cancelled (e.g. its
+        request timed out) only gives up its own wait: the shared call goes on
+        for the others, and is stopped only when nobody else waits on it.
+        """
+        key = (id(client), prompt) if isinstance(prompt, str) else None
+        fut, leader = self._join(key)
+        if not leader:
+            annotate(llm_coalesced=True)
+            try:
+                return await asyncio.shield(asyncio.wrap_future(fut))
+            except asyncio.CancelledError:
+                self._leave(key, fut)
+                raise
+        task = asyncio.ensure_future(self._acall(client, prompt, priority, kwargs))
+        with self._lock:
+            self._tasks[fut] = task
+        task.add_done_callback(lambda t: self._land_task(key, fut, t))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            self._leave(key, fut)
+            raise
+
+    def _land_task(self, key, fut: Future, task: "asyncio.Future") -> None:
+        if task.cancelled():
+            self._land(key, fut, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._land(key, fut, error=task.exception())
+        else:
+            self._land(key, fut, task.result())
+
+    def _leave(self, key, fut: Future) -> None:
+        """
+        A cancelled caller stops waiting on the flight. The last one to leave
+        closes it to new callers and stops its call (budget nobody waits for).
+        """
+        with self._lock:
+            left = self._waiters.get(fut, 1) - 1
+            if left > 0:
+                self._waiters[fut] = left
+                return
+            self._waiters.pop(fut, None)
+            if key is not None and self._flights.get(key) is fut:
+                del self._flights[key]
+            task = self._tasks.pop(fut, None)
+        if task is not None and not task.done():
+            task.get_loop().call_soon_threadsafe(task.cancel)  # a follower may run on another loop
+
+    def _join(self, key):
+        fut = Future()
+        with self._lock:
+            if key is not None:
+                flight = self._flights.get(key)
+                if flight is not None:
+                    self._stats["coalesced"] += 1
+                    self._waiters[flight] += 1
+                    return flight, False
+                self._flights[key] = fut
+            self._waiters[fut] = 1
+            return fut, True
+
+    def _land(self, key, fut: Future, resp=None, error: BaseException = None) -> None:
+        with self._lock:
+            self._waiters.pop(fut, None)
+            self._tasks.pop(fut, None)
+            if key is not None and self._flights.get(key) is fut:
+                del self._flights[key]
+        if fut.done():
+            return  # already settled (or cancelled); nothing left to tell
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(resp)
+
+    def _cost(self, prompt) -> float:
+        return len(str(prompt)) / 4 + COMPLETION_TOKENS
+
+    def _call(self, client, prompt, priority: int, kwargs):
+        cost = self._cost(prompt)
+        for attempt in range(self.retries + 1):
+            self.acquire(priority, cost)
+            with self._lock:
+                self._stats["calls"] += 1
+            try:
+                resp = client.invoke(prompt, **kwargs)
+            except Exception as e:
+                hint = self.release(cost, error=e)
+                if hint is None or attempt == self.retries:
+                    self._failed()
+                    raise
+                self._retrying()
+                time.sleep(self._backoff(attempt, hint))
+                continue
+            self.release(cost, resp)
+            return resp
+
+    async def _acall(self, client, prompt, priority: int, kwargs):
+        cost = self._cost(prompt)
+        for attempt in range(self.retries + 1):
+            await self.aacquire(priority, cost)
+            with self._lock:
+                self._stats["calls"] += 1
+            try:
+                resp = await client.ainvoke(prompt, **kwargs)
+            except asyncio.CancelledError:
+                self.release(cost)  # nobody waits any more: free the slot, no retry
+                raise
+            except Exception as e:
+                hint = self.release(cost, error=e)
+                if hint is None or attempt == self.retries:
+                    self._failed()
+                    raise
+                self._retrying()
+                await asyncio.sleep(self._backoff(attempt, hint))
+                continue
+            self.release(cost, resp)
+            return resp
+
+    def _retrying(self) -> None:
+        with self._lock:
+            self._stats["retries"] += 1
+        annotate(llm_retries=True)
+
+    def _failed(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["inflight"] = self._inflight
+            out["queue_interactive"] = sum(1 for p, _, _ in self._queue if p == INTERACTIVE)
+            out["queue_batch"] = sum(1 for p, _, _ in self._queue if p == BATCH)
+        admitted = out["calls"]
+        out["wait_ms_avg"] = out["wait_ms_total"] / admitted if admitted else 0.0
+        return out
+
+class GatedLLM:
+    """
+    A chat client whose invoke / ainvoke / batch go through the gateway.
+    Anything else (attributes, other methods) is the wrapped client's.
+    """
+
+    def __init__(self, client, gateway: "LLMGateway" = None):
+        self.client = client
+        self._gateway = gateway
+
+    @property
+    def gateway(self) -> LLMGateway:
+        return self._gateway or get_gateway()
+
+    def invoke(self, prompt, config: Optional[dict] = None, **kwargs):
+        return self.gateway.call(self.client, prompt, INTERACTIVE, config=config, **kwargs)
+
+    async def ainvoke(self, prompt, config: Optional[dict] = None, **kwargs):
+        return await self.gateway.acall(self.client, prompt, INTERACTIVE, config=config, **kwargs)
+
+    def batch(self, prompts: List[Any], config: Optional[dict] = None, *, return_exceptions: bool = False, **kwargs):
+        """Batch priority; at most config["max_concurrency"] of these queue at once."""
+        if not prompts:
+            return []
+        workers = max(1, min(len(prompts), (config or {}).get("max_concurrency") or len(prompts)))
+
+        def one(prompt):
+            try:
+                return self.gateway.call(self.client, prompt, BATCH, config=config, **kwargs)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nl2db-llm") as pool:
+            futures = [pool.submit(contextvars.copy_context().run, one, p) for p in prompts]
+            return [f.result() for f in futures]
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+def set_gateway(gateway: Optional[LLMGateway]) -> None:
+    """Swap the process-wide gateway (None = rebuild from the environment on next use)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
+
+metrics.register_source("llm_gateway", lambda: get_gateway().stats())
@@ -0,0 +1,492 @@
+# agents/local_compiler.py
+"""
+Rule-based NL -> query compiler for the common intents, so they skip the LLM.
+
+The intents are the ones the agents' decision policy already names:
+  - aggregates: average/mean, count/how many/number of, sum/total, min, max,
+    optionally "by <column>"             -> GROUP BY / $group
+  - top/bottom N ("top 10 customers by spending score", "5 oldest customers")
+                                          -> ORDER BY + LIMIT / $sort + $limit
+    without a count only for one subject ("the oldest customer" -> LIMIT 1);
+    "top customers by income" names no count and goes to the LLM
+  - list with conditions ("male customers with annual income above 70k",
+    "customers aged 25 to 35")            -> WHERE / find filter
+Columns, categorical values and types come from the catalog (db/catalog.py), so
+a new dataset needs no grammar change. Every word of the question has to be
+explained by the grammar (a column, a value, a number, an operator, an intent or
+filler word); anything else ("gender", "country", "or", "not") lowers the
+confidence and the question goes to the LLM as before.
+
+compile_local(kind, question) returns the text the LLM would have produced
+(canonical SQL, or the Mongo JSON object), or None to fall back. How many
+questions were served locally, and the LLM time that saved, are reported under
+the "local_compiler" metrics source.
+
+  NL2DB_LOCAL_COMPILER        enable (default 1)
+  NL2DB_LOCAL_MIN_CONFIDENCE  share of the question's words the grammar must explain (default 1.0)
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlglot import exp
+
+from db.catalog import get_catalog
+from db.schema_index import fold, tokenize
+from db.tracing import annotate, metrics, span
+from agents.translation_cache import translation_cache
+
+ENABLED = os.getenv("NL2DB_LOCAL_COMPILER", "1") != "0"
+MIN_CONFIDENCE = float(os.getenv("NL2DB_LOCAL_MIN_CONFIDENCE", "1.0"))
+
+# ---------------------------
+# Vocabulary (word tuples -> grammar tokens)
+# ---------------------------
+_OPS = {
+    ("greater", "than"): ">", ("more", "than"): ">", ("higher", "than"): ">", ("larger", "than"): ">",
+    ("bigger", "than"): ">", ("over",): ">", ("above",): ">", ("exceeding",): ">",
+    ("at", "least"): ">=", ("no", "less", "than"): ">=",
+    ("less", "than"): "<", ("fewer", "than"): "<", ("lower", "than"): "<", ("smaller", "than"): "<",
+    ("under",): "<", ("below",): "<",
+    ("at", "most"): "<=", ("no", "more", "than"): "<=",
+    ("equal", "to"): "=", ("equals",): "=", ("exactly",): "=",
+}
+_AGGS = {
+    ("average",): "AVG", ("mean",): "AVG", ("avg",): "AVG",
+    ("sum",): "SUM", ("total",): "SUM",
+    ("count",): "COUNT", ("how", "many"): "COUNT", ("number", "of"): "COUNT", ("total", "number", "of"): "COUNT",
+    ("minimum",): "MIN", ("min",): "MIN", ("maximum",): "MAX", ("max",): "MAX",
+}
+_DIRS = {
+    ("top",): "DESC", ("highest",): "DESC", ("most",): "DESC", ("largest",): "DESC", ("biggest",): "DESC",
+    ("greatest",): "DESC", ("bottom",): "ASC", ("lowest",): "ASC", ("least",): "ASC", ("smallest",): "ASC",
+    ("fewest",): "ASC",
+}
+# Age is implied by these words when the table has an "age" column.
+_AGE = {
+    ("older", "than"): [("c", "age"), ("op", ">")],
+    ("younger", "than"): [("c", "age"), ("op", "<")],
+    ("aged",): [("c", "age")],
+    ("oldest",): [("sup", "age", "DESC")],
+    ("youngest",): [("sup", "age", "ASC")],
+}
+_GROUP = [("by",), ("per",), ("for", "each"), ("for", "every"), ("group", "by"), ("grouped", "by")]
+_LIST = {"show", "list", "find", "get", "display", "give", "return", "fetch", "retrieve", "select", "print"}
+_FILLER = {
+    "me", "all", "every", "the", "a", "an", "of", "with", "who", "whose", "that", "which", "what", "is",
+    "are", "was", "were", "there", "do", "does", "have", "has", "having", "in", "for", "where", "their",
+    "from", "whom", "please", "can", "you", "i", "want", "to", "see", "it", "its", "s", "years", "year", "old",
+}
+_ENTITIES = {"record", "row", "entry", "people", "person", "document", "one", "result"}
+
+_PHRASES: Dict[tuple, list] = {}
+_PHRASES.update({k: [("op", v)] for k, v in _OPS.items()})
+_PHRASES.update({k: [("agg", v)] for k, v in _AGGS.items()})
+_PHRASES.update({k: [("dir", v)] for k, v in _DIRS.items()})
+_PHRASES.update(_AGE)
+_PHRASES.update({k: [("by",)] for k in _GROUP})
+_PHRASES.update({("between",): [("between",)], ("and",): [("and",)], ("to",): [("to",)]})
+_PHRASES.update({(w,): [("list",)] for w in _LIST})
+_PHRASES.update({(w,): [] for w in _FILLER if (w,) not in _PHRASES})
+_VOCAB = {w for k in _PHRASES for w in k}
+_MAX_PHRASE = max(len(k) for k in _PHRASES)
+
+_LEX = re.compile(r"'([^']*)'|\"([^\"]*)\"|(\d+(?:\.\d+)?)(k\b)?|([A-Za-z]+)|(>=|<=|!=|[<>=])|(-)")
+_SYMBOLS = {">": ">", ">=": ">=", "<": "<", "<=": "<=", "=": "="}
+_NUMERIC = ("INT", "DOUBLE", "FLOAT", "DECIMAL", "NUMERIC", "REAL", "NUMBER")
+_MONGO_OPS = {">": "$gt", ">=": "$gte", "<": "$lt", "<=": "$lte"}
+
+def _lex(question: str) -> Tuple[list, bool]:
+    """(tokens, asks for a value): words, numbers ("70k" keeps its k), quoted strings, symbols."""
+    out = []
+    for m in _LEX.finditer((question or "").replace(",", "")):
+        text, number, k, word, sym = m.group(1) or m.group(2), m.group(3), m.group(4), m.group(5), m.group(6)
+        if text is not None:
+            out.append(("s", text))
+        elif number is not None:
+            out.append(("n", float(number) if "." in number else int(number), bool(k)))
+        elif word is not None:
+            w = word.lower()
+            out.append(("w", w if w in _VOCAB else fold(w)))
+        elif sym is not None:
+            out.append(("op", _SYMBOLS[sym]) if sym in _SYMBOLS else ("w", sym))
+        else:
+            out.append(("to",))
+    asks_value = bool(out) and out[0] == ("w", "what")
+    return out, asks_value
+
+def _is_numeric(col) -> bool:
+    return any(t in (col.type or "").upper() for t in _NUMERIC)
+
+def _run(tokens: list, i: int, limit: int) -> List[str]:
+    # Words starting at i (up to `limit` of them).
+    words = []
+    while i < len(tokens) and tokens[i][0] == "w" and len(words) < limit:
+        words.append(tokens[i][1])
+        i += 1
+    return words
+
+class _Query:
+    __slots__ = ("conds", "select", "agg", "agg_col", "agg_words", "by", "order", "limit")
+
+    def __init__(self):
+        self.conds: List[Tuple[int, str, Any]] = []   # (column idx, op, value)
+        self.select: List[int] = []
+        self.agg = self.agg_col = self.agg_words = self.by = self.order = self.limit = None
+
+class _Grammar:
+    """Column/value vocabulary of one table or collection, plus the parser."""
+
+    def __init__(self, table):
+        self.table = table
+        self.col_tokens = [tokenize(c.name) for c in table.columns]
+        self.sql_names = [exp.to_identifier(c.name).sql("duckdb") for c in table.columns]   # quoted once
+        self.sql_table = exp.to_identifier(table.name).sql("duckdb")
+        self.entities = set(tokenize(table.name)) | set(tokenize(table.description or "")) | _ENTITIES
+        self.age = next((i for i, t in enumerate(self.col_tokens) if t == ["age"]), None)
+        self.values: Dict[tuple, Optional[Tuple[int, Any]]] = {}
+        for ci, c in enumerate(table.columns):
+            for v in c.values or ():
+                key = tuple(tokenize(str(v)))
+                if isinstance(v, str) and key and not set(key) <= self.entities:
+                    self.values[key] = None if key in self.values else (ci, v)   # None: ambiguous
+
+    # --- matching ---
+    def _column_at(self, tokens: list, i: int) -> Tuple[Optional[tuple], int]:
+        # Longest run of words from one column name; a run of only intent/entity
+        # words must cover the whole name ("customer id", not "customers").
+        words = _run(tokens, i, 8)
+        best, best_len, full = [], 0, False
+        for ci, ctoks in enumerate(self.col_tokens):
+            cset = set(ctoks)
+            k = 0
+            while k < len(words) and words[k] in cset:
+                k += 1
+            run = words[:k]
+            if not k or not (set(run) == cset or any(w not in _VOCAB and w not in self.entities for w in run)):
+                continue
+            covers = set(run) == cset
+            if (k, covers) > (best_len, full):
+                best, best_len, full = [ci], k, covers
+            elif (k, covers) == (best_len, full):
+                best.append(ci)
+        if not best:
+            return None, 0
+        # The words as asked go along: they name aggregates the same way on every route.
+        return (("c", best[0], tuple(words[:best_len])) if len(best) == 1 else ("amb",)), best_len
+
+    def _value_at(self, tokens: list, i: int) -> Tuple[Optional[tuple], int]:
+        words = _run(tokens, i, 4)
+        for k in range(len(words), 0, -1):
+            hit = self.values.get(tuple(words[:k]), False)
+            if hit is not False:
+                return (("v", hit[0], hit[1]) if hit else ("amb",)), k
+        return None, 0
+
+    def _phrase_at(self, tokens: list, i: int) -> Tuple[Optional[list], int]:
+        words = _run(tokens, i, _MAX_PHRASE)
+        for k in range(len(words), 0, -1):
+            out = _PHRASES.get(tuple(words[:k]))
+            if out is not None:
+                if any(t[1:2] == ("age",) for t in out):
+                    if self.age is None:
+                        return [("w", w) for w in words[:k]], k
+                    out = [t[:1] + (self.age,) + t[2:] if t[1:2] == ("age",) else t for t in out]
+                return out, k
+        return None, 0
+
+    def tokens(self, lexed: list) -> Tuple[list, int]:
+        """(grammar tokens, entity words seen): columns, then values, then phrases; filler dropped."""
+        out, entity_hits, i = [], 0, 0
+        while i < len(lexed):
+            if lexed[i][0] != "w":
+                out.append(lexed[i])
+                i += 1
+                continue
+            for match in (self._column_at, self._value_at):
+                tok, k = match(lexed, i)
+                if tok is not None:
+                    out.append(tok)
+                    i += k
+                    break
+            else:
+                toks, k = self._phrase_at(lexed, i)
+                if toks is not None:
+                    out += toks
+                    i += k
+                    continue
+                word = lexed[i][1]
+                if word in self.entities:
+                    entity_hits += 1
+                else:
+                    out.append(("w", word))
+                i += 1
+        return out, entity_hits
+
+    # --- parsing ---
+    def _value(self, ci: int, tok: tuple, op: str):
+        col = self.table.columns[ci]
+        if tok[0] == "n":
+            if not _is_numeric(col):
+                return None
+            return tok[1] if not tok[2] or "k" in self.col_tokens[ci] else tok[1] * 1000
+        if tok[0] == "s" and op == "=" and not _is_numeric(col):
+            return tok[1]
+        return None
+
+    def _condition(self, toks: list, i: int) -> Tuple[list, int]:
+        # Conditions on the column at toks[i]: "<col> over 40", "<col> between 25 and 35",
+        # "<col> 25 to 35", "<col> 30". ([], i) when none applies.
+        ci, nxt = toks[i][1], toks[i + 1:i + 6]
+        kinds = [t[0] for t in nxt]
+        if kinds[:2] in (["op", "n"], ["op", "s"]):
+            v = self._value(ci, nxt[1], nxt[0][1])
+            return ([(ci, nxt[0][1], v)], i + 3) if v is not None else ([], i)
+        rng = None
+        if kinds[:4] in (["between", "n", "and", "n"], ["between", "n", "to", "n"]):
+            rng, end = (nxt[1], nxt[3]), i + 5
+        elif kinds[:3] in (["n", "to", "n"], ["n", "and", "n"]):
+            rng, end = (nxt[0], nxt[2]), i + 4
+        if rng:
+            lo, hi = self._value(ci, rng[0], ">="), self._value(ci, rng[1], "<=")
+            if lo is None or hi is None:
+                return [], i
+            lo, hi = min(lo, hi), max(lo, hi)   # "between 30 and 20" is the range 20..30
+            return [(ci, ">=", lo), (ci, "<=", hi)], end
+        if kinds[:1] in (["n"], ["s"]):
+            v = self._value(ci, nxt[0], "=")
+            return ([(ci, "=", v)], i + 2) if v is not None else ([], i)
+        return [], i
+
+    def parse(self, toks: list, asks_value: bool) -> Tuple[Optional[_Query], float]:
+        """(query, confidence); (None, 0.0) when the intents do not fit together."""
+        q, rest, i = _Query(), [], 0
+        while i < len(toks):
+            if toks[i][0] == "v":
+                q.conds.append((toks[i][1], "=", toks[i][2]))
+                i += 1
+                continue
+            if toks[i][0] == "c":
+                conds, end = self._condition(toks, i)
+                if conds:
+                    q.conds += conds
+                    i = end
+                    continue
+            rest.append(toks[i])
+            i += 1
+
+        direction = sort_col = None
+        subjects: List[int] = []
+        named = {t[1]: t[2] for t in rest if t[0] == "c" and len(t) > 2}   # column -> words asked
+        unknown, j = 0, 0
+        while j < len(rest):
+            t = rest[j]
+            nxt = rest[j + 1] if j + 1 < len(rest) else (None,)
+            if t[0] == "agg":
+                if q.agg:
+                    return None, 0.0
+                q.agg = t[1]
+                if nxt[0] == "c" and q.agg != "COUNT":
+                    q.agg_col = nxt[1]
+                    j += 1
+            elif t[0] == "by":
+                if nxt[0] != "c" or q.by is not None:
+                    return None, 0.0
+                q.by = nxt[1]
+                j += 1
+            elif t[0] in ("dir", "sup"):
+                if direction:
+                    return None, 0.0
+                direction = t[-1]
+                if t[0] == "sup":
+                    sort_col = t[1]
+                if nxt[0] == "n" and q.limit is None:
+                    q.limit = nxt
+                    j += 1
+                elif t[0] == "dir" and nxt[0] == "c":
+                    sort_col = nxt[1]
+                    j += 1
+            elif t[0] == "n" and q.limit is None and nxt[0] in ("dir", "sup"):
+                q.limit = t
+            elif t[0] == "c":
+                subjects.append(t[1])
+            elif t[0] not in ("list", "and", "to"):
+                unknown += 1
+            j += 1
+        if q.limit is not None:
+            if q.limit[2] or not isinstance(q.limit[1], int) or q.limit[1] < 1:
+                return None, 0.0
+            q.limit = q.limit[1]
+
+        columns = self.table.columns
+        if q.agg:
+            if direction:
+                return None, 0.0
+            if q.agg != "COUNT" and q.agg_col is None and len(subjects) == 1:
+                q.agg_col = subjects.pop()
+            if subjects or (q.agg != "COUNT" and (q.agg_col is None or not _is_numeric(columns[q.agg_col]))):
+                return None, 0.0
+            q.agg_words = named.get(q.agg_col)
+        elif direction:
+            if sort_col is None:
+                if q.by is not None:
+                    sort_col, q.by = q.by, None
+                elif len(subjects) == 1 and q.limit is None:
+                    sort_col = subjects[0]
+            if sort_col is None or q.by is not None or not _is_numeric(columns[sort_col]):
+                return None, 0.0
+            if q.limit is None and (asks_value or subjects == [sort_col]):
+                # "what is the highest spending score" / "age of the youngest customer"
+                q.agg, q.agg_col = ("MAX" if direction == "DESC" else "MIN"), sort_col
+                q.agg_words = named.get(sort_col)
+            else:
+                q.order, q.select = (sort_col, direction), subjects  # limit None: see _compile
+        else:
+            if q.by is not None:
+                return None, 0.0
+            q.select = subjects
+        if len(set(q.select)) != len(q.select):
+            return None, 0.0
+        return q, (1.0 - unknown / len(toks)) if toks else 0.0
+
+    # --- emitters ---
+    def _alias(self, q: _Query) -> str:
+        # From the question's words for the column when it names one, so the SQL
+        # and Mongo answers agree ("Annual Income (k$)" / "Annual_Income_kUSD").
+        if q.agg == "COUNT":
+            return "n"
+        return "_".join([q.agg.lower()] + list(q.agg_words or self.col_tokens[q.agg_col]))
+
+    def sql(self, q: _Query) -> str:
+        name = self.sql_names.__getitem__
+        where = []
+        for ci, op, v in q.conds:
+            lit = "'" + v.replace("'", "''") + "'" if isinstance(v, str) else repr(v)
+            where.append(f"{name(ci)} {op} {lit}")
+        if q.agg:
+            target = "COUNT(*)" if q.agg == "COUNT" else f"{q.agg}({name(q.agg_col)})"
+            select = f"{target} AS {self._alias(q)}"
+            if q.by is not None:
+                select = f"{name(q.by)}, {select}"
+        else:
+            select = ", ".join(name(ci) for ci in q.select) or "*"
+        text = f"SELECT {select} FROM {self.sql_table}"
+        if where:
+            text += " WHERE " + " AND ".join(where)
+        if q.by is not None:
+            text += f" GROUP BY {name(q.by)} ORDER BY {name(q.by)}"
+        if q.order:
+            text += f" ORDER BY {name(q.order[0])} {q.order[1]} LIMIT {q.limit}"
+        return text
+
+    def mongo(self, q: _Query) -> str:
+        field = lambda ci: self.table.columns[ci].name
+        flt: Dict[str, Any] = {}
+        for ci, op, v in q.conds:
+            if op == "=" and field(ci) not in flt:
+                flt[field(ci)] = v
+                continue
+            cur = flt.get(field(ci))
+            if not isinstance(cur, dict):
+                cur = flt[field(ci)] = {} if cur is None else {"$eq": cur}
+            cur["$eq" if op == "=" else _MONGO_OPS[op]] = v
+        stages = [{"$match": flt}] if flt else []
+        if q.agg:
+            alias = self._alias(q)
+            if q.agg == "COUNT" and q.by is None:
+                return json.dumps({"aggregate": stages + [{"$count": alias}]})
+            acc = {"$sum": 1} if q.agg == "COUNT" else {f"${q.agg.lower()}": f"${field(q.agg_col)}"}
+            stages.append({"$group": {"_id": f"${field(q.by)}" if q.by is not None else None, alias: acc}})
+            if q.by is not None:
+                stages.append({"$sort": {"_id": 1}})
+            return json.dumps({"aggregate": stages})
+        projection = {field(ci): 1 for ci in q.select}
+        if q.order:
+            stages += [{"$sort": {field(q.order[0]): -1 if q.order[1] == "DESC" else 1}}, {"$limit": q.limit}]
+            if projection:
+                stages.append({"$project": dict(projection, _id=0)})
+            return json.dumps({"aggregate": stages})
+        spec: Dict[str, Any] = {"filter": flt}
+        if projection:
+            spec["projection"] = dict(projection, _id=0)
+        return json.dumps(spec)
+
+# ---------------------------
+# Grammars per catalog version
+# ---------------------------
+_grammars: Dict[str, Tuple[list, List[_Grammar]]] = {}   # kind -> (tables, grammars)
+_lock = threading.Lock()
+_stats = {"compiled": 0, "fallbacks": 0, "compile_s": 0.0}
+
+def _grammars_for(kind: str) -> List[_Grammar]:
+    catalog = get_catalog()
+    tables = [catalog.collection()] if kind == "mongodb" else catalog.sql_tables()
+    with _lock:
+        cached = _grammars.get(kind)
+        if cached is None or len(cached[0]) != len(tables) or any(a is not b for a, b in zip(cached[0], tables)):
+            cached = _grammars[kind] = (tables, [_Grammar(t) for t in tables])
+        return cached[1]
+
+def _plural_words(nl_query: str) -> set:
+    # Folded forms of the question's plural words ("customers" -> "customer").
+    words = re.findall(r"[a-z]+", (nl_query or "").lower())
+    return {fold(w) for w in words if fold(w) != w} | ({"people"} & set(words))
+
+def _compile(kind: str, nl_query: str) -> Tuple[Optional[str], float]:
+    lexed, asks_value = _lex(nl_query)
+    candidates = []
+    for g in _grammars_for(kind):
+        toks, entity_hits = g.tokens(lexed)
+        q, confidence = g.parse(toks, asks_value)
+        if q is not None:
+            candidates.append((confidence, entity_hits, g, q))
+    if not candidates:
+        return None, 0.0
+    candidates.sort(key=lambda c: c[:2], reverse=True)
+    confidence, entity_hits, g, q = candidates[0]
+    if confidence < MIN_CONFIDENCE or (len(candidates) > 1 and candidates[1][:2] == (confidence, entity_hits)):
+        return None, confidence   # low confidence, or two tables fit equally well
+    if q.order is not None and q.limit is None:
+        # Top-1 only when one subject is named ("the oldest customer"); plural
+        # or no subject ("top customers by income") gives no count to use.
+        if not entity_hits or g.entities & _plural_words(nl_query):
+            return None, confidence
+        q.limit = 1
+    return (g.mongo(q) if kind == "mongodb" else g.sql(q)), confidence
+
+def compile_local(kind: str, nl_query: str) -> Optional[str]:
+    """
+    The query for `nl_query` ("sql" -> canonical SQL, "mongodb" -> JSON spec), or
+    None when the grammar is not confident and the LLM should translate it.
+    """
+    if not ENABLED:
+        return None
+    t0 = time.perf_counter()
+    with span("local_compile", kind=kind) as sp:
+        try:
+            text, confidence = _compile(kind, nl_query)
+        except Exception:
+            text, confidence = None, 0.0
+        sp["confidence"] = round(confidence, 2)
+    with _lock:
+        _stats["compiled" if text is not None else "fallbacks"] += 1
+        _stats["compile_s"] += time.perf_counter() - t0
+    annotate(local_compiler="hit" if text is not None else "fallback")
+    return text
+
+def local_stats() -> Dict[str, Any]:
+    """Share of questions compiled locally and the LLM time that saved (estimated)."""
+    with _lock:
+        out = dict(_stats)
+    seen = out["compiled"] + out["fallbacks"]
+    out["local_share"] = out["compiled"] / seen if seen else 0.0
+    out["compile_us_avg"] = out.pop("compile_s") / seen * 1e6 if seen else 0.0
+    llm = translation_cache.stats()
+    out["llm_ms_avg"] = llm["llm_ms"] / llm["llm_calls"] if llm["llm_calls"] else 0.0
+    out["saved_ms_est"] = out["compiled"] * out["llm_ms_avg"]
+    return out
+
+metrics.register_source("local_compiler", local_stats)
@@ -1,34 +1,37 @@
 # agents/mongodb_agent.py
-import os
 import json
-from typing import Dict, Any, Optional
-
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-
-# Runner funcs (PyMongo-backed; no init needed)
-from db.mongo_runner import run_mongo_query, run_mongo_aggregate
-
-# LLM setup
-load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
-llm = ChatGroq(
-    model="llama3-8b-8192",
-    api_key=api_key,
-    temperature=0,
-    model_kwargs={"top_p": 0},
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import pandas as pd
+
+# Runner funcs (SQL on the DuckDB mirror of the collection when the spec translates, else the Mongo backend)
+from db.mongo_runner import (
+    run_mongo_query,
+    run_mongo_aggregate,
+    run_mongo_query_page,
+    run_mongo_aggregate_page,
 )
-
-MONGO_SCHEMA_AND_RULES = """
-DATABASE: demo_db
-COLLECTION: customers
-DOCUMENT FIELDS (EXACT NAMES; exact casing):
-- CustomerID: string (e.g., "0001")
-- Genre: string ("Male" or "Female")
-- Age: integer
-- Annual_Income_kUSD: integer
-- Spending_Score: integer
-
+from db.catalog import get_catalog
+from db.cost_guard import truncation
+from db.executor import run_blocking
+from agents.local_compiler import compile_local
+from agents.registry import MODEL, get_llm
+from agents.translation_cache import translation_cache, schema_fingerprint
+from db.tracing import annotate, span
+
+# LLM setup (lazy, shared registry)
+llm = None
+
+def _get_llm():
+    global llm
+    if llm is None:
+        llm = get_llm(top_p=0)
+    return llm
+
+# Output format + policy; the document fields come from the catalog (db/catalog.py)
+MONGO_RULES = """
 OUTPUT FORMAT (choose exactly ONE):
 1) EXACTLY: INVALID QUERY
 2) Simple find:
@@ -40,50 +43,144 @@ DECISION POLICY (intent → output type):
 - If the user asks for a single number or grouped numbers (average/mean, count/how many, sum/total, min/youngest/lowest, max/oldest/highest, median, std dev) or says “by <field>”, return an aggregation pipeline with $match (optional) then $group (and optionally $project/$sort/$limit).
 - If the user asks for “top/most/bottom/least N”, return an aggregation pipeline with $sort then $limit.
 - If the user asks to list/show/find records that meet conditions, return a simple find.
-- Use ONLY the five allowed fields. Otherwise, EXACTLY: INVALID QUERY.
+- Use ONLY the fields listed above. Otherwise, EXACTLY: INVALID QUERY.
 - Valid ops only: $gt, $gte, $lt, $lte, $in, $and, $or, $regex, $match, $group, $project, $sort, $limit, $count, $avg, $min, $max, $sum.
-- Categorical values are case-sensitive ('Male', 'Female').
+- Categorical values are case-sensitive (use them exactly as listed above).
 - Final output MUST be ONLY the JSON object or EXACTLY: INVALID QUERY.
 """
 
-SYSTEM_PROMPT = f"""You are a MongoDB expert agent.
+def _system_prompt(nl_query: str) -> str:
+    # Wide collections list only the fields retrieved for the question.
+    return f"""You are a MongoDB expert agent.
 Follow the rules precisely.
 
-{MONGO_SCHEMA_AND_RULES}
+{get_catalog().schema_prompt("mongodb", nl_query=nl_query)}
+{MONGO_RULES}
 """
 
+def _schema_fp() -> str:
+    return schema_fingerprint(get_catalog().fingerprint("mongodb"), MONGO_RULES, MODEL)
+
+def _build_prompt(nl_query: str) -> str:
+    return f"{_system_prompt(nl_query)}\nUser request: {nl_query}\nFinal output (JSON or EXACTLY 'INVALID QUERY'):"
+
+# Common intents compile locally (agents/local_compiler.py); the rest go to the LLM.
 def _generate_mongo_json(nl_query: str) -> str:
-    prompt = f"{SYSTEM_PROMPT}\nUser request: {nl_query}\nFinal output (JSON or EXACTLY 'INVALID QUERY'):"
-    resp = llm.invoke(prompt)
-    return (resp.content or "").strip()
+    local = compile_local("mongodb", nl_query)
+    if local is not None:
+        return local
 
-def run_mongodb_agent(nl_query: str) -> Dict[str, Any]:
-    try:
-        out = _generate_mongo_json(nl_query)
+    def _call_llm() -> str:
+        resp = _get_llm().invoke(_build_prompt(nl_query))
+        return (resp.content or "").strip()
 
-        if out.upper() == "INVALID QUERY":
-            return {"success": False, "error": "error occurred", "data": None}
+    return translation_cache.get_or_generate("mongodb", nl_query, _schema_fp(), _call_llm)
 
-        obj = json.loads(out)  # let it raise on malformed; caught below
+async def _agenerate_mongo_json(nl_query: str) -> str:
+    local = compile_local("mongodb", nl_query)
+    if local is not None:
+        return local
 
-        # If aggregation provided, run it
-        if isinstance(obj, dict) and "aggregate" in obj:
-            pipeline = obj["aggregate"]
-            df = run_mongo_aggregate(pipeline)
-            return {"success": True, "error": None, "data": df}
+    async def _call_llm() -> str:
+        resp = await _get_llm().ainvoke(_build_prompt(nl_query))
+        return (resp.content or "").strip()
 
-        # Otherwise assume simple find
-        if isinstance(obj, dict) and "filter" in obj:
-            flt = obj.get("filter", {})
-            proj: Optional[dict] = obj.get("projection")
-            df = run_mongo_query(flt, projection=proj)
-            return {"success": True, "error": None, "data": df}
+    return await translation_cache.aget_or_generate("mongodb", nl_query, _schema_fp(), _call_llm)
 
+def _execute_mongo(out: str, page_size: Optional[int] = None) -> Dict[str, Any]:
+    if out.upper() == "INVALID QUERY":
+        annotate(invalid_query=True)
         return {"success": False, "error": "error occurred", "data": None}
 
+    obj = json.loads(out)  # let it raise on malformed; caught by the caller
+
+    if page_size and isinstance(obj, dict) and ("aggregate" in obj or "filter" in obj):
+        # First page only; fetch_page serves the rest
+        page = {"route": "MongoDB", "spec": obj, "offset": 0, "limit": page_size}
+        df, page["has_more"] = fetch_page(page, 0)
+        return {"success": True, "error": None, "data": df, "page": page}
+
+    # If aggregation provided, run it
+    if isinstance(obj, dict) and "aggregate" in obj:
+        pipeline = obj["aggregate"]
+        df = run_mongo_aggregate(pipeline)
+        return {"success": True, "error": None, "data": df, **truncation(df)}
+
+    # Otherwise assume simple find
+    if isinstance(obj, dict) and "filter" in obj:
+        flt = obj.get("filter", {})
+        proj: Optional[dict] = obj.get("projection")
+        df = run_mongo_query(flt, projection=proj)
+        return {"success": True, "error": None, "data": df, **truncation(df)}
+
+    return {"success": False, "error": "error occurred", "data": None}
+
+def fetch_page(page: Dict[str, Any], offset: int) -> Tuple[pd.DataFrame, bool]:
+    """
+    Server-side page of a paged find/aggregate; returns (DataFrame, has_more).
+    """
+    spec = page["spec"]
+    if "aggregate" in spec:
+        return run_mongo_aggregate_page(spec["aggregate"], limit=page["limit"], offset=offset)
+    return run_mongo_query_page(spec.get("filter", {}), spec.get("projection"), limit=page["limit"], offset=offset)
+
+def run_mongodb_agent(nl_query: str, page_size: Optional[int] = None) -> Dict[str, Any]:
+    try:
+        with span("agent", route="MongoDB"):
+            return _execute_mongo(_generate_mongo_json(nl_query), page_size)
     except Exception:
         return {"success": False, "error": "error occurred", "data": None}
 
+async def arun_mongodb_agent(nl_query: str, page_size: Optional[int] = None) -> Dict[str, Any]:
+    try:
+        with span("agent", route="MongoDB"):
+            out = await _agenerate_mongo_json(nl_query)
+            return await run_blocking(_execute_mongo, out, page_size)
+    except Exception:
+        return {"success": False, "error": "error occurred", "data": None}
+
+def _generate_mongo_json_batch(nl_queries: List[str], max_concurrency: int = 8) -> List[Union[str, Exception]]:
+    def _call_llm(missing: List[str]) -> List[Union[str, Exception]]:
+        resps = _get_llm().batch(
+            [_build_prompt(q) for q in missing],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        return [r if isinstance(r, Exception) else (r.content or "").strip() for r in resps]
+
+    out: List[Union[str, Exception, None]] = [compile_local("mongodb", q) for q in nl_queries]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        generated = translation_cache.batch_get_or_generate("mongodb", [nl_queries[i] for i in missing], _schema_fp(), _call_llm)
+        for i, value in zip(missing, generated):
+            out[i] = value
+    return out
+
+def run_mongodb_agent_batch(nl_queries: List[str], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+    """
+    Batch variant of run_mongodb_agent: grouped LLM translation, then the
+    find/aggregate calls fan out over a thread pool (PyMongo is thread-safe).
+    """
+    error = {"success": False, "error": "error occurred", "data": None, "exec_ms": 0.0}
+    try:
+        outs = _generate_mongo_json_batch(nl_queries, max_concurrency)
+    except Exception:
+        return [dict(error) for _ in nl_queries]
+
+    def _one(out):
+        if isinstance(out, Exception):
+            return dict(error)
+        t0 = time.perf_counter()
+        try:
+            res = _execute_mongo(out)
+        except Exception:
+            res = dict(error)
+        res["exec_ms"] = (time.perf_counter() - t0) * 1000
+        return res
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        return list(pool.map(_one, outs))
+
 if __name__ == "__main__":
     # Your test case:
     print(run_mongodb_agent("Find customers with country = India"))
\ No newline at end of file
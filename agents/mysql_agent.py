@@ -1,82 +1,30 @@
 # agents/mysql_agent.py
-import os
-from typing import Dict, Any
+# MySQL route: the shared SQL engine (agents/sql_engine.py), displayed as MySQL.
+# Translation and DuckDB execution are shared with the SQL and PostgreSQL routes.
+from typing import Dict, Any, List, Optional
 
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+from agents.sql_engine import _get_conn, _get_llm, fetch_page, run, arun, run_batch  # noqa: F401
 
-# DuckDB + sqlglot runner on your CSV
-from db.query_runner import init_db, run_query
+ROUTE = "MySQL"
 
-# --- 1) LLM setup ---
-load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
-
-llm = ChatGroq(
-    model="llama3-8b-8192",
-    api_key=api_key,
-    temperature=0
-)
-
-# --- 2) Prompt exactly matches your CSV-backed table ---
-# NOTE: table name is `mytable` (as registered in query_runner.init_db),
-# and column names are exactly as in mockdb_1.csv.
-MYSQL_SCHEMA_AND_RULES = """
-DATABASE: demo_db
-TABLE: mytable
-COLUMNS (EXACT NAMES; use backticks when they contain spaces/parentheses):
-- CustomerID
-- Genre
-- Age
-- `Annual Income (k$)`
-- `Spending Score (1-100)`
-
-HARD RULES:
-- Your output MUST be either:
-  1) A single valid MySQL SELECT statement that references ONLY `mytable` and ONLY the columns listed above; or
-  2) EXACTLY: INVALID QUERY
-- If the user's request mentions, implies, or requires ANY column/attribute not in the list above,
-  you MUST output EXACTLY: INVALID QUERY.
-- Do NOT guess or map to similar words (e.g., "Gender" is NOT "Genre").
-- When referencing columns containing spaces or parentheses, use backticks,
-  e.g., `Annual Income (k$)`, `Spending Score (1-100)`.
-- No comments, no explanations, no JSON — FINAL OUTPUT MUST BE ONLY the SQL or EXACTLY: INVALID QUERY.
-"""
-
-SYSTEM_PROMPT = f"""You are a MySQL expert agent.
-Follow the rules precisely.
-
-{MYSQL_SCHEMA_AND_RULES}
-"""
-# --- 3) Keep a single in-memory connection for speed ---
-_CONN = init_db("db/mockdb_1.csv")
-
-def _generate_mysql_sql(nl_query: str) -> str:
-    prompt = f"{SYSTEM_PROMPT}\nUser query: {nl_query}\nSQL:"
-    resp = llm.invoke(prompt)
-    return (resp.content or "").strip()
-
-def run_mysql_agent(nl_query: str) -> Dict[str, Any]:
+def run_mysql_agent(nl_query: str, page_size: Optional[int] = None) -> Dict[str, Any]:
     """
     Returns exactly:
       - success: bool
       - error: str | None   (generic 'error occurred' when anything goes wrong)
       - data: pandas.DataFrame | None
+    plus "sql" (the MySQL rendering) and "queries" (every dialect) on success.
+    With page_size, only the first page is returned; see fetch_page.
     """
-    try:
-        sql_text = _generate_mysql_sql(nl_query)
-
-        # If agent flags invalid, do NOT execute
-        if sql_text.upper() == "INVALID QUERY":
-            return {"success": False, "error": "Error Occurred", "data": None}
+    return run(nl_query, ROUTE, page_size)
 
-        # Execute MySQL-dialect SQL on the CSV via DuckDB (sqlglot handles translation)
-        df = run_query(_CONN, sql_text, dialect="mysql")
-        return {"success": True, "error": None, "data": df}
+async def arun_mysql_agent(nl_query: str, page_size: Optional[int] = None) -> Dict[str, Any]:
+    # Async twin of run_mysql_agent (same result shape).
+    return await arun(nl_query, ROUTE, page_size)
 
-    except Exception:
-        # Hide internals/translation details as requested
-        return {"success": False, "error": "error occurred", "data": None}
+def run_mysql_agent_batch(nl_queries: List[str], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+    # Same result shape as run_mysql_agent, plus exec_ms per item.
+    return run_batch(nl_queries, ROUTE, max_concurrency)
 
 # Quick manual test (optional)
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+# agents/registry.py
+"""
+Single shared registry for lazily-built pieces:
+- LLM clients (one ChatGroq per distinct config, built on first use), each
+  behind the shared gateway (agents/llm_gateway.py): coalescing, rate limits,
+  priorities and retries are coordinated across the supervisor and all agents
+- agent modules (imported only when their route is first requested)
+
+Importing this module is cheap: langchain_groq, DuckDB, PyMongo etc. are only
+imported once something actually needs them.
+"""
+import importlib
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from db.tracing import record_tokens
+
+MODEL = "llama3-8b-8192"
+GATEWAY_ENABLED = os.getenv("NL2DB_LLM_GATEWAY", "1") != "0"
+
+_lock = threading.RLock()
+_llms: Dict[Tuple, Any] = {}
+_llm_factory: Optional[Callable[..., Any]] = None
+
+def _token_usage_handler():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageHandler(BaseCallbackHandler):
+        # Inline so the handler sees the caller's trace context (also under ainvoke).
+        run_inline = True
+
+        def on_llm_end(self, response, **kwargs):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    return TokenUsageHandler()
+
+def _default_factory(**kwargs):
+    from dotenv import load_dotenv
+    from langchain_groq import ChatGroq
+
+    load_dotenv()
+    # Retries are the gateway's job (backoff shared by every caller), not the client's.
+    return ChatGroq(api_key=os.getenv("GROQ_API_KEY"), callbacks=[_token_usage_handler()], max_retries=0, **kwargs)
+
+def set_llm_factory(factory: Optional[Callable[..., Any]]) -> None:
+    """
+    Swap how LLM clients are built (e.g., an offline fake for benchmarks).
+    Pass None to restore ChatGroq. Already-built clients are dropped.
+    """
+    global _llm_factory
+    with _lock:
+        _llm_factory = factory
+        _llms.clear()
+
+def get_llm(top_p: Optional[float] = None, model: str = MODEL, temperature: float = 0):
+    """
+    Shared deterministic chat client for the given config (built once per process).
+    """
+    key = (model, temperature, top_p)
+    llm = _llms.get(key)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                kwargs: Dict[str, Any] = {"model": model, "temperature": temperature}
+                if top_p is not None:
+                    kwargs["model_kwargs"] = {"top_p": top_p}
+                llm = (_llm_factory or _default_factory)(**kwargs)
+                if GATEWAY_ENABLED:
+                    from agents.llm_gateway import GatedLLM
+
+                    llm = GatedLLM(llm)
+                _llms[key] = llm
+    return llm
+
+# route token -> (module, sync runner, async runner, batch runner, page fetcher)
+AGENTS = {
+    "SQL": ("agents.sql_agent", "run_sql_agent", "arun_sql_agent", "run_sql_agent_batch", "fetch_page"),
+    "MySQL": ("agents.mysql_agent", "run_mysql_agent", "arun_mysql_agent", "run_mysql_agent_batch", "fetch_page"),
+    "PostgreSQL": ("agents.postgresql_agent", "run_postgresql_agent", "arun_postgresql_agent", "run_postgresql_agent_batch", "fetch_page"),
+    "MongoDB": ("agents.mongodb_agent", "run_mongodb_agent", "arun_mongodb_agent", "run_mongodb_agent_batch", "fetch_page"),
+}
+_KINDS = {"sync": 1, "async": 2, "batch": 3, "page": 4}
+
+def get_agent(route: str, kind: str = "sync") -> Callable:
+    """
+    Return the runner for `route` ("SQL" | "MySQL" | "PostgreSQL" | "MongoDB"),
+    importing its module (and so its backend) on first use.
+    kind: "sync" | "async" | "batch" | "page"
+    """
+    spec = AGENTS[route]
+    module = importlib.import_module(spec[0])
+    return getattr(module, spec[_KINDS[kind]])
@@ -0,0 +1,201 @@
+# agents/sql_engine.py
+"""
+One SQL engine behind the SQL, MySQL and PostgreSQL routes.
+
+A question is translated ONCE (one LLM call, or a translation-cache hit shared by
+all three routes) into canonical SQL, executed ONCE on the shared DuckDB
+connection, and returned with every dialect rendering (sqlglot, from the same
+parsed tree):
+
+    result["sql"]      the rendering for the requested route
+    result["queries"]  {"SQL": ..., "MySQL": ..., "PostgreSQL": ...}
+    result["truncated"], result["row_limit"]  only when the cost guard's
+                       automatic LIMIT cut a listing (db/cost_guard.py)
+
+So switching the dropdown between SQL dialects never needs another LLM
+round-trip; the route modules (sql_agent, mysql_agent, postgresql_agent) only
+bind a route name.
+"""
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from db.catalog import get_catalog
+from db.cost_guard import truncation
+from db.query_runner import run_query, run_queries_parallel, run_query_page
+from db.executor import run_blocking
+from db.sql_ast import parse_sql
+from agents.local_compiler import compile_local
+from agents.registry import MODEL, get_llm
+from agents.translation_cache import translation_cache, schema_fingerprint
+from db.tracing import annotate, span
+
+# route -> sqlglot dialect shown for it ("" = sqlglot's generic SQL)
+DISPLAY_DIALECTS = {"SQL": "", "MySQL": "mysql", "PostgreSQL": "postgres"}
+
+# ---- LLM setup (deterministic; no warnings about top_p) ----
+# Built on first use from the shared registry (agents/registry.py), not at import.
+llm = None
+
+def _get_llm():
+    global llm
+    if llm is None:
+        llm = get_llm(top_p=0)
+    return llm
+
+# ---- Strict refusal rules (no examples); the schema block comes from the catalog ----
+SQL_RULES = """
+HARD RULES:
+- Your output MUST be either:
+  1) A single valid standard SQL SELECT statement that references ONLY the tables and columns listed above; or
+  2) EXACTLY: INVALID QUERY
+- If the user's request mentions, implies, or requires ANY column/attribute not in the list above,
+  you MUST output EXACTLY: INVALID QUERY.
+- Do NOT guess or map to similar words (e.g., "Gender" is NOT "Genre").
+- When referencing columns containing spaces or parentheses, use double quotes exactly as listed above.
+- No comments, no explanations, no JSON—FINAL OUTPUT MUST BE ONLY the SQL or EXACTLY: INVALID QUERY.
+"""
+
+def _system_prompt(nl_query: str) -> str:
+    # Only the tables/columns retrieved for the question go into the prompt (db/catalog.py).
+    return f"""You are an SQL expert agent.
+Follow the rules precisely.
+
+{get_catalog().schema_prompt("sql", nl_query=nl_query)}
+{SQL_RULES}
+"""
+
+def _schema_fp() -> str:
+    # Cache key component: any catalog/rules/model change invalidates cached translations.
+    return schema_fingerprint(get_catalog().fingerprint("sql"), SQL_RULES, MODEL)
+
+# ---- Shared DuckDB connection with every catalog table ----
+def _get_conn():
+    return get_catalog().connection()
+
+def _build_prompt(nl_query: str) -> str:
+    # Minimal, strict prompting. Assistant must return ONLY SQL or INVALID QUERY.
+    return f"{_system_prompt(nl_query)}\nUser request: {nl_query}\nFinal output (SQL or EXACTLY 'INVALID QUERY'):"
+
+# ---- Translation (one canonical query per question, whatever the route) ----
+# Common intents compile locally (agents/local_compiler.py); the rest go to the LLM.
+def _generate_sql(nl_query: str) -> str:
+    local = compile_local("sql", nl_query)
+    if local is not None:
+        return local
+
+    def _call_llm() -> str:
+        resp = _get_llm().invoke(_build_prompt(nl_query))
+        return (resp.content or "").strip()
+
+    # Repeated questions skip the LLM entirely, on any of the three routes.
+    return translation_cache.get_or_generate("sql", nl_query, _schema_fp(), _call_llm)
+
+async def _agenerate_sql(nl_query: str) -> str:
+    local = compile_local("sql", nl_query)
+    if local is not None:
+        return local
+
+    async def _call_llm() -> str:
+        resp = await _get_llm().ainvoke(_build_prompt(nl_query))
+        return (resp.content or "").strip()
+
+    return await translation_cache.aget_or_generate("sql", nl_query, _schema_fp(), _call_llm)
+
+def _generate_sql_batch(nl_queries: List[str], max_concurrency: int = 8) -> List[Union[str, Exception]]:
+    def _call_llm(missing: List[str]) -> List[Union[str, Exception]]:
+        resps = _get_llm().batch(
+            [_build_prompt(q) for q in missing],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        return [r if isinstance(r, Exception) else (r.content or "").strip() for r in resps]
+
+    out: List[Union[str, Exception, None]] = [compile_local("sql", q) for q in nl_queries]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        generated = translation_cache.batch_get_or_generate("sql", [nl_queries[i] for i in missing], _schema_fp(), _call_llm)
+        for i, value in zip(missing, generated):
+            out[i] = value
+    return out
+
+def renderings(sql_text: str) -> Dict[str, str]:
+    """{route: sql_text rendered in that route's dialect}, from one parse."""
+    parsed = parse_sql(sql_text, "duckdb")
+    return {route: parsed.render(dialect) for route, dialect in DISPLAY_DIALECTS.items()}
+
+# ---- Execution (always DuckDB; canonical SQL is read as duckdb dialect) ----
+def _execute_sql(sql_text: str, route: str, page_size: Optional[int] = None) -> Dict[str, Any]:
+    # Model-driven refusal—no extra validation code
+    if sql_text.upper() == "INVALID QUERY":
+        annotate(invalid_query=True)
+        return {"success": False, "error": "error occurred", "data": None}
+
+    queries = renderings(sql_text)
+    out = {"success": True, "error": None, "sql": queries[route], "queries": queries}
+    if page_size:
+        # First page only; the rest is fetched on demand via fetch_page
+        df, has_more = run_query_page(_get_conn(), sql_text, dialect="duckdb", limit=page_size)
+        out.update(data=df, page={"route": route, "query": sql_text, "offset": 0, "limit": page_size, "has_more": has_more})
+        return out
+
+    out["data"] = run_query(_get_conn(), sql_text, dialect="duckdb")
+    out.update(truncation(out["data"]))
+    return out
+
+def run(nl_query: str, route: str = "SQL", page_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Returns exactly:
+      - success: bool
+      - error: str | None         (generic 'error occurred' only)
+      - data: pandas.DataFrame | None
+    plus, on success, "sql" (the route's rendering) and "queries" (all of them).
+    With page_size, data is only the first page and "page" describes how to
+    fetch the rest (fetch_page).
+    """
+    try:
+        with span("agent", route=route):
+            return _execute_sql(_generate_sql(nl_query), route, page_size)
+    except Exception:
+        # Keep it generic; no white-boxing
+        return {"success": False, "error": "error occurred", "data": None}
+
+async def arun(nl_query: str, route: str = "SQL", page_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Async twin of run: awaits the LLM, runs DuckDB on the shared executor.
+    """
+    try:
+        with span("agent", route=route):
+            sql_text = await _agenerate_sql(nl_query)
+            return await run_blocking(_execute_sql, sql_text, route, page_size)
+    except Exception:
+        return {"success": False, "error": "error occurred", "data": None}
+
+def run_batch(nl_queries: List[str], route: str = "SQL", max_concurrency: int = 8) -> List[Dict[str, Any]]:
+    """
+    Batch variant of run: one grouped LLM call for all uncached questions,
+    then parallel DuckDB cursors. Each result also carries exec_ms.
+    """
+    error = {"success": False, "error": "error occurred", "data": None, "exec_ms": 0.0}
+    try:
+        sql_texts = _generate_sql_batch(nl_queries, max_concurrency)
+    except Exception:
+        return [dict(error) for _ in nl_queries]
+
+    results: List[Dict[str, Any]] = [dict(error) for _ in nl_queries]
+    todo = [i for i, t in enumerate(sql_texts) if isinstance(t, str) and t.upper() != "INVALID QUERY"]
+    ran = run_queries_parallel(_get_conn(), [sql_texts[i] for i in todo], dialect="duckdb", max_workers=max_concurrency)
+    for i, (df, elapsed) in zip(todo, ran):
+        if not isinstance(df, Exception):
+            queries = renderings(sql_texts[i])
+            results[i] = {
+                "success": True, "error": None, "data": df, "exec_ms": elapsed * 1000,
+                "sql": queries[route], "queries": queries, **truncation(df),
+            }
+    return results
+
+def fetch_page(page: Dict[str, Any], offset: int) -> Tuple[pd.DataFrame, bool]:
+    """
+    Rows [offset, offset + limit) of a paged result; returns (DataFrame, has_more).
+    """
+    return run_query_page(_get_conn(), page["query"], dialect="duckdb", limit=page["limit"], offset=offset)
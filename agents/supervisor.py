@@ -1,22 +1,27 @@
 # agents/supervisor.py
 from __future__ import annotations
-from typing import TypedDict, Optional, Literal
+from typing import TypedDict, Optional, Literal, Dict, List
+import asyncio
 import os
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+import time
 from langgraph.graph import StateGraph, END
 
-from agents.sql_agent import run_sql_agent
-from agents.mysql_agent import run_mysql_agent
-from agents.postgresql_agent import run_postgresql_agent
-from agents.mongodb_agent import run_mongodb_agent
+# Agents (and their DuckDB/Mongo backends) are imported on first use via the registry,
+# so a cold start only pays for the backend actually requested.
+from agents.registry import get_agent, get_llm
+from agents.translation_cache import normalize_nl
+from db.tracing import span, trace
 
 # ---------------------------
-# Model (deterministic)
+# Model (deterministic; built lazily)
 # ---------------------------
-load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
-llm = ChatGroq(model="llama3-8b-8192", api_key=api_key, temperature=0, model_kwargs={"top_p": 0})
+llm = None
+
+def _get_llm():
+    global llm
+    if llm is None:
+        llm = get_llm(top_p=0)
+    return llm
 
 # ---------------------------
 # State
@@ -30,8 +35,10 @@ class S(TypedDict, total=False):
     nl_query: str                   # raw natural-language question only
     # Supervisor routing decision:
     route: Route
+    routed_by: Literal["local", "llm"]   # which path produced `route`
     # Agent result:
     result: dict
+    page_size: Optional[int]        # when set, agents return only the first page
     language: Optional[str]
 
 # ---------------------------
@@ -59,50 +66,115 @@ IMPORTANT:
 def supervisor_decider(state: S) -> S:
     text = state.get("user_input", "")
     prompt = f"{SUPERVISOR_PROMPT}\n\nINPUT:\n{text}\n\nROUTE:"
-    out = (llm.invoke(prompt).content or "").strip()
+    with span("supervisor_llm"):
+        out = (_get_llm().invoke(prompt).content or "").strip()
     state["route"] = out  # trust the LLM
+    state["routed_by"] = "llm"
     return state
 
+async def asupervisor_decider(state: S) -> S:
+    text = state.get("user_input", "")
+    prompt = f"{SUPERVISOR_PROMPT}\n\nINPUT:\n{text}\n\nROUTE:"
+    with span("supervisor_llm"):
+        out = ((await _get_llm().ainvoke(prompt)).content or "").strip()
+    state["route"] = out
+    state["routed_by"] = "llm"
+    return state
+
+# ---------------------------
+# Local fast path (no LLM when the label is known)
+# ---------------------------
+# Normalized dropdown labels / common aliases -> route token.
+LANGUAGE_ALIASES = {
+    "sql": "SQL",
+    "standard sql": "SQL",
+    "ansi sql": "SQL",
+    "mysql": "MySQL",
+    "postgresql": "PostgreSQL",
+    "postgres": "PostgreSQL",
+    "pg": "PostgreSQL",
+    "psql": "PostgreSQL",
+    "mongodb": "MongoDB",
+    "mongo": "MongoDB",
+}
+
+def resolve_language(language: Optional[str]) -> Optional[str]:
+    """
+    Map a language label to a route token without calling the LLM.
+    Returns None when the label is free-form/ambiguous (supervisor decides then).
+    """
+    key = " ".join((language or "").lower().split())
+    return LANGUAGE_ALIASES.get(key)
+
 # ---------------------------
 # Agent nodes (use nl_query only)
 # ---------------------------
 def node_sql(state: S) -> S:
-    return {"result": run_sql_agent(state["nl_query"]), "language": "SQL"}
+    return {"result": get_agent("SQL")(state["nl_query"], state.get("page_size")), "language": "SQL"}
 
 def node_mysql(state: S) -> S:
-    return {"result": run_mysql_agent(state["nl_query"]), "language": "MySQL"}
+    return {"result": get_agent("MySQL")(state["nl_query"], state.get("page_size")), "language": "MySQL"}
 
 def node_postgres(state: S) -> S:
-    return {"result": run_postgresql_agent(state["nl_query"]), "language": "PostgreSQL"}
+    return {"result": get_agent("PostgreSQL")(state["nl_query"], state.get("page_size")), "language": "PostgreSQL"}
 
 def node_mongo(state: S) -> S:
-    return {"result": run_mongodb_agent(state["nl_query"]), "language": "MongoDB"}
+    return {"result": get_agent("MongoDB")(state["nl_query"], state.get("page_size")), "language": "MongoDB"}
+
+# Async twins (used by the graph behind arun_supervisor)
+async def anode_sql(state: S) -> S:
+    return {"result": await get_agent("SQL", "async")(state["nl_query"], state.get("page_size")), "language": "SQL"}
+
+async def anode_mysql(state: S) -> S:
+    return {"result": await get_agent("MySQL", "async")(state["nl_query"], state.get("page_size")), "language": "MySQL"}
+
+async def anode_postgres(state: S) -> S:
+    return {"result": await get_agent("PostgreSQL", "async")(state["nl_query"], state.get("page_size")), "language": "PostgreSQL"}
+
+async def anode_mongo(state: S) -> S:
+    return {"result": await get_agent("MongoDB", "async")(state["nl_query"], state.get("page_size")), "language": "MongoDB"}
 
 # ---------------------------
 # Router (conditional edges only)
 # ---------------------------
+ROUTE_NODES = {
+    "SQL": "sql",
+    "MySQL": "mysql",
+    "PostgreSQL": "postgres",
+    "MongoDB": "mongo",
+}
+
 def route_from_super(state: S) -> str:
     token = (state.get("route") or "").strip()
-    return {
-        "SQL": "sql",
-        "MySQL": "mysql",
-        "PostgreSQL": "postgres",
-        "MongoDB": "mongo",
-        "REJECT": END,
-    }.get(token, END)
+    return ROUTE_NODES.get(token, END)
+
+def route_from_start(state: S) -> str:
+    # Pre-resolved route (local fast path) skips the supervisor node entirely.
+    if state.get("routed_by") == "local" and state.get("route") in ROUTE_NODES:
+        return ROUTE_NODES[state["route"]]
+    return "supervisor"
 
 # ---------------------------
 # Build graph
 # ---------------------------
-def build_graph():
+def build_graph(use_async: bool = False):
+    """
+    use_async=True wires the async node functions (for ainvoke); same topology.
+    """
     g = StateGraph(S)
-    g.add_node("supervisor", supervisor_decider)
-    g.add_node("sql", node_sql)
-    g.add_node("mysql", node_mysql)
-    g.add_node("postgres", node_postgres)
-    g.add_node("mongo", node_mongo)
+    g.add_node("supervisor", asupervisor_decider if use_async else supervisor_decider)
+    g.add_node("sql", anode_sql if use_async else node_sql)
+    g.add_node("mysql", anode_mysql if use_async else node_mysql)
+    g.add_node("postgres", anode_postgres if use_async else node_postgres)
+    g.add_node("mongo", anode_mongo if use_async else node_mongo)
 
-    g.set_entry_point("supervisor")
+    g.set_conditional_entry_point(route_from_start, {
+        "supervisor": "supervisor",
+        "sql": "sql",
+        "mysql": "mysql",
+        "postgres": "postgres",
+        "mongo": "mongo",
+    })
     g.add_conditional_edges("supervisor", route_from_super, {
         "sql": "sql",
         "mysql": "mysql",
@@ -118,30 +190,173 @@ def build_graph():
     return g.compile()  # stateless; no checkpointer requirement
 
 app = build_graph()
+aapp = build_graph(use_async=True)
+
+# Per-request wall-clock budget for arun_supervisor (seconds; NL2DB_REQUEST_TIMEOUT).
+REQUEST_TIMEOUT = float(os.getenv("NL2DB_REQUEST_TIMEOUT", "60"))
 
 # ---------------------------
 # Public helper
 # ---------------------------
-def run_supervisor(query: str, language: str) -> dict:
+def run_supervisor(query: str, language: str, routing: str = "auto", page_size: Optional[int] = None) -> dict:
     """
     UI should call this with the raw NL query and the dropdown language.
+    routing:
+      - "auto": a known language label is routed locally (no supervisor LLM call);
+                anything else falls back to the supervisor model.
+      - "llm":  always ask the supervisor model.
     We hand the combined string ONLY to the supervisor model.
     Agents receive the raw NL query via state (no parsing).
+    The result records the path taken under "routed_by" ("local" | "llm").
+    page_size: return only the first page_size rows plus a "page" descriptor;
+    fetch the rest with fetch_page(result).
+    Per-stage timings, cache status and token counts come back under "trace".
     """
+    with trace("run_supervisor", language=language, routing=routing) as t:
+        final = app.invoke(_initial_state(query, language, routing, page_size))
+        out = _final_result(final)
+        _close_trace(t, out)
+    out["trace"] = t.to_dict()
+    return out
+
+async def arun_supervisor(
+    query: str,
+    language: str,
+    routing: str = "auto",
+    timeout: Optional[float] = None,
+    page_size: Optional[int] = None,
+) -> dict:
+    """
+    Async twin of run_supervisor: LLM calls use ainvoke, DuckDB/PyMongo work runs on
+    the bounded backend executor, so one process can keep many requests in flight.
+    timeout: per-request budget in seconds (default REQUEST_TIMEOUT; <= 0 disables).
+    """
+    state = _initial_state(query, language, routing, page_size)
+    budget = REQUEST_TIMEOUT if timeout is None else timeout
+    with trace("arun_supervisor", language=language, routing=routing) as t:
+        try:
+            if budget and budget > 0:
+                final = await asyncio.wait_for(aapp.ainvoke(state), timeout=budget)
+            else:
+                final = await aapp.ainvoke(state)
+            out = _final_result(final)
+        except asyncio.TimeoutError:
+            t.set(error_stage="timeout", error_type="TimeoutError")
+            out = {
+                "success": False,
+                "error": "error occurred (request timed out)",
+                "data": None,
+                "language": state.get("route"),
+                "routed_by": state.get("routed_by"),
+            }
+        _close_trace(t, out)
+    out["trace"] = t.to_dict()
+    return out
+
+def _close_trace(t, out: dict) -> None:
+    t.set(route=out.get("language"), routed_by=out.get("routed_by"), success=bool(out.get("success")))
+    df = out.get("data")
+    if df is not None and hasattr(df, "__len__"):
+        t.set(rows=len(df))
+
+def _initial_state(query: str, language: str, routing: str, page_size: Optional[int] = None) -> S:
+    if routing not in ("auto", "llm"):
+        raise ValueError(f"Unknown routing mode: {routing!r}")
+
     combined = f"Query: {query} | Language: {language}"
-    final = app.invoke({"user_input": combined, "nl_query": query})
+    state: S = {"user_input": combined, "nl_query": query}
+    if page_size:
+        state["page_size"] = page_size
+    route = resolve_language(language) if routing == "auto" else None
+    if route is not None:
+        state["route"] = route
+        state["routed_by"] = "local"
+    return state
 
-    # If routing failed:
-    if final.get("route") in (None, "REJECT"):
+def _final_result(final: S) -> dict:
+    # If routing failed (REJECT or an unusable token):
+    if final.get("route") not in ROUTE_NODES:
         return {
             "success": False,
             "error": "Error, please enter one of the following languages: SQL, MySQL, PostgreSQL, MongoDB",
             "data": None,
             "language": None,
+            "routed_by": final.get("routed_by"),
         }
 
     out = final.get("result", {}) or {}
     out["language"] = final.get("language", final.get("route"))
+    out["routed_by"] = final.get("routed_by")
+    return out
+
+def fetch_page(result: dict, offset: Optional[int] = None):
+    """
+    Fetch the next page (or the page at `offset`) of a paged result from
+    run_supervisor(..., page_size=N). Returns (DataFrame, updated page descriptor).
+    """
+    page = result["page"]
+    if offset is None:
+        offset = page["offset"] + page["limit"]
+    df, has_more = get_agent(page["route"], "page")(page, offset)
+    return df, {**page, "offset": offset, "has_more": has_more}
+
+# ---------------------------
+# Batch helper (report packs)
+# ---------------------------
+def run_supervisor_batch(queries: List[str], language: str, max_concurrency: int = 8) -> List[dict]:
+    """
+    Translate and execute many questions for ONE language in a single call.
+    - routing is decided once for the whole batch (locally when the label is known)
+    - identical questions (after NL normalization) are translated/executed once
+    - uncached translations go through one llm.batch call (max_concurrency in flight)
+    - SQL runs on parallel DuckDB cursors
+    Returns one run_supervisor-style dict per input, in order, plus:
+    query, deduped (repeat of an earlier item), exec_ms, batch_ms (whole call).
+    """
+    if not queries:
+        return []
+    with trace("run_supervisor_batch", language=language, items=len(queries)) as t:
+        out = _run_batch(queries, language, max_concurrency)
+        t.set(route=out[0].get("language"), success=any(o.get("success") for o in out))
+    return out
+
+def _run_batch(queries: List[str], language: str, max_concurrency: int) -> List[dict]:
+    t0 = time.perf_counter()
+
+    route, routed_by = resolve_language(language), "local"
+    if route is None:
+        decided = supervisor_decider({"user_input": f"Query: {queries[0]} | Language: {language}"})
+        route, routed_by = decided.get("route"), "llm"
+    if route not in ROUTE_NODES:
+        return [{
+            "success": False,
+            "error": "Error, please enter one of the following languages: SQL, MySQL, PostgreSQL, MongoDB",
+            "data": None,
+            "language": None,
+            "routed_by": routed_by,
+            "query": q,
+        } for q in queries]
+
+    # Deduped on the translation-cache key: only questions that would share a
+    # cached translation share a result (quoted values keep their case).
+    keys = [normalize_nl(q) for q in queries]
+    slot: Dict[str, int] = {}
+    unique: List[str] = []
+    for q, key in zip(queries, keys):
+        if key not in slot:
+            slot[key] = len(unique)
+            unique.append(q)
+
+    results = get_agent(route, "batch")(unique, max_concurrency=max_concurrency)
+    batch_ms = (time.perf_counter() - t0) * 1000
+
+    out, seen = [], set()
+    for q, key in zip(queries, keys):
+        idx = slot[key]
+        item = dict(results[idx])
+        item.update(query=q, language=route, routed_by=routed_by, deduped=idx in seen, batch_ms=batch_ms)
+        seen.add(idx)
+        out.append(item)
     return out
 
 # ---------------------------
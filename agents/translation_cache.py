@@ -0,0 +1,391 @@
+# agents/translation_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple, Union
+
+from db.tracing import annotate, metrics, span
+
+# ---------------------------
+# Key helpers
+# ---------------------------
+# A quoted value: 'Male' or "Male", not the apostrophe of "what's" / "customers'".
+_QUOTED_RE = re.compile(r"(?<!\w)'[^']*'(?!\w)|\"[^\"]*\"")
+
+def normalize_nl(nl_query: str) -> str:
+    """
+    Normalize an NL question for cache lookups: lowercase, collapse whitespace,
+    drop trailing punctuation. "Average income of male customers?" and
+    "average  income of male customers" share one entry. Quoted values are kept
+    as written: Genre = 'Male' and Genre = 'male' are different questions to
+    DuckDB's case-sensitive comparisons.
+    """
+    text, parts, pos = nl_query or "", [], 0
+    for m in _QUOTED_RE.finditer(text):
+        parts += [re.sub(r"\s+", " ", text[pos:m.start()].lower()), m.group()]
+        pos = m.end()
+    parts.append(re.sub(r"\s+", " ", text[pos:].lower()))
+    return "".join(parts).strip().rstrip(" .?!;")
+
+def schema_fingerprint(*parts: str) -> str:
+    """
+    Short stable hash of everything that shapes the translation (system prompt,
+    model name, ...). Changing the schema/rules text invalidates old entries.
+    """
+    h = hashlib.sha256()
+    for p in parts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+def _make_key(dialect: str, nl_query: str, schema_fp: str) -> str:
+    return f"{dialect}|{schema_fp}|{normalize_nl(nl_query)}"
+
+# ---------------------------
+# Template-granular entries
+# ---------------------------
+# "customers older than 40" and "customers older than 45" share the template
+# "customers older than <0>". When every number / quoted string of the question
+# matches exactly one literal of the translation, the translation is also stored
+# under the template key; a later question with other values is answered by
+# swapping the literals (no LLM call). A numeric literal that does not come from
+# the question ("in their 40s" -> BETWEEN 40 AND 49) disables this, as does a
+# string literal the template text does not contain ("over 40" -> '40+'), so
+# derived values are never reused stale.
+#   NL2DB_TRANSLATION_TEMPLATES  enable template reuse (default 1)
+TEMPLATES_ENABLED = os.getenv("NL2DB_TRANSLATION_TEMPLATES", "1") != "0"
+
+_NL_VALUE_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"|(?<![\w.])(\d+(?:\.\d+)?)")
+_SQL_DIALECTS = {"sql": "duckdb", "mysql": "mysql", "postgres": "postgres"}
+_MONGO_CMP = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$limit", "$skip"}
+
+def _number(text: str):
+    return float(text) if "." in text else int(text)
+
+def _is_scalar(v) -> bool:
+    return isinstance(v, (str, int, float)) and not isinstance(v, bool)
+
+def _same(a, b) -> bool:
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    return float(a) == float(b)
+
+def nl_template(nl_query: str) -> Optional[Tuple[str, list]]:
+    """
+    ("customers older than <0>", [40]) for "customers older than 40"; None when
+    the question has no values or repeats one (ambiguous mapping).
+    """
+    values: list = []
+
+    def slot(m):
+        if m.group(3) is not None:
+            values.append(_number(m.group(3)))
+        else:
+            values.append(m.group(1) if m.group(1) is not None else m.group(2))
+        return f"<{len(values) - 1}>"
+
+    text = _NL_VALUE_RE.sub(slot, nl_query or "")
+    if not values:
+        return None
+    if any(_same(a, b) for i, a in enumerate(values) for b in values[i + 1:]):
+        return None
+    return text, values
+
+def _mongo_params(obj, path=(), in_filter=False) -> list:
+    # (path, value) of filter values, comparison operands and $limit/$skip.
+    out = []
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            p = path + (k,)
+            if (k in _MONGO_CMP or (in_filter and not k.startswith("$"))) and _is_scalar(v):
+                out.append((p, v))
+            elif k in ("$in", "$nin") and isinstance(v, list):
+                out += [(p + (i,), x) for i, x in enumerate(v) if _is_scalar(x)]
+            else:
+                out += _mongo_params(v, p, in_filter or k in ("filter", "$match"))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            out += _mongo_params(v, path + (i,), in_filter)
+    return out
+
+def _params(dialect: str, value: str) -> Optional[list]:
+    if dialect in _SQL_DIALECTS:
+        from db.sql_ast import parse_sql  # sqlglot only when a SQL route is used
+
+        return list(parse_sql(value, _SQL_DIALECTS[dialect]).params)
+    if dialect == "mongodb":
+        return [v for _, v in _mongo_params(json.loads(value))]
+    return None
+
+def _mentions(text: str, s: str) -> bool:
+    return re.search(r"(?<!\w)" + re.escape(s.lower()) + r"(?!\w)", text.lower()) is not None
+
+def make_template(dialect: str, value: str, nl_values: list, text: str) -> Optional[str]:
+    """
+    JSON spec mapping the translation's literals to question slots, or None
+    when they do not line up one-to-one. `text` is the question's template
+    (nl_template): the other string literals must be words of it.
+    """
+    try:
+        params = _params(dialect, value)
+    except Exception:
+        return None
+    if not params:
+        return None
+    slots = []
+    for i, v in enumerate(nl_values):
+        matches = [j for j, p in enumerate(params) if _same(p, v)]
+        if len(matches) != 1:
+            return None
+        slots.append([matches[0], i])
+    used = {j for j, _ in slots}
+    if any(j not in used and not (isinstance(p, str) and _mentions(text, p)) for j, p in enumerate(params)):
+        return None
+    return json.dumps({"value": value, "slots": slots})
+
+def fill_template(dialect: str, spec: dict, nl_values: list) -> str:
+    """The stored translation with its slot literals replaced by `nl_values`."""
+    values = {j: nl_values[i] for j, i in spec["slots"]}
+    if dialect in _SQL_DIALECTS:
+        from db.sql_ast import parse_sql, render_sql
+
+        return render_sql(parse_sql(spec["value"], _SQL_DIALECTS[dialect]), values)
+    obj = json.loads(spec["value"])
+    for j, (path, _) in enumerate(_mongo_params(obj)):
+        if j in values:
+            target = obj
+            for step in path[:-1]:
+                target = target[step]
+            target[path[-1]] = values[j]
+    return json.dumps(obj)
+
+# ---------------------------
+# Cache (in-process LRU + optional SQLite tier)
+# ---------------------------
+class TranslationCache:
+    """
+    Shared NL -> query translation cache keyed on (dialect, normalized NL, schema fingerprint).
+    - Tier 1: in-process LRU (OrderedDict), bounded by max_entries.
+    - Tier 2: optional on-disk SQLite table, bounded by disk_max_entries; one file
+      can back several processes (the API workers of server.py share it).
+    Both tiers honour ttl_seconds (<= 0 disables expiry).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 24 * 3600,
+        sqlite_path: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self._mem: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "template_hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                       "llm_calls": 0, "llm_ms": 0.0}
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    def _mem_put(self, key: str, value: str, created: float) -> None:
+        self._mem[key] = (value, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _lookup(self, key: str, now: float) -> Tuple[Optional[str], Optional[str]]:
+        # (value, tier) from memory, then disk (promoted to memory). Caller holds the lock.
+        hit = self._mem.get(key)
+        if hit is not None:
+            value, created = hit
+            if not self._expired(created, now):
+                self._mem.move_to_end(key)
+                return value, "hit"
+            del self._mem[key]
+            self._stats["expirations"] += 1
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT value, created FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created = row
+                if not self._expired(created, now):
+                    self._db.execute("UPDATE translations SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._mem_put(key, value, created)  # promote to tier 1
+                    return value, "disk_hit"
+                self._db.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self._db.commit()
+                self._stats["expirations"] += 1
+        return None, None
+
+    def _store(self, key: str, value: str, now: float) -> None:
+        # Caller holds the lock.
+        self._mem_put(key, value, now)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO translations (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.ttl_seconds > 0:
+                self._db.execute("DELETE FROM translations WHERE created < ?", (now - self.ttl_seconds,))
+            over = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.disk_max_entries
+            if over > 0:
+                self._db.execute(
+                    "DELETE FROM translations WHERE key IN ("
+                    " SELECT key FROM translations ORDER BY last_used ASC LIMIT ?)",
+                    (over,),
+                )
+                self._stats["evictions"] += over
+            self._db.commit()
+
+    def get(self, dialect: str, nl_query: str, schema_fp: str) -> Optional[str]:
+        key = _make_key(dialect, nl_query, schema_fp)
+        now = time.time()
+        with self._lock:
+            value, tier = self._lookup(key, now)
+            if value is None and TEMPLATES_ENABLED:
+                value = self._template_get(dialect, nl_query, schema_fp, now)
+                if value is not None:
+                    tier = "template_hit"
+                    self._store(key, value, now)
+            self._stats[{"hit": "hits", "disk_hit": "disk_hits", "template_hit": "template_hits"}.get(tier, "misses")] += 1
+        annotate(translation_cache=tier or "miss")
+        return value
+
+    def _template_get(self, dialect: str, nl_query: str, schema_fp: str, now: float) -> Optional[str]:
+        tmpl = nl_template(nl_query)
+        if tmpl is None:
+            return None
+        text, values = tmpl
+        spec, _ = self._lookup(_make_key(f"{dialect}#template", text, schema_fp), now)
+        if spec is None:
+            return None
+        try:
+            return fill_template(dialect, json.loads(spec), values)
+        except Exception:
+            return None
+
+    def put(self, dialect: str, nl_query: str, schema_fp: str, value: str) -> None:
+        # Empty output is never a usable translation; don't pin it.
+        if not value:
+            return
+        key = _make_key(dialect, nl_query, schema_fp)
+        spec = None
+        if TEMPLATES_ENABLED:
+            tmpl = nl_template(nl_query)
+            if tmpl is not None:
+                spec = make_template(dialect, value, tmpl[1], tmpl[0])
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+            if spec is not None:
+                self._store(_make_key(f"{dialect}#template", tmpl[0], schema_fp), spec, now)
+
+    def get_or_generate(self, dialect: str, nl_query: str, schema_fp: str, generate: Callable[[], str]) -> str:
+        """
+        Return the cached translation, or call `generate()` (the LLM) and cache its output.
+        """
+        cached = self.get(dialect, nl_query, schema_fp)
+        if cached is not None:
+            return cached
+        t0 = time.perf_counter()
+        with span("agent_llm", dialect=dialect):
+            value = generate()
+        self._count_llm(t0)
+        self.put(dialect, nl_query, schema_fp, value)
+        return value
+
+    def _count_llm(self, t0: float) -> None:
+        # LLM round-trips and their wall time (what a local translation saves).
+        with self._lock:
+            self._stats["llm_calls"] += 1
+            self._stats["llm_ms"] += (time.perf_counter() - t0) * 1000
+
+    def batch_get_or_generate(
+        self, dialect: str, nl_queries: List[str], schema_fp: str,
+        generate_many: Callable[[List[str]], List[Union[str, Exception]]],
+    ) -> List[Union[str, Exception]]:
+        """
+        Batch lookup: cached entries are served directly; all misses go to ONE
+        `generate_many(missing_queries)` call (e.g., llm.batch). Per-item failures
+        come back as Exception objects and are not cached.
+        """
+        out: List[Union[str, Exception, None]] = [self.get(dialect, q, schema_fp) for q in nl_queries]
+        missing = [i for i, v in enumerate(out) if v is None]
+        if missing:
+            t0 = time.perf_counter()
+            with span("agent_llm", dialect=dialect, batch=len(missing)):
+                generated = generate_many([nl_queries[i] for i in missing])
+            self._count_llm(t0)
+            for i, value in zip(missing, generated):
+                out[i] = value
+                if isinstance(value, str):
+                    self.put(dialect, nl_queries[i], schema_fp, value)
+        return out
+
+    async def aget_or_generate(
+        self, dialect: str, nl_query: str, schema_fp: str, agenerate: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        Async twin of get_or_generate; `agenerate` is awaited on a miss.
+        """
+        cached = self.get(dialect, nl_query, schema_fp)
+        if cached is not None:
+            return cached
+        t0 = time.perf_counter()
+        with span("agent_llm", dialect=dialect):
+            value = await agenerate()
+        self._count_llm(t0)
+        self.put(dialect, nl_query, schema_fp, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._mem)
+            if self._db is not None:
+                out["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        served = out["hits"] + out["disk_hits"] + out["template_hits"]
+        lookups = served + out["misses"]
+        out["hit_rate"] = served / lookups if lookups else 0.0
+        return out
+
+# ---------------------------
+# Shared instance (configured via env)
+# ---------------------------
+#   NL2DB_TRANSLATION_CACHE_SIZE  in-process entries (default 1024)
+#   NL2DB_TRANSLATION_CACHE_TTL   seconds (default 86400; 0 = never expire)
+#   NL2DB_TRANSLATION_CACHE_DB    SQLite file for the on-disk tier (unset = memory only)
+translation_cache = TranslationCache(
+    max_entries=int(os.getenv("NL2DB_TRANSLATION_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("NL2DB_TRANSLATION_CACHE_TTL", str(24 * 3600))),
+    sqlite_path=os.getenv("NL2DB_TRANSLATION_CACHE_DB") or None,
+)
+metrics.register_source("translation_cache", translation_cache.stats)
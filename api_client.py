@@ -0,0 +1,64 @@
+# api_client.py
+"""
+run_supervisor / fetch_page over HTTP, against server.py. Same arguments and
+result dicts as agents.supervisor, so app.py can swap one for the other;
+results are requested as Arrow IPC (JSON when the server cannot encode them).
+  NL2DB_API_URL      base URL of the API, e.g. http://127.0.0.1:8000
+  NL2DB_API_TIMEOUT  seconds per HTTP call (default 120)
+"""
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+API_URL = os.getenv("NL2DB_API_URL", "http://127.0.0.1:8000")
+TIMEOUT = float(os.getenv("NL2DB_API_TIMEOUT", "120"))
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+def decode(body: bytes, content_type: str) -> dict:
+    """Result dict of a /query or /page response (Arrow IPC or JSON); "data" as a DataFrame."""
+    if content_type.startswith(ARROW_STREAM):
+        table = pa.ipc.open_stream(body).read_all()
+        out = json.loads(table.schema.metadata[b"nl2db"])
+        out["data"] = table.to_pandas()
+        return out
+    out = json.loads(body)
+    if isinstance(out.get("data"), list):
+        out["data"] = pd.DataFrame(out["data"])
+    return out
+
+def _post(path: str, payload: dict, base_url: Optional[str]) -> dict:
+    req = urllib.request.Request(
+        (base_url or API_URL).rstrip("/") + path,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Accept": f"{ARROW_STREAM}, application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+            return decode(resp.read(), resp.headers.get("Content-Type", ""))
+    except urllib.error.HTTPError as e:  # 4xx bodies are result dicts too
+        try:
+            return decode(e.read(), e.headers.get("Content-Type", ""))
+        except ValueError:
+            return {"success": False, "error": f"error occurred (HTTP {e.code})", "data": None}
+    except (urllib.error.URLError, OSError) as e:
+        return {"success": False, "error": f"error occurred (API unreachable: {e})", "data": None}
+
+def run_supervisor(query: str, language: str, routing: str = "auto", page_size: Optional[int] = None,
+                   base_url: Optional[str] = None) -> dict:
+    payload = {"query": query, "language": language, "routing": routing}
+    if page_size:
+        payload["page_size"] = page_size
+    return _post("/query", payload, base_url)
+
+def fetch_page(result: dict, offset: Optional[int] = None, base_url: Optional[str] = None):
+    """Next page (or the page at `offset`) of a paged result. Returns (DataFrame, updated page descriptor)."""
+    out = _post("/page", {"token": result["page"]["token"], "offset": offset}, base_url)
+    if not out.get("success"):
+        raise RuntimeError(out.get("error") or "error occurred")
+    return out["data"], out["page"]
@@ -1,10 +1,32 @@
 # app.py
+import os
 import streamlit as st
 import pandas as pd
-from agents.supervisor import run_supervisor
+from db.tracing import serve_metrics
+
+# With NL2DB_API_URL set, this UI is a thin client of server.py: translation,
+# execution and the shared caches live in the API workers.
+if os.getenv("NL2DB_API_URL"):
+    from api_client import run_supervisor, fetch_page
+else:
+    from agents.supervisor import run_supervisor, fetch_page
+    from db.refresh import start_watcher
+
+# Rows fetched per page; the first page renders immediately, more on demand.
+PAGE_SIZE = 200
 
 st.set_page_config(page_title="NL → DBMS Query Converter", page_icon="🧠", layout="wide")
 
+# Optional Prometheus scrape endpoint (started once per process)
+if os.getenv("NL2DB_METRICS_PORT"):
+    serve_metrics(int(os.getenv("NL2DB_METRICS_PORT")))
+
+# Picks up changed/appended CSV and JSON sources (NL2DB_REFRESH_INTERVAL; once per process)
+if not os.getenv("NL2DB_API_URL"):
+    start_watcher()
+
+show_debug = st.sidebar.checkbox("Show debug panel", value=False)
+
 st.markdown(
     "<h1 style='text-align:center;margin-top:0;'>NL TO DBMS QUERY CONVERTER</h1>",
     unsafe_allow_html=True
@@ -15,6 +37,8 @@ if "submitted" not in st.session_state:
     st.session_state.submitted = False
 if "result" not in st.session_state:
     st.session_state.result = None
+if "rows" not in st.session_state:
+    st.session_state.rows = None   # pages fetched so far (concatenated)
 
 # A wide row with spacers to center the input row horizontally
 left_spacer, mid, right_spacer = st.columns([1, 2, 1])
@@ -36,7 +60,8 @@ with mid:
 
         if run_clicked:
             st.session_state.submitted = True
-            st.session_state.result = run_supervisor(query, language)
+            st.session_state.result = run_supervisor(query, language, page_size=PAGE_SIZE)
+            st.session_state.rows = st.session_state.result.get("data")
             st.rerun()
 
     else:
@@ -46,7 +71,18 @@ with mid:
             st.error(res.get("error") or "Error occurred")
         else:
             st.success(f"Executed with {res.get('language', '—')}")
-            df = res.get("data")
+            # SQL routes return every dialect rendering of the one translated query:
+            # viewing another dialect costs no LLM call or re-execution.
+            queries = res.get("queries")
+            if queries:
+                order = sorted(queries, key=lambda d: d != res.get("language"))
+                for tab, dialect in zip(st.tabs(order), order):
+                    with tab:
+                        st.code(queries[dialect], language="sql")
+            if res.get("truncated"):
+                st.warning(f"Only the first {res['row_limit']} rows were returned: the query lists more "
+                           "rows than the automatic row limit (NL2DB_AUTO_LIMIT) allows.")
+            df = st.session_state.rows
             if isinstance(df, pd.DataFrame):
                 st.dataframe(df, use_container_width=True, height=420)
             else:
@@ -55,9 +91,35 @@ with mid:
                 except Exception:
                     st.info("No tabular data to display.")
 
+            page = res.get("page")
+            if page and page.get("has_more"):
+                st.caption(f"Showing the first {len(df)} rows.")
+                if st.button(f"Load {page['limit']} more rows", use_container_width=True):
+                    more, res["page"] = fetch_page(res)
+                    st.session_state.rows = pd.concat([df, more], ignore_index=True)
+                    st.rerun()
+
+        # Debug panel: per-stage timings, cache status, tokens
+        tr = res.get("trace")
+        if show_debug and tr:
+            with st.expander("Debug: request trace", expanded=True):
+                st.caption(
+                    f"trace {tr.get('trace_id')} · total {tr.get('total_ms')} ms · "
+                    f"routed by {tr.get('routed_by', '—')}"
+                )
+                if tr.get("spans"):
+                    st.dataframe(pd.DataFrame(tr["spans"]), use_container_width=True)
+                st.json({
+                    k: tr.get(k)
+                    for k in ("translation_cache", "result_cache", "prompt_tokens",
+                              "completion_tokens", "error_stage", "error_type")
+                    if tr.get(k) is not None
+                })
+
         st.divider()
         # Reset button
         if st.button("Enter another query?", use_container_width=True):
             st.session_state.submitted = False
             st.session_state.result = None
+            st.session_state.rows = None
             st.rerun()
@@ -0,0 +1,128 @@
+# batch.py
+"""
+Run a pack of NL questions through run_supervisor_batch and stream the results.
+
+Input: JSONL, one object per line: {"query": "...", "language": "SQL"}
+       ("language" is optional when --language is given).
+Output: JSONL (default) or Parquet (when --output ends in .parquet), written
+        chunk by chunk so large packs never sit fully in memory.
+
+  python batch.py --input questions.jsonl --language SQL --output results.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from agents.supervisor import run_supervisor_batch
+
+# Fixed schema so every chunk (row group) matches, even when a column is all-null.
+PARQUET_SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("query", pa.string()),
+    ("language", pa.string()),
+    ("success", pa.bool_()),
+    ("error", pa.string()),
+    ("deduped", pa.bool_()),
+    ("rows", pa.int64()),
+    ("exec_ms", pa.float64()),
+    ("batch_ms", pa.float64()),
+    ("data", pa.string()),   # JSON-encoded records
+])
+
+def _read_jsonl(path: str, default_language: str):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        for lineno, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            language = obj.get("language") or default_language
+            if not obj.get("query") or not language:
+                raise ValueError(f"line {lineno}: need 'query' and a language")
+            yield obj["query"], language
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _to_record(index: int, item: dict) -> dict:
+    df = item.get("data")
+    rows = df.to_dict(orient="records") if isinstance(df, pd.DataFrame) else None
+    return {
+        "index": index,
+        "query": item.get("query"),
+        "language": item.get("language"),
+        "success": bool(item.get("success")),
+        "error": item.get("error"),
+        "deduped": bool(item.get("deduped")),
+        "rows": len(rows) if rows is not None else 0,
+        "exec_ms": round(item.get("exec_ms", 0.0), 3),
+        "batch_ms": round(item.get("batch_ms", 0.0), 3),
+        "data": rows,
+    }
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Batch NL -> DBMS query runner")
+    ap.add_argument("--input", "-i", required=True, help="JSONL file of questions ('-' for stdin)")
+    ap.add_argument("--output", "-o", default="-", help="JSONL or .parquet output ('-' for stdout)")
+    ap.add_argument("--language", "-l", default=None, help="default language for lines without one")
+    ap.add_argument("--concurrency", "-c", type=int, default=8, help="max in-flight LLM calls / DuckDB cursors")
+    ap.add_argument("--chunk-size", type=int, default=200, help="questions per run_supervisor_batch call")
+    args = ap.parse_args(argv)
+
+    parquet = args.output.endswith(".parquet")
+    writer = None
+    sink = None if parquet else (sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8"))
+    index = 0
+    t0 = time.perf_counter()
+    try:
+        for chunk in _chunks(_read_jsonl(args.input, args.language), args.chunk_size):
+            # One batch call per language present in the chunk; keep input order in the output.
+            by_language = {}
+            for pos, (query, language) in enumerate(chunk):
+                by_language.setdefault(language, []).append((pos, query))
+            results = [None] * len(chunk)
+            for language, items in by_language.items():
+                outs = run_supervisor_batch([q for _, q in items], language, max_concurrency=args.concurrency)
+                for (pos, _), out in zip(items, outs):
+                    results[pos] = out
+
+            records = []
+            for item in results:
+                records.append(_to_record(index, item))
+                index += 1
+
+            if parquet:
+                for r in records:
+                    r["data"] = json.dumps(r["data"], default=str)
+                table = pa.Table.from_pylist(records, schema=PARQUET_SCHEMA)
+                if writer is None:
+                    writer = pq.ParquetWriter(args.output, PARQUET_SCHEMA)
+                writer.write_table(table)
+            else:
+                for r in records:
+                    sink.write(json.dumps(r, default=str) + "\n")
+                sink.flush()
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None and sink is not sys.stdout:
+            sink.close()
+
+    print(f"{index} questions in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# benchmarks/datasets.py
+"""
+Scaled synthetic copies of the demo data, for benchmarks.
+
+write_scaled(root, scale) writes <root>/db/mockdb_1.csv and <root>/db/mockdb_2.json
+with `scale` x the original rows: every source row is repeated with fresh
+CustomerIDs and small deterministic jitter on the numeric fields, so filters and
+groupings keep roughly the original selectivity. Running the app with `root` as
+the working directory makes every agent use the scaled data unchanged.
+"""
+import csv
+import json
+import os
+import random
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_CSV = os.path.join(ROOT, "db", "mockdb_1.csv")
+SOURCE_JSON = os.path.join(ROOT, "db", "mockdb_2.json")
+
+CSV_FIELDS = ["CustomerID", "Genre", "Age", "Annual Income (k$)", "Spending Score (1-100)"]
+
+def _clip(value: int, lo: int, hi: int) -> int:
+    return max(lo, min(hi, value))
+
+def _source_rows() -> List[Dict]:
+    with open(SOURCE_CSV, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def scaled_rows(scale: int, seed: int = 0) -> List[Tuple[str, str, int, int, int]]:
+    """(CustomerID, Genre, Age, income, score) tuples; the first copy is the original data."""
+    base = _source_rows()
+    total = len(base) * max(1, scale)
+    width = max(4, len(str(total)))
+    rng = random.Random(seed)
+    out = []
+    for copy in range(max(1, scale)):
+        for row in base:
+            age = int(row["Age"])
+            income = int(row["Annual Income (k$)"])
+            score = int(row["Spending Score (1-100)"])
+            if copy:
+                age = _clip(age + rng.randint(-2, 2), 18, 80)
+                income = _clip(income + rng.randint(-3, 3), 1, 200)
+                score = _clip(score + rng.randint(-5, 5), 1, 100)
+            out.append((str(len(out) + 1).zfill(width), row["Genre"], age, income, score))
+    return out
+
+def write_scaled(root: str, scale: int, seed: int = 0) -> Tuple[str, str]:
+    """
+    Write the scaled CSV (SQL routes) and JSON (MongoDB route) under <root>/db.
+    Returns (csv_path, json_path). Existing files are reused.
+    """
+    db_dir = os.path.join(root, "db")
+    os.makedirs(db_dir, exist_ok=True)
+    csv_path = os.path.join(db_dir, "mockdb_1.csv")
+    json_path = os.path.join(db_dir, "mockdb_2.json")
+    if os.path.exists(csv_path) and os.path.exists(json_path):
+        return csv_path, json_path
+
+    rows = scaled_rows(scale, seed)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(CSV_FIELDS)
+        w.writerows(rows)
+    docs = [
+        {"CustomerID": cid, "Genre": genre, "Age": age, "Annual_Income_kUSD": income, "Spending_Score": score}
+        for cid, genre, age, income, score in rows
+    ]
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(docs, f)
+    return csv_path, json_path
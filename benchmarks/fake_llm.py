@@ -0,0 +1,95 @@
+# benchmarks/fake_llm.py
+"""
+Offline stand-in for ChatGroq that replays canned answers from the corpus.
+
+Install it with agents.registry.set_llm_factory(replay_factory(...)) before the
+first request; every agent and the supervisor then talk to it instead of Groq.
+Which answer to replay is decided from the prompt itself:
+- the system prompt tells which agent is asking (SQL engine / MongoDB; the
+  MySQL/PostgreSQL markers only match prompts from older agent versions)
+- the corpus question found in the prompt picks the entry
+- the supervisor prompt is answered with the "Language: ..." label of its input
+Anything unknown gets EXACTLY "INVALID QUERY", like a refusing model.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage
+
+# First matching marker wins (MySQL/PostgreSQL before the generic SQL prompt).
+_AGENT_MARKERS = [
+    ("You are a routing supervisor", "supervisor"),
+    ("You are a MongoDB expert", "mongodb"),
+    ("You are a MySQL expert", "mysql"),
+    ("You are a PostgreSQL expert", "postgres"),
+    ("You are an SQL expert", "sql"),
+]
+_LANGUAGE_RE = re.compile(r"Language:\s*(\S+)")
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class FakeChatGroq:
+    """
+    Replays corpus answers with a configurable latency (latency_ms +- jitter_ms).
+    Implements the slice of the ChatGroq surface the agents use: invoke, ainvoke, batch.
+    """
+
+    def __init__(self, corpus: List[Dict[str, Any]], latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 seed: int = 0, **client_kwargs):
+        self.client_kwargs = client_kwargs  # model/temperature/top_p, kept for inspection
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Longest question first so a question that contains another still matches itself.
+        self._entries = sorted(corpus, key=lambda e: len(e["question"]), reverse=True)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def reply(self, prompt: str) -> str:
+        agent = next((name for marker, name in _AGENT_MARKERS if marker in prompt), None)
+        if agent == "supervisor":
+            m = _LANGUAGE_RE.search(prompt.rsplit("INPUT:", 1)[-1])
+            return m.group(1) if m else "REJECT"
+        for entry in self._entries:
+            if entry["question"] in prompt:
+                return entry["answers"].get(agent) or "INVALID QUERY"
+        return "INVALID QUERY"
+
+    def invoke(self, prompt: str, config: Optional[dict] = None, **kwargs) -> AIMessage:
+        time.sleep(self._delay())
+        return AIMessage(content=self.reply(prompt))
+
+    async def ainvoke(self, prompt: str, config: Optional[dict] = None, **kwargs) -> AIMessage:
+        await asyncio.sleep(self._delay())
+        return AIMessage(content=self.reply(prompt))
+
+    def batch(self, prompts: List[str], config: Optional[dict] = None, *, return_exceptions: bool = False, **kwargs):
+        workers = max(1, min(len(prompts), (config or {}).get("max_concurrency") or len(prompts)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.invoke, prompts))
+
+def replay_factory(corpus: List[Dict[str, Any]], latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+    """
+    LLM factory for set_llm_factory. All configs share one fake (one call counter).
+    """
+    fake = FakeChatGroq(corpus, latency_ms=latency_ms, jitter_ms=jitter_ms, seed=seed)
+
+    def factory(**client_kwargs):
+        fake.client_kwargs = client_kwargs
+        return fake
+
+    return factory
@@ -0,0 +1,82 @@
+# benchmarks/import_time.py
+"""
+Cold-start benchmark: each scenario runs in a fresh interpreter.
+
+  python benchmarks/import_time.py            # summary table
+  python benchmarks/import_time.py --top 15   # plus the slowest imports (-X importtime)
+
+Scenarios:
+- supervisor: `import agents.supervisor` only (what app.py pays on every new worker)
+- <route>:    supervisor import + first use of that route's agent and backend,
+              without calling the LLM
+Also reports which heavy modules each scenario ended up loading.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["langchain_groq", "duckdb", "sqlglot", "pymongo", "pandas", "pyarrow"]
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import agents.supervisor
+t1 = time.perf_counter()
+route = sys.argv[1]
+if route != "supervisor":
+    from agents.registry import get_agent
+    agent = get_agent(route)
+    mod = sys.modules[agent.__module__]
+    if hasattr(mod, "_get_conn"):
+        mod._get_conn()          # DuckDB store attach (SQL routes)
+    mod._get_llm()               # client construction only, no request
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "first_use_ms": (t2 - t1) * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY,)
+
+def _run(scenario: str, importtime: bool = False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _PROBE, scenario]
+    env = dict(os.environ, GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "benchmark"))
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+def _slowest_imports(stderr: str, top: int):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cum_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=3, help="runs per scenario (best is reported)")
+    ap.add_argument("--top", type=int, default=0, help="also list the N slowest imports of the supervisor scenario")
+    args = ap.parse_args(argv)
+
+    print(f"{'scenario':<12} {'import ms':>10} {'first use ms':>13}  modules loaded")
+    for scenario in ["supervisor", "SQL", "MySQL", "PostgreSQL", "MongoDB"]:
+        runs = [_run(scenario)[0] for _ in range(max(1, args.repeat))]
+        best = min(runs, key=lambda r: r["import_ms"] + r["first_use_ms"])
+        print(f"{scenario:<12} {best['import_ms']:>10.1f} {best['first_use_ms']:>13.1f}  {', '.join(best['loaded']) or '-'}")
+
+    if args.top:
+        _, stderr = _run("supervisor", importtime=True)
+        print("\nslowest imports for `import agents.supervisor` (cumulative us):")
+        for cum, self_us, name in _slowest_imports(stderr, args.top):
+            print(f"{cum:>10} {self_us:>10}  {name}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# benchmarks/mongo_engines.py
+"""
+MongoDB specs on both engines: every MongoDB answer of the corpus runs as SQL on
+DuckDB (db/mongo_sql.py) and on the Mongo backend, at scaled copies of the demo
+data (see benchmarks/datasets.py). Reports per spec whether the two results
+agree (same rows in any order) and the median latency of each engine.
+
+  python benchmarks/mongo_engines.py                      # scales 1,10
+  python benchmarks/mongo_engines.py --scales 100 --repeat 3
+  python benchmarks/mongo_engines.py --mongo-uri mongodb://127.0.0.1:27017/
+
+Result caches are cleared before every run. With the DuckDB engine, specs
+answered from the rollup cells (db/rollups.py) or not translated show
+"backend". Exits 1 when any spec disagrees.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.datasets import write_scaled  # noqa: E402
+from benchmarks.fake_llm import load_corpus  # noqa: E402
+from benchmarks.suite import DEFAULT_CORPUS, _configure_mongo  # noqa: E402
+
+def _worker(cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    _configure_mongo(cfg["mongo_uri"], cfg["scale"])
+    import db.mongo_runner as runner
+    from db.catalog import get_catalog
+    from db.mongo_backends import get_backend
+    from db.result_cache import result_cache
+
+    get_backend()
+    get_catalog().collection_connection()
+
+    def run(spec):
+        result_cache.invalidate()
+        if "aggregate" in spec:
+            return runner.run_mongo_aggregate(spec["aggregate"])
+        return runner.run_mongo_query(spec.get("filter", {}), projection=spec.get("projection"))
+
+    def timed(engine, spec):
+        runner.ENGINE = engine
+        before = runner.engine_stats()["duckdb"]
+        df = run(spec)  # warm-up (plans, prepared statements)
+        ran = "duckdb" if runner.engine_stats()["duckdb"] > before else "backend"
+        times = []
+        for _ in range(cfg["repeat"]):
+            t = time.perf_counter()
+            run(spec)
+            times.append((time.perf_counter() - t) * 1000)
+        return df, ran, statistics.median(times)
+
+    out = []
+    for entry in load_corpus(cfg["corpus"]):
+        answer = entry.get("answers", {}).get("mongodb")
+        if not answer or answer.strip().upper() == "INVALID QUERY":
+            continue
+        spec = json.loads(answer)
+        sql_df, ran, sql_ms = timed("duckdb", spec)
+        backend_df, _, backend_ms = timed("backend", spec)
+        out.append({
+            "id": entry["id"], "rows": len(backend_df), "engine": ran, "duckdb_ms": sql_ms,
+            "backend_ms": backend_ms, "match": runner.same_rows(sql_df, backend_df),
+        })
+    return out
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    ap.add_argument("--scales", default="1,10", help="dataset multipliers of the 200-row demo data")
+    ap.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL of questions with per-dialect answers")
+    ap.add_argument("--repeat", type=int, default=5, help="measured runs per spec and engine")
+    ap.add_argument("--mongo-uri", default="mongita", help="'mongita' (in-process) or a mongodb:// URI")
+    ap.add_argument("--workdir", default=None, help="where scaled datasets live (default: temp dir, removed)")
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(_worker(json.loads(args.worker))))
+        return 0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nl2db-mongo-")
+    mismatches = 0
+    try:
+        print(f"{'scale':>6} {'spec':<6} {'rows':>7} {'engine':<8} {'duckdb ms':>10} {'backend ms':>11} {'speedup':>8}  match")
+        for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+            scale_dir = os.path.join(workdir, f"x{scale}")
+            write_scaled(scale_dir, scale)
+            cfg = {"scale": scale, "corpus": os.path.abspath(args.corpus), "repeat": args.repeat, "mongo_uri": args.mongo_uri}
+            env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(cfg)],
+                cwd=scale_dir, env=env, capture_output=True, text=True, check=True,
+            )
+            for r in json.loads(proc.stdout.strip().splitlines()[-1]):
+                mismatches += not r["match"]
+                speedup = r["backend_ms"] / r["duckdb_ms"] if r["duckdb_ms"] else 0.0
+                print(f"{scale:>6} {r['id']:<6} {r['rows']:>7} {r['engine']:<8} {r['duckdb_ms']:>10.2f} "
+                      f"{r['backend_ms']:>11.2f} {speedup:>7.1f}x  {'yes' if r['match'] else 'NO'}")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# benchmarks/suite.py
+"""
+End-to-end benchmark: a fixed corpus of NL questions through run_supervisor for
+every route, offline (replayed LLM answers, see benchmarks/fake_llm.py), at
+scaled copies of the demo data (see benchmarks/datasets.py).
+
+  python benchmarks/suite.py                                   # scales 1,10,100; all routes
+  python benchmarks/suite.py --llm-latency-ms 300 --jitter-ms 50
+  python benchmarks/suite.py --output bench.json               # save results
+  python benchmarks/suite.py --baseline bench.json             # compare against saved results
+
+Reports per (scale, route): p50/p95/p99 latency, throughput, peak RSS, and the
+per-stage breakdown from the request traces (stages nest: "agent" contains the
+agent LLM call and execution). Each (scale, route) runs in a fresh interpreter
+whose working directory holds the scaled db/ files, so no state leaks between
+cells and the agents run unmodified.
+
+Caches: --cache cold (default) clears the translation and result caches before
+every request, so each one pays the full pipeline; --cache warm measures hits.
+MongoDB: --mongo-uri mongita (default) uses the in-process mongita backend;
+a mongodb:// URI uses the pymongo backend (data goes to nl2db_bench.customers_x<scale>).
+--mongo-engine backend runs every MongoDB spec on that backend instead of as
+SQL on DuckDB (db/mongo_sql.py; benchmarks/mongo_engines.py compares the two).
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.datasets import write_scaled  # noqa: E402
+from benchmarks.fake_llm import load_corpus, replay_factory  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "corpus.jsonl")
+ROUTES = ["SQL", "MySQL", "PostgreSQL", "MongoDB"]
+# The three SQL routes share one translation (agents/sql_engine.py), so the "sql" answer.
+_ANSWER_KEY = {"SQL": "sql", "MySQL": "sql", "PostgreSQL": "sql", "MongoDB": "mongodb"}
+
+# Compared against a baseline: metric -> True when higher is better.
+COMPARED = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "throughput_rps": True, "peak_rss_mb": False}
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    pos = (len(s) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+# ---------------------------
+# Worker (one scale x route, in its own process)
+# ---------------------------
+def _configure_mongo(uri: str, scale: int, engine: str = "duckdb") -> None:
+    # Backends seed themselves from ./db/mockdb_2.json, i.e. this cell's scaled copy.
+    os.environ.pop("NL2DB_MONGITA_DIR", None)
+    os.environ["NL2DB_MONGO_ENGINE"] = engine
+    if uri == "mongita":
+        os.environ["NL2DB_MONGO_BACKEND"] = "mongita"
+    else:
+        os.environ.update({
+            "NL2DB_MONGO_BACKEND": "pymongo",
+            "NL2DB_MONGO_URI": uri,
+            "NL2DB_MONGO_DB": "nl2db_bench",
+            "NL2DB_MONGO_COLLECTION": f"customers_x{scale}",
+        })
+
+def _worker(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    import resource
+
+    _configure_mongo(cfg["mongo_uri"], cfg["scale"], cfg.get("mongo_engine", "duckdb"))
+    from agents.registry import get_agent, set_llm_factory
+
+    corpus = load_corpus(cfg["corpus"])
+    set_llm_factory(replay_factory(corpus, cfg["latency_ms"], cfg["jitter_ms"]))
+
+    from agents import supervisor
+    from agents.local_compiler import local_stats
+    from agents.translation_cache import translation_cache
+    from db.result_cache import result_cache
+
+    route = cfg["route"]
+    t0 = time.perf_counter()
+    if route == "MongoDB":
+        from db.catalog import get_catalog
+        from db.mongo_backends import get_backend
+
+        get_backend()  # seed + index this scale
+        get_catalog().connection()  # the table the DuckDB engine reads
+    else:
+        agent_module = sys.modules[get_agent(route).__module__]
+        agent_module._get_conn()  # store ingest/attach for this scale
+    setup_ms = (time.perf_counter() - t0) * 1000
+    entries = corpus
+
+    def clear_caches():
+        if cfg["cache"] == "cold":
+            translation_cache.clear()
+            result_cache.invalidate()
+
+    def run_one(entry):
+        clear_caches()
+        t = time.perf_counter()
+        res = supervisor.run_supervisor(entry["question"], route, routing=cfg["routing"], page_size=cfg["page_size"])
+        return entry, res, (time.perf_counter() - t) * 1000
+
+    async def arun_one(entry, sem):
+        async with sem:
+            clear_caches()
+            t = time.perf_counter()
+            res = await supervisor.arun_supervisor(
+                entry["question"], route, routing=cfg["routing"], page_size=cfg["page_size"]
+            )
+            return entry, res, (time.perf_counter() - t) * 1000
+
+    async def run_concurrent(items):
+        sem = asyncio.Semaphore(cfg["concurrency"])
+        return await asyncio.gather(*(arun_one(e, sem) for e in items))
+
+    def run_all(items):
+        if cfg["concurrency"] > 1:
+            return asyncio.run(run_concurrent(items))
+        return [run_one(e) for e in items]
+
+    for _ in range(cfg["warmup"]):
+        run_all(entries)
+
+    measured = entries * cfg["repeat"]
+    t_wall = time.perf_counter()
+    samples = run_all(measured)
+    wall = time.perf_counter() - t_wall
+
+    latencies, stage_ms, errors = [], {}, 0
+    for entry, res, ms in samples:
+        latencies.append(ms)
+        expected_ok = entry["answers"].get(_ANSWER_KEY[route]) != "INVALID QUERY"
+        if expected_ok and not res.get("success"):
+            errors += 1
+        for sp in (res.get("trace") or {}).get("spans", []):
+            stage_ms.setdefault(sp["name"], []).append(sp["ms"])
+
+    total = sum(latencies) or 1.0
+    stages = {
+        name: {
+            "count": len(vals),
+            "mean_ms": sum(vals) / len(vals),
+            "p95_ms": _percentile(vals, 0.95),
+            "share": sum(vals) / total,
+        }
+        for name, vals in sorted(stage_ms.items())
+    }
+    return {
+        "scale": cfg["scale"],
+        "route": route,
+        "rows": cfg["rows"],
+        "requests": len(samples),
+        "errors": errors,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "throughput_rps": len(samples) / wall if wall > 0 else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "setup_ms": setup_ms,
+        "llm_calls": supervisor._get_llm().calls,
+        "local": local_stats(),
+        "stages": stages,
+    }
+
+# ---------------------------
+# Driver
+# ---------------------------
+def _run_cell(cfg: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    env.setdefault("GROQ_API_KEY", "benchmark")
+    env.pop("NL2DB_TRANSLATION_CACHE_DB", None)  # no cross-run disk hits
+    env.setdefault("NL2DB_LLM_RPM", "0")  # the fake LLM has no Groq quota to protect
+    env.setdefault("NL2DB_LLM_TPM", "0")
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--worker", json.dumps(cfg)],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{cfg['route']} x{cfg['scale']} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def _print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"{'scale':>6} {'rows':>8} {'route':<11} {'req':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'req/s':>8} {'rss MB':>7} {'setup ms':>9}")
+    for r in results:
+        print(f"{r['scale']:>6} {r['rows']:>8} {r['route']:<11} {r['requests']:>5} {r['errors']:>4} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['throughput_rps']:>8.1f} "
+              f"{r['peak_rss_mb']:>7.0f} {r['setup_ms']:>9.0f}")
+    print("\nper-stage breakdown (mean / p95 ms, share of request time):")
+    for r in results:
+        parts = [
+            f"{name} {s['mean_ms']:.1f}/{s['p95_ms']:.1f} ({s['share']:.0%})"
+            for name, s in r["stages"].items()
+        ]
+        print(f"  x{r['scale']:<5} {r['route']:<11} " + ", ".join(parts))
+    print("\nlocal compiler (translations served without the LLM, estimated LLM time saved):")
+    for r in results:
+        loc = r.get("local") or {}
+        print(f"  x{r['scale']:<5} {r['route']:<11} {loc.get('local_share', 0):.0%} local, "
+              f"{loc.get('compile_us_avg', 0):.0f} us/compile, {loc.get('saved_ms_est', 0):.0f} ms saved "
+              f"({loc.get('llm_ms_avg', 0):.1f} ms per LLM call)")
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Print deltas against a saved run; return the regressions beyond `tolerance`.
+    """
+    base = {(r["scale"], r["route"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\nvs baseline (tolerance {tolerance:.0%}):")
+    for r in results:
+        b = base.get((r["scale"], r["route"]))
+        if b is None:
+            print(f"  x{r['scale']:<5} {r['route']:<11} (not in baseline)")
+            continue
+        parts = []
+        for metric, higher_is_better in COMPARED.items():
+            old, new = b.get(metric), r.get(metric)
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = " !"
+                regressions.append(f"{r['route']} x{r['scale']} {metric}: {old:.1f} -> {new:.1f} ({change:+.0%})")
+            parts.append(f"{metric} {change:+.0%}{flag}")
+        print(f"  x{r['scale']:<5} {r['route']:<11} " + ", ".join(parts))
+    return regressions
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    ap.add_argument("--scales", default="1,10,100", help="dataset multipliers of the 200-row demo data")
+    ap.add_argument("--routes", default=",".join(ROUTES), help="comma-separated routes to run")
+    ap.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL of questions with per-dialect answers")
+    ap.add_argument("--repeat", type=int, default=5, help="measured passes over the corpus")
+    ap.add_argument("--warmup", type=int, default=1, help="unmeasured passes first")
+    ap.add_argument("--llm-latency-ms", type=float, default=0.0, help="fake LLM latency per call")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="+- uniform jitter on the fake latency")
+    ap.add_argument("--cache", choices=["cold", "warm"], default="cold")
+    ap.add_argument("--routing", choices=["auto", "llm"], default="auto", help="'llm' also exercises the supervisor call")
+    ap.add_argument("--concurrency", type=int, default=1, help=">1 drives arun_supervisor concurrently")
+    ap.add_argument("--page-size", type=int, default=None, help="pass page_size to run_supervisor")
+    ap.add_argument("--mongo-uri", default="mongita", help="'mongita' (in-process) or a mongodb:// URI")
+    ap.add_argument("--mongo-engine", choices=["duckdb", "backend"], default="duckdb",
+                    help="where MongoDB specs run (NL2DB_MONGO_ENGINE)")
+    ap.add_argument("--workdir", default=None, help="where scaled datasets live (default: temp dir, removed)")
+    ap.add_argument("--output", "-o", default=None, help="write results JSON here (usable as --baseline)")
+    ap.add_argument("--baseline", "-b", default=None, help="compare against a saved results JSON")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="relative change that counts as a regression")
+    ap.add_argument("--fail-on-regression", action="store_true", help="exit 1 when a regression is found")
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(_worker(json.loads(args.worker))))
+        return 0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nl2db-bench-")
+    config = {
+        "repeat": args.repeat, "warmup": args.warmup, "latency_ms": args.llm_latency_ms,
+        "jitter_ms": args.jitter_ms, "cache": args.cache, "routing": args.routing,
+        "concurrency": args.concurrency, "page_size": args.page_size, "mongo_uri": args.mongo_uri,
+        "mongo_engine": args.mongo_engine,
+        "corpus": os.path.abspath(args.corpus),
+    }
+    results = []
+    try:
+        for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+            scale_dir = os.path.join(workdir, f"x{scale}")
+            csv_path, _ = write_scaled(scale_dir, scale)
+            with open(csv_path, encoding="utf-8") as f:
+                rows = sum(1 for _ in f) - 1
+            for route in [r.strip() for r in args.routes.split(",") if r.strip()]:
+                cell = dict(config, scale=scale, route=route, rows=rows)
+                print(f"running {route} x{scale} ({rows} rows)...", file=sys.stderr)
+                results.append(_run_cell(cell, scale_dir))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_results(results)
+    config.pop("corpus")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "python": sys.version.split()[0], "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("\nnote: baseline was recorded with a different config:", baseline.get("config"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
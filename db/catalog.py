@@ -0,0 +1,466 @@
+# db/catalog.py
+"""
+Catalog of everything the agents can query: DuckDB tables (CSV / Parquet / JSON
+sources) and the MongoDB collection, with their columns and column stats.
+
+Sources come from a JSON manifest, or default to the demo data (`mytable` from
+db/mockdb_1.csv, collection `customers`):
+
+    {"database": "demo_db",
+     "tables": [{"name": "mytable", "path": "db/mockdb_1.csv", "description": "..."},
+                {"name": "orders", "path": "data/orders.parquet", "key": "order_id"}],
+     "collection": {"name": "customers", "description": "...", "rollup": ["Genre", "Age"]}}
+
+"key" names the column identifying a row, used to apply changed sources row by
+row (db/refresh.py); by default it is the first column whose name ends in "id".
+"rollup" lists low-cardinality dimension columns whose pre-aggregates are kept
+up to date, so group-by/summary questions over them skip the scan (db/rollups.py).
+The collection is mirrored into a DuckDB table of its own, ingested from the
+backend's seed file (NL2DB_MONGO_SOURCE) on a separate connection, so MongoDB
+queries run as SQL on exactly the collection's documents (db/mongo_sql.py).
+
+Schemas are introspected once per data version: SQL tables read the stats saved
+in their store at ingest (db/storage.py); the collection is sampled through the
+Mongo backend. schema_prompt(dialect) renders the schema block of an agent
+prompt from that metadata (identifier quoting per dialect, categorical values,
+value ranges). Given the question, only the tables and columns the schema index
+(db/schema_index.py) retrieves for it are listed, and the resulting prompt is
+cached per question. Adding a dataset is one manifest entry (or register());
+no prompt is edited by hand.
+
+  NL2DB_CATALOG          manifest path (default db/catalog.json; missing = demo data)
+  NL2DB_CATALOG_SAMPLE   documents sampled to describe the collection (default 1000)
+  NL2DB_SCHEMA_PROMPT_CACHE  per-question schema prompts kept (default 4096; 0 disables)
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import duckdb
+from sqlglot import exp
+
+from db.mongo_sql import FieldMap
+from db.query_runner import data_version, get_pool, init_db
+from db.schema_index import SchemaIndex
+from db.storage import CATEGORICAL_MAX, column_stats, stored_stats
+from db.tracing import annotate, metrics, span
+
+CATALOG_PATH = os.getenv("NL2DB_CATALOG", os.path.join("db", "catalog.json"))
+SAMPLE_SIZE = int(os.getenv("NL2DB_CATALOG_SAMPLE", "1000"))
+PROMPT_CACHE_SIZE = int(os.getenv("NL2DB_SCHEMA_PROMPT_CACHE", "4096"))
+
+DEFAULT_MANIFEST = {
+    "database": "demo_db",
+    "tables": [
+        {"name": "mytable", "path": os.path.join("db", "mockdb_1.csv"),
+         "description": "mall customers", "rollup": ["Genre", "Age", "Annual Income (k$)"]},
+    ],
+    "collection": {"name": "customers",
+                   "description": "mall customers", "rollup": ["Genre", "Age", "Annual_Income_kUSD"]},
+}
+
+SQL_DIALECTS = {"sql": "duckdb", "duckdb": "duckdb", "mysql": "mysql", "postgres": "postgres"}
+
+class Column:
+    __slots__ = ("name", "type", "distinct", "min", "max", "null_pct", "values", "example")
+
+    def __init__(self, name: str, type: str, distinct: int = None, min: Any = None, max: Any = None,
+                 null_pct: float = None, values: List[Any] = None, example: Any = None):
+        self.name = name
+        self.type = type
+        self.distinct = distinct
+        self.min = min
+        self.max = max
+        self.null_pct = null_pct
+        self.values = values  # every value, for low-cardinality text columns
+        self.example = example
+
+class TableInfo:
+    """One queryable table (kind "duckdb") or collection (kind "mongodb")."""
+    __slots__ = ("name", "kind", "source", "description", "rows", "columns")
+
+    def __init__(self, name: str, kind: str, source: Optional[str], description: Optional[str],
+                 rows: int, columns: List[Column]):
+        self.name = name
+        self.kind = kind
+        self.source = source
+        self.description = description
+        self.rows = rows
+        self.columns = columns
+
+# ---------------------------
+# Mongo: describe a sample of documents
+# ---------------------------
+_JSON_TYPES = {bool: "boolean", int: "integer", float: "number", str: "string", dict: "object", list: "array"}
+
+def describe_documents(docs: Iterable[dict]) -> Tuple[int, List[Column]]:
+    """(documents seen, columns) for a sample of documents, fields in first-seen order."""
+    seen: Dict[str, Dict[str, Any]] = {}
+    count = 0
+    for doc in docs:
+        count += 1
+        for key, value in doc.items():
+            if key == "_id":
+                continue
+            field = seen.setdefault(key, {"types": Counter(), "values": set(), "min": None, "max": None,
+                                          "present": 0, "example": value})
+            field["present"] += 1
+            if value is None:
+                continue
+            field["types"][_JSON_TYPES.get(type(value), type(value).__name__)] += 1
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                field["min"] = value if field["min"] is None else min(field["min"], value)
+                field["max"] = value if field["max"] is None else max(field["max"], value)
+            elif isinstance(value, str) and len(field["values"]) <= CATEGORICAL_MAX:
+                field["values"].add(value)
+    columns = []
+    for key, field in seen.items():
+        ftype = field["types"].most_common(1)[0][0] if field["types"] else "null"
+        values = sorted(field["values"]) if ftype == "string" else None
+        columns.append(Column(
+            key, ftype,
+            distinct=len(field["values"]) if values is not None else None,
+            min=field["min"], max=field["max"],
+            null_pct=100.0 * (count - field["present"]) / count if count else None,
+            values=values if values is not None and len(values) <= CATEGORICAL_MAX else None,
+            example=field["example"],
+        ))
+    return count, columns
+
+# ---------------------------
+# Prompt rendering
+# ---------------------------
+def _sql_literal(value: Any) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _sql_column(col: Column, dialect: str) -> str:
+    line = f"- {exp.to_identifier(col.name).sql(dialect=dialect)}: {col.type}"
+    if col.values:
+        line += ", values " + ", ".join(_sql_literal(v) for v in col.values)
+    elif col.min is not None and col.type != "VARCHAR":
+        line += f", {col.min}..{col.max}"
+    return line
+
+def _mongo_field(col: Column) -> str:
+    line = f"- {col.name}: {col.type}"
+    if col.values:
+        line += " (" + " or ".join(json.dumps(v) for v in col.values) + ")"
+    elif col.min is not None:
+        line += f", {col.min}..{col.max}"
+    elif col.type == "string" and col.example is not None:
+        line += f" (e.g., {json.dumps(col.example)})"
+    return line
+
+_QUOTING = {
+    "mysql": "use backticks when they contain spaces/parentheses",
+    "duckdb": "case sensitive when quoted",
+    "postgres": "case sensitive when quoted",
+}
+
+def render_sql_schema(database: str, tables: List[TableInfo], dialect: str) -> str:
+    lines = [f"DATABASE: {database}"]
+    for t in tables:
+        head = f"TABLE: {t.name} ({t.rows} rows)"
+        if t.description:
+            head += f" -- {t.description}"
+        lines += ["", head, f"COLUMNS (EXACT NAMES; {_QUOTING[dialect]}):"]
+        lines += [_sql_column(c, dialect) for c in t.columns]
+    return "\n".join(lines) + "\n"
+
+def render_mongo_schema(database: str, collection: TableInfo) -> str:
+    head = f"COLLECTION: {collection.name}"
+    if collection.description:
+        head += f" -- {collection.description}"
+    lines = [f"DATABASE: {database}", head, "DOCUMENT FIELDS (EXACT NAMES; exact casing):"]
+    lines += [_mongo_field(c) for c in collection.columns]
+    return "\n".join(lines) + "\n"
+
+# ---------------------------
+# Catalog
+# ---------------------------
+class Catalog:
+    """
+    Registered sources plus lazily introspected schemas. Thread-safe; SQL and
+    Mongo sides are independent (describing one never touches the other).
+    """
+
+    def __init__(self, manifest: dict = None):
+        manifest = manifest or DEFAULT_MANIFEST
+        self.database = manifest.get("database", "demo_db")
+        self._sources: Dict[str, dict] = {t["name"]: dict(t) for t in manifest.get("tables", [])}
+        self._collection = dict(manifest.get("collection") or DEFAULT_MANIFEST["collection"])
+        self._lock = threading.RLock()
+        self._conn = None
+        self._mirror = None
+        self._sql: Optional[Tuple[tuple, Dict[str, TableInfo]]] = None    # (version, tables)
+        self._mongo: Optional[Tuple[tuple, TableInfo]] = None             # (version, collection)
+        self._indexes: Dict[str, Tuple[tuple, SchemaIndex]] = {}         # "sql"/"mongodb" -> (version, index)
+        self._rendered: Dict[tuple, str] = {}                             # (dialect, version, selection) -> text
+        self._prompts: "OrderedDict[tuple, str]" = OrderedDict()          # (dialect, version, question) -> text
+        self._fingerprints: Dict[tuple, str] = {}                         # (dialect, version) -> hash
+        self._field_map: Optional[Tuple[tuple, Optional[FieldMap]]] = None  # (version, map)
+        self._prompt_stats = {"hits": 0, "misses": 0, "columns_sent": 0, "columns_total": 0}
+
+    # --- sources ---
+    def register(self, name: str, path: str, description: str = None) -> None:
+        """Add or re-point a DuckDB table; ingested on the next connection()."""
+        with self._lock:
+            self._sources[name] = {"name": name, "path": path, "description": description}
+            self._conn = None
+            self._sql = None
+
+    def sources(self) -> Dict[str, dict]:
+        """{table: manifest entry} of the DuckDB tables."""
+        with self._lock:
+            return {name: dict(src) for name, src in self._sources.items()}
+
+    def key_column(self, name: str) -> Optional[str]:
+        """
+        Column identifying a row of table `name` (or of the collection): the
+        manifest's "key", else the first column whose name ends in "id".
+        """
+        if name == self._collection["name"]:
+            key, columns = self._collection.get("key"), self.collection().columns
+        else:
+            key, columns = self._sources[name].get("key"), self.table(name).columns
+        if key:
+            return key
+        return next((c.name for c in columns if c.name.lower().endswith("id")), None)
+
+    def connection(self):
+        """The shared DuckDB connection with every registered table attached."""
+        with self._lock:
+            if self._conn is None:
+                self._conn = init_db(tables={n: s["path"] for n, s in self._sources.items()},
+                                     rollups={n: s.get("rollup") or [] for n, s in self._sources.items()})
+            return self._conn
+
+    def collection_connection(self):
+        """
+        The DuckDB connection holding the collection's mirror: one table named
+        like the collection, ingested from the backend's seed file and kept in
+        step with it by db/refresh.py.
+        """
+        from db.mongo_backends import SOURCE_JSON
+
+        with self._lock:
+            if self._mirror is None:
+                name = self._collection["name"]
+                self._mirror = init_db(tables={name: SOURCE_JSON},
+                                       rollups={name: self._collection.get("rollup") or []})
+            return self._mirror
+
+    def field_map(self) -> Optional[FieldMap]:
+        """The collection's fields mapped onto its mirror table (same names), or None without one."""
+        name = self._collection["name"]
+        try:
+            conn = self.collection_connection()
+        except (OSError, ValueError, duckdb.Error):  # no seed file, or not one DuckDB reads
+            return None
+        version = data_version(conn)
+        with self._lock:
+            if self._field_map is None or self._field_map[0] != version:
+                with get_pool(conn).cursor() as cur:
+                    stats = stored_stats(cur, name)
+                    if stats is None:
+                        stats = column_stats(cur, '"' + name.replace('"', '""') + '"')
+                columns = [(s["name"], s["name"], s["type"]) for s in stats]
+                # key_column() would sample the backend; the mirror's columns are the same fields.
+                key = self._collection.get("key") or next(
+                    (s["name"] for s in stats if s["name"].lower().endswith("id")), None)
+                self._field_map = (version, FieldMap(name, columns, key=key))
+            return self._field_map[1]
+
+    def rollup_dims(self, name: str = None) -> List[str]:
+        """Rollup dimensions of table `name` (None: of the collection); [] = none."""
+        with self._lock:
+            src = self._collection if name in (None, self._collection["name"]) else self._sources[name]
+            return list(src.get("rollup") or [])
+
+    # --- introspection ---
+    def _sql_state(self) -> Tuple[tuple, Dict[str, TableInfo]]:
+        conn = self.connection()
+        version = data_version(conn)
+        with self._lock:
+            if self._sql is None or self._sql[0] != version:
+                tables = {}
+                with get_pool(conn).cursor() as cur:
+                    for name, src in self._sources.items():
+                        stats = stored_stats(cur, name)
+                        if stats is None:  # store from before stats were kept
+                            stats = column_stats(cur, '"' + name.replace('"', '""') + '"')
+                        tables[name] = TableInfo(
+                            name, "duckdb", src["path"], src.get("description"),
+                            stats[0]["rows"] if stats else 0,
+                            [Column(s["name"], s["type"], s["distinct"], s["min"], s["max"], s["null_pct"], s["values"])
+                             for s in stats],
+                        )
+                if self._sql is not None:
+                    self._forget(self._sql[0])
+                self._sql = (version, tables)
+            return self._sql
+
+    def _mongo_state(self) -> Tuple[tuple, TableInfo]:
+        from db.mongo_backends import get_backend
+        from db.mongo_runner import data_version as mongo_version
+
+        version = mongo_version()
+        with self._lock:
+            if self._mongo is None or self._mongo[0] != version:
+                backend = get_backend()
+                _, columns = describe_documents(backend.find({}, {"_id": 0}, limit=SAMPLE_SIZE))
+                info = TableInfo(
+                    self._collection["name"], "mongodb", None, self._collection.get("description"),
+                    backend.estimated_count(), columns,
+                )
+                if self._mongo is not None:
+                    self._forget(self._mongo[0])
+                self._mongo = (version, info)
+            return self._mongo
+
+    def _forget(self, version: tuple) -> None:
+        # Prompts rendered for a replaced data version can never be asked for again.
+        for cache in (self._rendered, self._prompts, self._fingerprints):
+            for key in [k for k in cache if k[1] == version]:
+                del cache[key]
+
+    def sql_tables(self) -> List[TableInfo]:
+        return list(self._sql_state()[1].values())
+
+    def collection(self) -> TableInfo:
+        return self._mongo_state()[1]
+
+    def tables(self) -> List[TableInfo]:
+        return self.sql_tables() + [self.collection()]
+
+    def table(self, name: str) -> TableInfo:
+        for t in self.sql_tables():
+            if t.name == name:
+                return t
+        raise KeyError(name)
+
+    # --- prompts ---
+    def _index(self, kind: str, version: tuple, tables: List[TableInfo]) -> SchemaIndex:
+        with self._lock:
+            cached = self._indexes.get(kind)
+            if cached is None or cached[0] != version:
+                cached = self._indexes[kind] = (version, SchemaIndex(tables))
+            return cached[1]
+
+    def _render(self, dialect: str, selection: List[Tuple[TableInfo, List[int]]], version: tuple) -> str:
+        # Memoized per (dialect, tables + columns shown, data version).
+        key = (dialect, version, tuple((t.name, tuple(cols)) for t, cols in selection))
+        with self._lock:
+            text = self._rendered.get(key)
+        if text is None:
+            shown = [
+                t if len(cols) == len(t.columns) else TableInfo(
+                    t.name, t.kind, t.source, t.description, t.rows, [t.columns[i] for i in cols])
+                for t, cols in selection
+            ]
+            if dialect == "mongodb":
+                text = render_mongo_schema(self.database, shown[0])
+            else:
+                text = render_sql_schema(self.database, shown, SQL_DIALECTS[dialect])
+            with self._lock:
+                self._rendered[key] = text
+        return text
+
+    def schema_prompt(self, dialect: str, tables: List[str] = None, nl_query: str = None) -> str:
+        """
+        Schema block for an agent prompt. dialect: sql / duckdb / mysql / postgres
+        (a DuckDB table listing) or mongodb (the collection). With `nl_query`, only
+        the tables/columns the schema index (db/schema_index.py) retrieves for it;
+        with `tables`, exactly those tables; otherwise everything.
+        """
+        if dialect == "mongodb":
+            version, info = self._mongo_state()
+            all_tables = [info]
+        else:
+            version, by_name = self._sql_state()
+            all_tables = list(by_name.values())
+            if tables is not None:
+                return self._render(dialect, [(by_name[n], list(range(len(by_name[n].columns)))) for n in tables], version)
+        if nl_query is None:
+            return self._render(dialect, [(t, list(range(len(t.columns)))) for t in all_tables], version)
+
+        key = (dialect, version, " ".join(nl_query.lower().split()))
+        with self._lock:
+            text = self._prompts.get(key)
+            if text is not None:
+                self._prompts.move_to_end(key)
+                self._prompt_stats["hits"] += 1
+        if text is not None:
+            annotate(schema_prompt="hit")
+            return text
+
+        annotate(schema_prompt="miss")
+        with span("schema_retrieval", dialect=dialect) as sp:
+            selection = self._index(dialect if dialect == "mongodb" else "sql", version, all_tables).select(nl_query)
+            text = self._render(dialect, selection, version)
+            sp["tables"] = len(selection)
+            sp["columns"] = sum(len(cols) for _, cols in selection)
+        with self._lock:
+            self._prompt_stats["misses"] += 1
+            self._prompt_stats["columns_sent"] += sp["columns"]
+            self._prompt_stats["columns_total"] += sum(len(t.columns) for t in all_tables)
+            if PROMPT_CACHE_SIZE > 0:
+                self._prompts[key] = text
+                while len(self._prompts) > PROMPT_CACHE_SIZE:
+                    self._prompts.popitem(last=False)
+        return text
+
+    def prompt_stats(self) -> Dict[str, Any]:
+        """Schema prompt cache hits/misses and the share of columns retrieval kept."""
+        with self._lock:
+            out = dict(self._prompt_stats)
+            out["entries"] = len(self._prompts)
+        out["columns_kept"] = out["columns_sent"] / out["columns_total"] if out["columns_total"] else 1.0
+        return out
+
+    def fingerprint(self, dialect: str) -> str:
+        """
+        Hash of the schema's shape for `dialect` (names, types, categorical values,
+        descriptions) and the retrieval settings: translation-cache entries stay
+        valid exactly as long as the catalog they were generated from. Row counts
+        and value ranges are left out, so new rows (db/refresh.py) keep them.
+        """
+        version, tables = self._mongo_state() if dialect == "mongodb" else self._sql_state()
+        fp = self._fingerprints.get((dialect, version))
+        if fp is None:
+            tables = [tables] if dialect == "mongodb" else list(tables.values())
+            shape = [(t.name, t.description, [(c.name, c.type, c.values) for c in t.columns]) for t in tables]
+            text = dialect + repr(shape) + repr(SchemaIndex([]).settings())  # retrieval settings shape prompts too
+            fp = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+            with self._lock:
+                self._fingerprints[(dialect, version)] = fp
+        return fp
+
+def load_manifest(path: str = None) -> dict:
+    path = path or CATALOG_PATH
+    if not os.path.exists(path):
+        return DEFAULT_MANIFEST
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+_catalog: Optional[Catalog] = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> Catalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog(load_manifest())
+    return _catalog
+
+metrics.register_source("schema_prompts", lambda: get_catalog().prompt_stats())
+
+def set_catalog(catalog: Optional[Catalog]) -> None:
+    """Swap the process-wide catalog (None = reload the manifest on next use)."""
+    global _catalog
+    with _catalog_lock:
+        _catalog = catalog
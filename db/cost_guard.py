@@ -0,0 +1,334 @@
+# db/cost_guard.py
+"""
+Admission control for agent queries: runs after validation, before execution.
+
+SQL (guard_sql): EXPLAIN the DuckDB query once per (data version, canonical
+text) and read DuckDB's cardinality estimates off the physical plan:
+- est_rows     rows the query returns (plan root)
+- est_cost     rows flowing through all operators
+- cross_rows   output of the largest cross product / nested-loop join
+Then:
+- listing queries (plain SELECT, no aggregate/GROUP BY/LIMIT) get LIMIT AUTO_LIMIT
+  (one row more is fetched: a result cut to AUTO_LIMIT rows is marked, see
+  cap_rows, and agents report it as "truncated" / "row_limit")
+- a plan over a threshold is downgraded to that LIMIT when it is a listing query
+  without ORDER BY (DuckDB stops early), otherwise rejected with QueryRejected
+
+Mongo (guard_find / guard_aggregate): the same policy on backend.explain():
+documents scanned (whole collection for COLLSCAN) against MAX_COST, listing
+finds/pipelines get a limit.
+
+deadline(cursor) interrupts a DuckDB query after QUERY_TIMEOUT_S (QueryTimeout).
+
+  NL2DB_COST_GUARD             EXPLAIN-based admission control (default 1)
+  NL2DB_AUTO_LIMIT             LIMIT added to listing queries (default 10000; 0 = none)
+  NL2DB_GUARD_MAX_ROWS         estimated result rows allowed (default 5000000)
+  NL2DB_GUARD_MAX_COST         estimated rows processed / documents scanned allowed (default 100000000)
+  NL2DB_GUARD_MAX_CROSS_ROWS   estimated cross product / nested-loop join output allowed (default 1000000)
+  NL2DB_QUERY_TIMEOUT_S        wall-clock limit per query, seconds (default 30; 0 = none)
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import duckdb
+from sqlglot import exp
+
+from db.sql_ast import ParsedSQL, parse_sql
+from db.tracing import annotate, metrics, span
+
+ENABLED = os.getenv("NL2DB_COST_GUARD", "1") != "0"
+AUTO_LIMIT = int(os.getenv("NL2DB_AUTO_LIMIT", "10000"))
+MAX_ROWS = int(os.getenv("NL2DB_GUARD_MAX_ROWS", "5000000"))
+MAX_COST = int(os.getenv("NL2DB_GUARD_MAX_COST", "100000000"))
+MAX_CROSS_ROWS = int(os.getenv("NL2DB_GUARD_MAX_CROSS_ROWS", "1000000"))
+QUERY_TIMEOUT_S = float(os.getenv("NL2DB_QUERY_TIMEOUT_S", "30"))
+
+class QueryRejected(ValueError):
+    """The query's estimated cost is over the configured thresholds."""
+
+class QueryTimeout(TimeoutError):
+    """The query ran past its wall-clock limit and was interrupted."""
+
+# Arrow schema metadata key / DataFrame.attrs key of a result cut by the automatic LIMIT.
+TRUNCATED = "nl2db_truncated"
+
+def cap_rows(table):
+    """
+    An Arrow result fetched with the guard's automatic limit (AUTO_LIMIT + 1
+    rows) cut to AUTO_LIMIT rows. A cut table carries the limit in its schema
+    metadata, so cached copies still say so.
+    """
+    if table.num_rows <= AUTO_LIMIT:
+        return table
+    meta = dict(table.schema.metadata or {})
+    meta[TRUNCATED.encode()] = str(AUTO_LIMIT).encode()
+    return table.slice(0, AUTO_LIMIT).replace_schema_metadata(meta)
+
+def truncation(df) -> Dict[str, Any]:
+    """Result-dict keys for a DataFrame the automatic LIMIT cut ({} otherwise)."""
+    limit = getattr(df, "attrs", {}).get(TRUNCATED)
+    return {"truncated": True, "row_limit": limit} if limit else {}
+
+class Verdict:
+    """Outcome of one EXPLAIN: action is "ok", "limited", "downgraded" or "rejected"."""
+    __slots__ = ("action", "est_rows", "est_cost", "reason", "rewrite")
+
+    def __init__(self, action: str, est_rows: int, est_cost: int, reason: str = None, rewrite: Any = None):
+        self.action = action
+        self.est_rows = est_rows
+        self.est_cost = est_cost
+        self.reason = reason
+        self.rewrite = rewrite  # limited SQL text / find limit / pipeline
+
+# ---------------------------
+# Verdict cache + counters
+# ---------------------------
+_VERDICTS_SIZE = 1024
+_verdicts: "OrderedDict[tuple, Verdict]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"explains": 0, "cache_hits": 0, "ok": 0, "limited": 0, "downgraded": 0, "rejected": 0, "timeouts": 0}
+
+def _cached_verdict(key: tuple, explain) -> Verdict:
+    with _lock:
+        verdict = _verdicts.get(key)
+        if verdict is not None:
+            _verdicts.move_to_end(key)
+            _stats["cache_hits"] += 1
+    if verdict is None:
+        with span("cost_guard"):
+            verdict = explain()
+        with _lock:
+            _stats["explains"] += 1
+            _verdicts[key] = verdict
+            while len(_verdicts) > _VERDICTS_SIZE:
+                _verdicts.popitem(last=False)
+    with _lock:
+        _stats[verdict.action] += 1
+    annotate(cost_guard=verdict.action, est_rows=verdict.est_rows, est_cost=verdict.est_cost)
+    if verdict.action == "rejected":
+        raise QueryRejected(verdict.reason)
+    return verdict
+
+def clear_verdicts() -> None:
+    with _lock:
+        _verdicts.clear()
+
+def guard_stats() -> Dict[str, int]:
+    with _lock:
+        out = dict(_stats)
+        out["entries"] = len(_verdicts)
+    return out
+
+metrics.register_source("cost_guard", guard_stats)
+
+def _over(est_rows: int, est_cost: int, cross_rows: int = 0) -> Optional[str]:
+    if MAX_ROWS and est_rows > MAX_ROWS:
+        return f"estimated {est_rows} result rows > {MAX_ROWS}"
+    if MAX_COST and est_cost > MAX_COST:
+        return f"estimated cost {est_cost} > {MAX_COST}"
+    if MAX_CROSS_ROWS and cross_rows > MAX_CROSS_ROWS:
+        return f"cross product of {cross_rows} rows > {MAX_CROSS_ROWS}"
+    return None
+
+# ---------------------------
+# SQL: EXPLAIN on DuckDB
+# ---------------------------
+_CROSS_OPERATORS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN"}
+
+def _plan_estimates(node: dict, acc: Dict[str, int]) -> int:
+    # Estimated output of `node`; sums operator outputs into acc["cost"] and tracks
+    # the largest cross product. Operators without an estimate pass their input on
+    # (a cross product multiplies its inputs).
+    children = [_plan_estimates(c, acc) for c in node.get("children", [])]
+    card = (node.get("extra_info") or {}).get("Estimated Cardinality")
+    name = node.get("name", "")
+    if card is not None:
+        est = int(card)
+    elif name == "CROSS_PRODUCT" and children:
+        est = 1
+        for c in children:
+            est *= c
+    else:
+        est = max(children, default=0)
+    if name in _CROSS_OPERATORS:
+        acc["cross"] = max(acc["cross"], est)
+    acc["cost"] += est
+    return est
+
+def explain_sql(cursor, sql: str) -> Tuple[int, int, int]:
+    """(est_rows, est_cost, cross_rows) for DuckDB `sql` from EXPLAIN (FORMAT JSON)."""
+    plan = json.loads(cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()[0][1])
+    acc = {"cost": 0, "cross": 0}
+    est_rows = sum(_plan_estimates(root, acc) for root in plan)
+    return est_rows, acc["cost"], acc["cross"]
+
+def _is_listing(tree: exp.Expression) -> bool:
+    return (
+        isinstance(tree, exp.Select)
+        and not tree.args.get("limit")
+        and not tree.args.get("group")
+        and tree.find(exp.AggFunc) is None
+    )
+
+def guard_sql(cursor, parsed: ParsedSQL, version: Any, auto_limit: bool = True) -> ParsedSQL:
+    """
+    Admit `parsed` (raises QueryRejected) and return what to execute: the query
+    itself or a LIMITed copy (AUTO_LIMIT + 1 rows: the caller cuts the result
+    with cap_rows). `version` is the data version the plan was made on.
+    """
+    if not ENABLED or parsed.canonical is None:
+        return parsed
+
+    def _explain() -> Verdict:
+        est_rows, est_cost, cross_rows = explain_sql(cursor, parsed.duckdb_sql)
+        reason = _over(est_rows, est_cost, cross_rows)
+        listing = AUTO_LIMIT > 0 and _is_listing(parsed.tree)
+        if reason and not (listing and not parsed.tree.args.get("order")):
+            return Verdict("rejected", est_rows, est_cost, reason)
+        if listing:
+            limited = parsed.tree.copy().limit(AUTO_LIMIT + 1).sql(dialect="duckdb")
+            return Verdict("downgraded" if reason else "limited", est_rows, est_cost, reason, limited)
+        return Verdict("ok", est_rows, est_cost)
+
+    verdict = _cached_verdict(("sql", version, parsed.canonical, auto_limit), _explain)
+    if auto_limit and verdict.rewrite is not None:
+        annotate(auto_limit=AUTO_LIMIT)
+        return parse_sql(verdict.rewrite, "duckdb")
+    return parsed
+
+# ---------------------------
+# Mongo: backend.explain()
+# ---------------------------
+_AGGREGATING_STAGES = {"$group", "$count", "$limit", "$bucket", "$bucketAuto", "$facet", "$sortByCount"}
+
+def guard_find(backend, query: dict, version: Any, key: str, limit: int = 0) -> int:
+    """
+    Admit a find (raises QueryRejected); returns the limit to run it with
+    (AUTO_LIMIT + 1 for a listing: the caller cuts the result with cap_rows).
+    """
+    if not ENABLED:
+        return limit
+
+    def _explain() -> Verdict:
+        plan = backend.explain(query, (MAX_COST or 0) + 1)
+        reason = _over(0, plan["scanned"])
+        if reason:
+            return Verdict("rejected", plan["scanned"], plan["scanned"], f"{plan['stage']}: {reason}")
+        if AUTO_LIMIT and not limit:
+            return Verdict("limited", plan["scanned"], plan["scanned"], rewrite=AUTO_LIMIT + 1)
+        return Verdict("ok", plan["scanned"], plan["scanned"])
+
+    verdict = _cached_verdict(("find", version, key, limit), _explain)
+    if verdict.rewrite is not None:
+        annotate(auto_limit=AUTO_LIMIT)
+        return verdict.rewrite
+    return limit
+
+def guard_aggregate(backend, pipeline: list, version: Any, key: str) -> list:
+    """
+    Admit a pipeline (raises QueryRejected); returns it, with a $limit of
+    AUTO_LIMIT + 1 for listings (a new list: the caller cuts with cap_rows).
+    """
+    if not ENABLED:
+        return pipeline
+
+    def _explain() -> Verdict:
+        first = pipeline[0] if pipeline and isinstance(pipeline[0], dict) else {}
+        plan = backend.explain(first.get("$match", {}), (MAX_COST or 0) + 1)
+        reason = _over(0, plan["scanned"])
+        if reason:
+            return Verdict("rejected", plan["scanned"], plan["scanned"], f"{plan['stage']}: {reason}")
+        listing = AUTO_LIMIT > 0 and not any(
+            isinstance(stage, dict) and _AGGREGATING_STAGES & set(stage) for stage in pipeline
+        )
+        if listing:
+            return Verdict("limited", plan["scanned"], plan["scanned"], rewrite=AUTO_LIMIT + 1)
+        return Verdict("ok", plan["scanned"], plan["scanned"])
+
+    verdict = _cached_verdict(("aggregate", version, key), _explain)
+    if verdict.rewrite is not None:
+        annotate(auto_limit=AUTO_LIMIT)
+        return list(pipeline) + [{"$limit": verdict.rewrite}]
+    return pipeline
+
+# ---------------------------
+# Wall-clock timeout (one watchdog thread for all queries)
+# ---------------------------
+class _Watchdog:
+    def __init__(self):
+        self._heap = []   # (due, seq, entry)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def arm(self, seconds: float, fire) -> dict:
+        entry = {"fire": fire, "done": False, "fired": False}
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + seconds, self._seq, entry))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="nl2db-deadline", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def disarm(self, entry: dict) -> None:
+        with self._cond:
+            entry["done"] = True  # popped lazily
+
+    def _run(self):
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2]["done"]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, entry = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                entry["fired"] = True
+                entry["fire"]()  # under the lock: never after disarm()
+
+_watchdog = _Watchdog()
+
+@contextmanager
+def deadline(cursor, seconds: float = None):
+    """
+    Interrupt the DuckDB query running on `cursor` after `seconds` (default
+    QUERY_TIMEOUT_S) and raise QueryTimeout in its place.
+    """
+    seconds = QUERY_TIMEOUT_S if seconds is None else seconds
+    if not seconds:
+        yield
+        return
+    entry = _watchdog.arm(seconds, cursor.interrupt)
+    try:
+        yield
+    except duckdb.Error as e:
+        if entry["fired"]:
+            with _lock:
+                _stats["timeouts"] += 1
+            annotate(error_stage="timeout")
+            raise QueryTimeout(f"query interrupted after {seconds}s") from e
+        raise
+    finally:
+        _watchdog.disarm(entry)
+
+def check_deadline(started: float, seconds: float = None) -> None:
+    """Cooperative variant for loops we drive ourselves (Mongo cursor decoding)."""
+    seconds = QUERY_TIMEOUT_S if seconds is None else seconds
+    if seconds and time.monotonic() - started > seconds:
+        with _lock:
+            _stats["timeouts"] += 1
+        annotate(error_stage="timeout")
+        raise QueryTimeout(f"query ran past {seconds}s")
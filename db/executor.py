@@ -0,0 +1,21 @@
+# db/executor.py
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Bounded pool for blocking backend work (DuckDB execute, PyMongo cursors) so the
+# event loop stays free while many requests wait on the LLM.
+#   NL2DB_DB_WORKERS  max concurrent backend calls (default 8)
+MAX_WORKERS = int(os.getenv("NL2DB_DB_WORKERS", "8"))
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="nl2db-db")
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking call on the shared backend executor and await its result.
+    The caller's context (current trace) travels with it.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_EXECUTOR, partial(ctx.run, fn, *args, **kwargs))
@@ -0,0 +1,529 @@
+# db/mongo_backends.py
+"""
+Pluggable storage behind db/mongo_runner.py. The runner only calls
+backend.find(...) / backend.aggregate(...) and never touches a driver.
+
+  NL2DB_MONGO_BACKEND     "mongita" (default, in-process) | "pymongo" (a real mongod)
+  NL2DB_MONGITA_DIR       mongita on disk in this directory (unset = in memory)
+  NL2DB_MONGO_URI         pymongo server (default mongodb://127.0.0.1:27017/)
+  NL2DB_MONGO_TIMEOUT_MS  pymongo server-selection timeout, so a missing server fails fast (default 5000)
+  NL2DB_MONGO_CONNECT_TIMEOUT_MS / NL2DB_MONGO_SOCKET_TIMEOUT_MS   (default 5000 / 30000)
+  NL2DB_MONGO_POOL_SIZE / NL2DB_MONGO_MIN_POOL_SIZE                 connection pool (default 50 / 0)
+  NL2DB_MONGO_MAX_TIME_MS server-side time limit per find/aggregate (default 20000; 0 = none)
+  NL2DB_MONGO_BATCH_SIZE  documents per server round trip (default 2000)
+  NL2DB_MONGO_DB / NL2DB_MONGO_COLLECTION   default demo_db / customers
+  NL2DB_MONGO_SOURCE      seed documents, a JSON array or JSON lines (default db/mockdb_2.json)
+
+Every backend seeds its collection from the source file when it is empty or the
+file changed since the last seed, and indexes INDEXED_FIELDS. Later changes to
+the file are applied document by document (apply_changes, db/refresh.py).
+Mongita only understands plain per-field comparisons and has no aggregation, so
+the rest ($or/$and/$regex, projections, pipelines) is evaluated here in Python,
+after pushing down whatever part of the filter mongita can use its indexes for.
+"""
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+SOURCE_JSON = os.getenv("NL2DB_MONGO_SOURCE", os.path.join("db", "mockdb_2.json"))
+INDEXED_FIELDS = ("Age", "Genre", "Annual_Income_kUSD", "Spending_Score")
+_META_COLLECTION = "_nl2db_source"
+_JSON_LINES = (".jsonl", ".ndjson")
+
+def read_documents(source: str, offset: int = 0) -> List[dict]:
+    """
+    Documents of `source`: a JSON array, or JSON lines (.jsonl / .ndjson), which
+    can also be read from byte `offset` on (the lines appended since).
+    """
+    if source.lower().endswith(_JSON_LINES):
+        with open(source, "rb") as f:
+            f.seek(offset)
+            return [json.loads(line) for line in f if line.strip()]
+    with open(source, encoding="utf-8") as f:
+        return json.load(f)
+
+# ---------------------------
+# Backends
+# ---------------------------
+class MongoBackend:
+    """
+    Interface mongo_runner relies on. find/aggregate return iterables of documents.
+    """
+    name = "base"
+
+    def find(self, query: dict, projection: dict = None, skip: int = 0, limit: int = 0,
+             batch_size: int = None) -> Iterable[dict]:
+        raise NotImplementedError
+
+    def aggregate(self, pipeline: list, batch_size: int = None) -> Iterable[dict]:
+        raise NotImplementedError
+
+    def estimated_count(self) -> int:
+        raise NotImplementedError
+
+    def explain(self, query: dict, cap: int) -> Dict[str, Any]:
+        """
+        Scan estimate for a filter (db/cost_guard.py): {"stage": "COLLSCAN" | "IXSCAN",
+        "scanned": documents examined (index matches counted up to `cap`), "total": collection size}.
+        """
+        raise NotImplementedError
+
+    # Seeding / indexes, shared by the concrete backends (PyMongo-style collections)
+    def _source_meta(self, source: str) -> Optional[dict]:
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        return {"_id": self.collection.name, "path": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def synced_meta(self) -> Optional[dict]:
+        """State of the source file the collection was last loaded/synced from."""
+        return self.meta.find_one({"_id": self.collection.name})
+
+    def mark_synced(self, source: str, sha256: str = None) -> None:
+        """Record that the collection now reflects `source` as it is on disk."""
+        meta = self._source_meta(source)
+        if meta is not None:
+            if sha256 is None:
+                with open(source, "rb") as f:
+                    sha256 = hashlib.sha256(f.read()).hexdigest()
+            meta["sha256"] = sha256
+            self.meta.replace_one({"_id": meta["_id"]}, meta, upsert=True)
+
+    def ensure_seeded(self, source: str = SOURCE_JSON) -> None:
+        """(Re)load `source` when the collection is empty or the file changed; then index."""
+        meta = self._source_meta(source)
+        if meta is not None:
+            seen = self.synced_meta()
+            fresh = seen is not None and all(seen.get(k) == meta[k] for k in ("path", "size", "mtime_ns"))
+            if not fresh or self.collection.count_documents({}) == 0:
+                self.reseed(source)
+        for field in INDEXED_FIELDS:
+            self.collection.create_index(field)
+
+    def reseed(self, source: str = SOURCE_JSON) -> None:
+        """Full reload of `source` (the fallback when changes cannot be applied by key)."""
+        docs = read_documents(source)
+        self.collection.delete_many({})
+        if docs:
+            self.collection.insert_many(docs)
+        self.mark_synced(source)
+
+    def apply_changes(self, key: str, upserts: List[dict], deletes: Iterable[Any] = ()) -> None:
+        """
+        Replace (or insert) each of `upserts` by its `key` field and delete the
+        documents whose key is in `deletes`; nothing else is touched.
+        """
+        self.collection.create_index(key)
+        for doc in upserts:
+            self.collection.replace_one({key: doc[key]}, dict(doc), upsert=True)
+        deletes = list(deletes)
+        if deletes:
+            self.collection.delete_many({key: {"$in": deletes}})
+
+class PyMongoBackend(MongoBackend):
+    """
+    One MongoClient (its own connection pool) per process. Every query carries
+    maxTimeMS, so a runaway pipeline is killed server-side instead of holding a
+    pooled connection.
+    """
+    name = "pymongo"
+
+    def __init__(self, uri: str, db: str, collection: str, timeout_ms: int = 5000,
+                 connect_timeout_ms: int = 5000, socket_timeout_ms: int = 30000,
+                 pool_size: int = 50, min_pool_size: int = 0,
+                 max_time_ms: int = 20000, batch_size: int = 2000):
+        from pymongo import MongoClient
+
+        self.client = MongoClient(
+            uri,
+            serverSelectionTimeoutMS=timeout_ms,
+            connectTimeoutMS=connect_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms or None,
+            maxPoolSize=pool_size,
+            minPoolSize=min_pool_size,
+        )
+        self.collection = self.client[db][collection]
+        self.meta = self.client[db][_META_COLLECTION]
+        self.max_time_ms = max_time_ms
+        self.batch_size = batch_size
+
+    def find(self, query, projection=None, skip=0, limit=0, batch_size=None):
+        cursor = self.collection.find(query, projection, skip=skip or 0, limit=limit or 0)
+        if self.max_time_ms:
+            cursor = cursor.max_time_ms(self.max_time_ms)
+        return cursor.batch_size(batch_size or self.batch_size)
+
+    def aggregate(self, pipeline, batch_size=None):
+        options = {"batchSize": batch_size or self.batch_size}
+        if self.max_time_ms:
+            options["maxTimeMS"] = self.max_time_ms
+        return self.collection.aggregate(pipeline, **options)
+
+    def estimated_count(self):
+        return self.collection.estimated_document_count()
+
+    def apply_changes(self, key, upserts, deletes=()):
+        # One round trip per batch instead of one per document.
+        from pymongo import DeleteMany, ReplaceOne
+
+        self.collection.create_index(key)
+        ops = [ReplaceOne({key: doc[key]}, doc, upsert=True) for doc in upserts]
+        deletes = list(deletes)
+        if deletes:
+            ops.append(DeleteMany({key: {"$in": deletes}}))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def explain(self, query, cap):
+        plan = self.collection.find(query or {}).explain().get("queryPlanner", {}).get("winningPlan", {})
+        total = self.estimated_count()
+        if _has_stage(plan, "COLLSCAN"):
+            return {"stage": "COLLSCAN", "scanned": total, "total": total}
+        options = {"limit": cap}
+        if self.max_time_ms:
+            options["maxTimeMS"] = self.max_time_ms
+        return {"stage": "IXSCAN", "scanned": self.collection.count_documents(query or {}, **options), "total": total}
+
+class MongitaBackend(MongoBackend):
+    name = "mongita"
+
+    def __init__(self, db: str, collection: str, directory: str = None):
+        if directory:
+            from mongita import MongitaClientDisk
+
+            self.client = MongitaClientDisk(directory)
+        else:
+            from mongita import MongitaClientMemory
+
+            self.client = MongitaClientMemory()
+        self.collection = self.client[db][collection]
+        self.meta = self.client[db][_META_COLLECTION]
+
+    # Mongita runs in-process: no pool, no server-side time limit, no batches.
+    def find(self, query, projection=None, skip=0, limit=0, batch_size=None):
+        pushed, residual = _split_filter(query or {})
+        # Index lookups come back unordered; _id order keeps pages stable (insertion order).
+        docs: Iterable[dict] = self.collection.find(pushed, sort=[("_id", 1)])
+        if residual:
+            docs = (d for d in docs if matches(d, residual))
+        if skip or limit:
+            docs = itertools.islice(docs, skip or 0, (skip or 0) + limit if limit else None)
+        if projection == {"_id": 0}:
+            return (_without_id(d) for d in docs)  # mongita hands out copies: pop in place
+        if projection:
+            return (_project(d, projection) for d in docs)
+        return docs
+
+    def aggregate(self, pipeline, batch_size=None):
+        # A leading $match goes through find() (index pushdown); the rest runs in Python,
+        # lazily, so the work happens where the caller iterates (like a server cursor).
+        if pipeline and isinstance(pipeline[0], dict) and list(pipeline[0]) == ["$match"]:
+            yield from run_pipeline(self.find(pipeline[0]["$match"]), pipeline[1:])
+        else:
+            yield from run_pipeline(self.find({}), pipeline)
+
+    def estimated_count(self):
+        return self.collection.count_documents({})
+
+    def explain(self, query, cap):
+        pushed, _ = _split_filter(query or {})
+        total = self.estimated_count()
+        if not any(field in pushed for field in INDEXED_FIELDS):
+            return {"stage": "COLLSCAN", "scanned": total, "total": total}
+        scanned = sum(1 for _ in itertools.islice(self.collection.find(pushed), cap))
+        return {"stage": "IXSCAN", "scanned": scanned, "total": total}
+
+_backend: Optional[MongoBackend] = None
+_lock = threading.Lock()
+
+def get_backend() -> MongoBackend:
+    """The configured backend, created and seeded on first use."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = create_backend(os.getenv("NL2DB_MONGO_BACKEND", "mongita"))
+    return _backend
+
+def current_backend() -> Optional[MongoBackend]:
+    """The backend if one was created already (never creates or seeds one)."""
+    return _backend
+
+def create_backend(kind: str, seed: bool = True) -> MongoBackend:
+    db = os.getenv("NL2DB_MONGO_DB", "demo_db")
+    collection = os.getenv("NL2DB_MONGO_COLLECTION", "customers")
+    if kind == "mongita":
+        backend: MongoBackend = MongitaBackend(db, collection, os.getenv("NL2DB_MONGITA_DIR") or None)
+    elif kind == "pymongo":
+        backend = PyMongoBackend(
+            os.getenv("NL2DB_MONGO_URI", "mongodb://127.0.0.1:27017/"), db, collection,
+            timeout_ms=int(os.getenv("NL2DB_MONGO_TIMEOUT_MS", "5000")),
+            connect_timeout_ms=int(os.getenv("NL2DB_MONGO_CONNECT_TIMEOUT_MS", "5000")),
+            socket_timeout_ms=int(os.getenv("NL2DB_MONGO_SOCKET_TIMEOUT_MS", "30000")),
+            pool_size=int(os.getenv("NL2DB_MONGO_POOL_SIZE", "50")),
+            min_pool_size=int(os.getenv("NL2DB_MONGO_MIN_POOL_SIZE", "0")),
+            max_time_ms=int(os.getenv("NL2DB_MONGO_MAX_TIME_MS", "20000")),
+            batch_size=int(os.getenv("NL2DB_MONGO_BATCH_SIZE", "2000")),
+        )
+    else:
+        raise ValueError(f"Unknown Mongo backend: {kind!r}")
+    if seed:
+        backend.ensure_seeded(SOURCE_JSON)
+    return backend
+
+def set_backend(backend: Optional[MongoBackend]) -> None:
+    """Swap the backend (tests/benchmarks); None re-reads the env on next use."""
+    global _backend
+    with _lock:
+        _backend = backend
+
+# ---------------------------
+# Filter evaluation (Python side)
+# ---------------------------
+_MISSING = object()
+_MONGITA_OPS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin"}
+
+def _coercible(cond) -> bool:
+    # Mongita compares in Python, where True == 1 and False == 0: a number or bool
+    # operand also matches values of the other type bracket.
+    values = cond.values() if isinstance(cond, dict) else [cond]
+    return any(isinstance(x, (int, float)) for v in values for x in (v if isinstance(v, list) else [v]))
+
+def _split_filter(flt: dict):
+    # Top-level plain-field conditions mongita evaluates correctly -> pushed; rest -> residual.
+    # A coercible condition is re-checked in Python: pushed as well when mongita's
+    # matches are a superset of Mongo's ($ne/$nin would drop some instead).
+    pushed, residual = {}, {}
+    for key, cond in flt.items():
+        plain = not key.startswith("$") and "." not in key
+        ops_ok = not isinstance(cond, dict) or (cond and all(op in _MONGITA_OPS for op in cond))
+        if plain and ops_ok and not isinstance(cond, list):
+            if not _coercible(cond):
+                pushed[key] = cond
+                continue
+            if not (isinstance(cond, dict) and {"$ne", "$nin"} & set(cond)):
+                pushed[key] = cond
+        residual[key] = cond
+    return pushed, residual
+
+def _has_stage(plan: Any, stage: str) -> bool:
+    # Explain plans nest as inputStage/inputStages (classic) or queryPlan (SBE).
+    if isinstance(plan, dict):
+        return plan.get("stage") == stage or any(_has_stage(v, stage) for v in plan.values())
+    if isinstance(plan, list):
+        return any(_has_stage(v, stage) for v in plan)
+    return False
+
+def _without_id(doc: dict) -> dict:
+    doc.pop("_id", None)
+    return doc
+
+def _get(doc: Any, path: str):
+    cur = doc
+    for part in path.split("."):
+        if isinstance(cur, dict) and part in cur:
+            cur = cur[part]
+        else:
+            return _MISSING
+    return cur
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def _eq(value, target) -> bool:
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(_eq(v, target) for v in value)
+    return value == target
+
+def _ordered(value, op: str, target) -> bool:
+    if value is _MISSING or value is None:
+        return False
+    if not ((_is_number(value) and _is_number(target)) or (type(value) is type(target) and isinstance(value, str))):
+        return False  # Mongo only compares within a type bracket
+    if op == "$gt":
+        return value > target
+    if op == "$gte":
+        return value >= target
+    if op == "$lt":
+        return value < target
+    return value <= target
+
+def _match_value(value, cond) -> bool:
+    if not (isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)):
+        return _eq(value, cond)
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = _eq(value, arg)
+        elif op == "$ne":
+            ok = not _eq(value, arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _ordered(value, op, arg)
+        elif op == "$in":
+            ok = any(_eq(value, a) for a in arg)
+        elif op == "$nin":
+            ok = not any(_eq(value, a) for a in arg)
+        elif op == "$exists":
+            ok = (value is not _MISSING) == bool(arg)
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+            ok = isinstance(value, str) and re.search(arg, value, flags) is not None
+        elif op == "$options":
+            ok = True
+        elif op == "$not":
+            ok = not _match_value(value, arg)
+        else:
+            raise NotImplementedError(f"filter operator {op}")
+        if not ok:
+            return False
+    return True
+
+def matches(doc: dict, flt: dict) -> bool:
+    """True when `doc` satisfies the Mongo filter `flt`."""
+    for key, cond in (flt or {}).items():
+        if key == "$and":
+            ok = all(matches(doc, f) for f in cond)
+        elif key == "$or":
+            ok = any(matches(doc, f) for f in cond)
+        elif key == "$nor":
+            ok = not any(matches(doc, f) for f in cond)
+        elif key.startswith("$"):
+            raise NotImplementedError(f"filter operator {key}")
+        else:
+            ok = _match_value(_get(doc, key), cond)
+        if not ok:
+            return False
+    return True
+
+# ---------------------------
+# Aggregation pipeline (Python side)
+# ---------------------------
+def evaluate(doc: dict, e):
+    """Value of expression `e` ("$field", {"$literal": ...}, an object of those, a constant) for `doc`."""
+    if isinstance(e, str) and e.startswith("$"):
+        v = _get(doc, e[1:])
+        return None if v is _MISSING else v
+    if isinstance(e, dict):
+        if list(e) == ["$literal"]:
+            return e["$literal"]
+        if any(k.startswith("$") for k in e):
+            raise NotImplementedError(f"expression {next(iter(e))}")
+        return {k: evaluate(doc, v) for k, v in e.items()}
+    return e
+
+def _project(doc: dict, spec: dict) -> dict:
+    include = {k: v for k, v in spec.items() if k != "_id" and v not in (0, False)}
+    if include:
+        out = {}
+        if spec.get("_id", 1) not in (0, False) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        for key, v in include.items():
+            if v in (1, True):
+                value = _get(doc, key)
+                if value is not _MISSING:
+                    out[key] = value
+            else:
+                out[key] = evaluate(doc, v)
+        return out
+    return {k: v for k, v in doc.items() if spec.get(k, 1) not in (0, False)}
+
+def sort_key(value):
+    """BSON-ish order: missing/null < numbers < strings < objects < arrays < bools."""
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if _is_number(value):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, dict):
+        return (3, json.dumps(value, sort_keys=True, default=str))
+    if isinstance(value, list):
+        return (4, json.dumps(value, default=str))
+    if isinstance(value, bool):
+        return (5, value)
+    return (6, str(value))
+
+def _group(docs: Iterable[dict], spec: dict) -> List[dict]:
+    id_spec = spec.get("_id")
+    accs = {name: next(iter(acc.items())) for name, acc in spec.items() if name != "_id"}
+    groups: "OrderedDict[str, list]" = OrderedDict()
+    for doc in docs:
+        key = evaluate(doc, id_spec)
+        hkey = json.dumps(key, sort_keys=True, default=str)
+        state = groups.get(hkey)
+        if state is None:
+            state = groups[hkey] = [key, {name: [] for name in accs}]
+        for name, (op, arg) in accs.items():
+            state[1][name].append(1 if op == "$count" else evaluate(doc, arg))
+
+    out = []
+    for key, values in groups.values():
+        row = {"_id": key}
+        for name, (op, _) in accs.items():
+            vals = values[name]
+            present = [v for v in vals if v is not None]
+            nums = [v for v in vals if _is_number(v)]
+            if op in ("$sum", "$count"):
+                row[name] = sum(nums)
+            elif op == "$avg":
+                row[name] = sum(nums) / len(nums) if nums else None
+            elif op == "$min":
+                row[name] = min(present, key=sort_key) if present else None
+            elif op == "$max":
+                row[name] = max(present, key=sort_key) if present else None
+            elif op == "$first":
+                row[name] = vals[0] if vals else None
+            elif op == "$last":
+                row[name] = vals[-1] if vals else None
+            elif op == "$push":
+                row[name] = vals
+            elif op == "$addToSet":
+                row[name] = list({json.dumps(v, sort_keys=True, default=str): v for v in vals}.values())
+            else:
+                raise NotImplementedError(f"accumulator {op}")
+        out.append(row)
+    return out
+
+def run_pipeline(docs: Iterable[dict], pipeline: list) -> Iterator[dict]:
+    """
+    Evaluate an aggregation pipeline over `docs` in Python. Supports $match,
+    $group, $project, $addFields/$set, $sort, $skip, $limit, $count, $unwind.
+    """
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op == "$match":
+            docs = [d for d in docs if matches(d, arg)]
+        elif op == "$group":
+            docs = _group(docs, arg)
+        elif op == "$project":
+            docs = [_project(d, arg) for d in docs]
+        elif op in ("$addFields", "$set"):
+            docs = [dict(d, **{k: evaluate(d, v) for k, v in arg.items()}) for d in docs]
+        elif op == "$sort":
+            docs = list(docs)
+            for field, direction in reversed(list(arg.items())):
+                docs.sort(key=lambda d, f=field: sort_key(_get(d, f)), reverse=direction < 0)
+        elif op == "$skip":
+            docs = list(docs)[arg:]
+        elif op == "$limit":
+            docs = list(itertools.islice(docs, arg))
+        elif op == "$count":
+            n = sum(1 for _ in docs)
+            docs = [{arg: n}] if n else []
+        elif op == "$unwind":
+            path = (arg["path"] if isinstance(arg, dict) else arg)[1:]
+            docs = [
+                dict(d, **{path: item})
+                for d in docs
+                for item in (_get(d, path) if isinstance(_get(d, path), list) else [])
+            ]
+        else:
+            raise NotImplementedError(f"pipeline stage {op}")
+    return iter(docs)
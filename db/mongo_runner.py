@@ -1,38 +1,444 @@
 # db/mongo_runner.py
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+import duckdb
 import pandas as pd
-from pymongo import MongoClient
+import pyarrow as pa
 
-# --- 1) Connect to MongoDB (no auth, default localhost:27017) ---
-_client = MongoClient("mongodb://127.0.0.1:27017/")
-_db = _client["demo_db"]
-_collection = _db["customers"]
+from db.cost_guard import AUTO_LIMIT, TRUNCATED, cap_rows, check_deadline, guard_aggregate, guard_find
+from db.mongo_backends import SOURCE_JSON, current_backend, get_backend
+from db.mongo_sql import Untranslatable, compile_find, compile_pipeline
+from db.query_runner import iter_query_batches, run_query, to_pandas
+from db.result_cache import result_cache
+from db.rollups import answer_pipeline, count_mongo, mongo_rollup
+from db.sql_ast import QueryValidationError
+from db.tracing import annotate, metrics, span
+
+# --- 1) Backend (see db/mongo_backends.py) ---
+# In-process mongita by default (NL2DB_MONGO_BACKEND=pymongo for a real mongod),
+# seeded from SOURCE_JSON and created on first query, so importing this module
+# never opens a connection.
+def _get_backend():
+    return get_backend()
+
+# --- 2) Result-cache keys (canonical JSON + data version) ---
+# SOURCE_JSON (the seed file) mtime/size are part of the key.
+# A pymongo collection may change behind our back, so entries also expire.
+RESULT_TTL_SECONDS = float(os.getenv("NL2DB_MONGO_RESULT_TTL", "60"))
+_generation = 0
+_mirrored = 0  # _generation the DuckDB mirror (section 3) holds
+
+def invalidate_mongo_cache(mirrored: bool = False):
+    """
+    Call after writing to the collection; drops cached Mongo results. Until a
+    call with `mirrored` (the DuckDB mirror holds the write too, db/refresh.py)
+    every spec runs on the backend.
+    """
+    global _generation, _mirrored
+    _generation += 1
+    if mirrored:
+        _mirrored = _generation
+    result_cache.invalidate("mongo")
+
+def data_version():
+    """Version of the collection contents (seed file stats + local write generation)."""
+    try:
+        st = os.stat(SOURCE_JSON)
+        return (_generation, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (_generation, None)
+
+def shared_version():
+    """
+    data_version() for the cross-process result-cache tier: None once this
+    process has written (its generation means nothing to other processes).
+    """
+    if _generation:
+        return None
+    try:
+        st = os.stat(SOURCE_JSON)
+    except OSError:
+        return None
+    return (os.path.abspath(SOURCE_JSON), st.st_mtime_ns, st.st_size)
+
+def _canonical_filter(obj):
+    # Filter documents are order-insensitive: sort keys recursively.
+    if isinstance(obj, dict):
+        return {k: _canonical_filter(obj[k]) for k in sorted(obj)}
+    if isinstance(obj, list):
+        return [_canonical_filter(v) for v in obj]
+    return obj
+
+def _canonical_pipeline(pipeline: list):
+    # Only $match is order-insensitive; $sort/$project/$group key order is meaningful.
+    out = []
+    for stage in pipeline:
+        if isinstance(stage, dict) and list(stage) == ["$match"]:
+            stage = {"$match": _canonical_filter(stage["$match"])}
+        out.append(stage)
+    return out
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+# `_id: 0` pushdown: the ObjectId is never shown, so the server should not send
+# it (and we should not decode it).
+_ID_STAGES = {"$group", "$project", "$replaceRoot", "$replaceWith", "$count", "$bucket", "$bucketAuto", "$facet", "$sortByCount"}
+
+def _projection_without_id(projection: dict = None) -> dict:
+    if not projection:
+        return {"_id": 0}
+    if "_id" in projection:
+        return projection
+    return dict(projection, _id=0)
+
+def _pipeline_without_id(pipeline: list) -> list:
+    # Stages that reshape documents decide _id themselves (e.g. $group keys).
+    if any(isinstance(stage, dict) and _ID_STAGES & set(stage) for stage in pipeline):
+        return pipeline
+    return list(pipeline) + [{"$project": {"_id": 0}}]
+
+def _decode(docs):
+    """
+    Documents -> column lists (one pass, no intermediate list of dicts).
+    Returns (columns, rows). An _id column of ObjectIds/nulls is dropped.
+    Raises QueryTimeout once decoding runs past the query time limit.
+    """
+    columns, rows = {}, 0
+    started = time.monotonic()
+    for doc in docs:
+        for k, v in doc.items():
+            col = columns.get(k)
+            if col is None:
+                col = columns[k] = [None] * rows
+            col.append(v)
+        rows += 1
+        for col in columns.values():
+            if len(col) < rows:
+                col.append(None)
+        if not rows & 1023:
+            check_deadline(started)
+    ids = columns.get("_id")
+    if ids is not None and all(v is None or type(v).__name__ == "ObjectId" for v in ids):
+        del columns["_id"]
+    return columns, rows
+
+def _to_arrow(columns):
+    try:
+        return pa.table(columns)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None  # mixed-type column: pandas object column instead, not cached
+
+def _fetch(cursor, limited: bool = False):
+    # Cursor iteration is where the server round-trips happen. `limited`: the
+    # cost guard's automatic limit applies (AUTO_LIMIT + 1 fetched, see cap_rows).
+    with span("mongo_execute") as sp:
+        columns, rows = _decode(cursor)
+        sp["rows"] = rows
+    with span("to_arrow", rows=rows):
+        table = _to_arrow(columns)
+    truncated = limited and rows > AUTO_LIMIT
+    if truncated:
+        table = cap_rows(table) if table is not None else None
+        columns, rows = {k: v[:AUTO_LIMIT] for k, v in columns.items()}, AUTO_LIMIT
+    return table, columns, rows, truncated
+
+def _cached(key, run):
+    # key[2] is data_version(); the shared tier gets the same key on shared_version().
+    version = shared_version() if result_cache.enabled else None
+    shared = key[:2] + (version,) + key[3:] if version is not None else None
+    cached = result_cache.get(key, shared) if result_cache.enabled else None
+    if result_cache.enabled:
+        annotate(result_cache="hit" if cached is not None else "miss")
+    if cached is not None:
+        with span("to_pandas", rows=cached.num_rows):
+            return to_pandas(cached)
+    table, columns, rows, truncated = run()
+    if table is not None and result_cache.enabled:
+        result_cache.put(key, table, ttl_seconds=RESULT_TTL_SECONDS, shared_key=shared)
+    with span("to_pandas", rows=rows):
+        if table is not None:
+            return to_pandas(table)
+        df = pd.DataFrame(columns)  # mixed-type columns: not cached, so not marked in Arrow
+        if truncated:
+            df.attrs[TRUNCATED] = AUTO_LIMIT
+        return df
+
+# --- 3) Columnar engine ---
+# The collection is mirrored into a DuckDB table ingested from SOURCE_JSON
+# (Catalog.collection_connection); specs are compiled to SQL (db/mongo_sql.py)
+# and run there vectorized. Specs the compiler does not translate, and every
+# spec after a write the mirror does not hold yet, run on the backend. A mongod
+# written by other clients is only seen by the backend: run it with
+# NL2DB_MONGO_ENGINE=backend.
+#   NL2DB_MONGO_ENGINE  "duckdb" (default) | "backend" (always the Mongo backend)
+#   NL2DB_MONGO_VERIFY  share of DuckDB-run specs also run on the backend and
+#                       compared; the backend's answer wins a mismatch (default 0)
+ENGINE = os.getenv("NL2DB_MONGO_ENGINE", "duckdb")
+VERIFY_RATE = float(os.getenv("NL2DB_MONGO_VERIFY", "0"))
+
+_engine_stats = {"duckdb": 0, "backend": 0, "untranslated": 0, "sql_errors": 0, "verified": 0, "mismatches": 0}
+_engine_lock = threading.Lock()
+
+def _count(name: str) -> None:
+    with _engine_lock:
+        _engine_stats[name] += 1
+
+def engine_stats():
+    with _engine_lock:
+        return dict(_engine_stats)
+
+metrics.register_source("mongo_engine", engine_stats)
+
+def _compiled(compile_spec):
+    # (connection, SQL) for the spec, or None to use the backend.
+    if ENGINE != "duckdb" or _mirrored != _generation:
+        return None
+    from db.catalog import get_catalog  # the catalog reads this module's backend
+
+    catalog = get_catalog()
+    fields = catalog.field_map()
+    if fields is None:
+        return None
+    try:
+        with span("mongo_compile"):
+            sql = compile_spec(fields)
+    except Untranslatable as e:
+        _count("untranslated")
+        annotate(mongo_untranslated=str(e))
+        return None
+    return catalog.collection_connection(), sql
+
+def _on_duckdb(compile_spec, run_sql, on_backend):
+    """
+    run_sql(conn, sql) for the compiled spec, else on_backend(); the backend
+    also answers when DuckDB fails on the SQL (e.g. a regex RE2 rejects).
+    Cost-guard rejections and timeouts propagate like on the backend.
+    """
+    compiled = _compiled(compile_spec)
+    if compiled is not None:
+        try:
+            out = run_sql(*compiled)
+        except (duckdb.Error, QueryValidationError) as e:
+            _count("sql_errors")
+            annotate(mongo_sql_error=type(e).__name__)
+        else:
+            _count("duckdb")
+            annotate(mongo_engine="duckdb")
+            return out
+    _count("backend")
+    annotate(mongo_engine="backend")
+    return on_backend()
+
+def _cell(v):
+    if hasattr(v, "tolist"):  # numpy scalars / arrays
+        v = v.tolist()
+    if v is None or v is pd.NA or (isinstance(v, float) and math.isnan(v)):
+        return None
+    if isinstance(v, float):
+        return round(v, 9)
+    if isinstance(v, (list, tuple)):
+        return tuple(_cell(x) for x in v)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _cell(x)) for k, x in v.items()))
+    return v
+
+def same_rows(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    """
+    Same columns and the same rows in any order (floats to 9 digits, NaN = None).
+    A column of nulls only equals no column: the field is missing from every document.
+    """
+    if len(a) == len(b) == 0:
+        return True  # no documents, no columns: Mongo results have no schema
+    kept = lambda df, other: df[[c for c in df.columns if c in other.columns or df[c].notna().any()]]
+    a, b = kept(a, b), kept(b, a)
+    if sorted(a.columns) != sorted(b.columns) or len(a) != len(b):
+        return False
+    cols = sorted(a.columns)
+    rows = lambda df: sorted((tuple(_cell(v) for v in r) for r in df[cols].itertuples(index=False, name=None)), key=repr)
+    return rows(a) == rows(b)
+
+def _verified(df: pd.DataFrame, on_backend) -> pd.DataFrame:
+    # Sampled check of a DuckDB answer against the Mongo backend (NL2DB_MONGO_VERIFY).
+    if VERIFY_RATE <= 0 or random.random() >= VERIFY_RATE:
+        return df
+    with span("mongo_verify"):
+        expected = on_backend()
+    _count("verified")
+    if same_rows(df, expected):
+        annotate(mongo_verified=True)
+        return df
+    _count("mismatches")
+    annotate(mongo_verified=False)
+    return expected
+
+# --- 4) Run a MongoDB query (find) ---
+def _backend_find(query: dict, projection: dict = None):
+    def _run():
+        backend = _get_backend()
+        # EXPLAIN-based admission (db/cost_guard.py): may reject, or cap a listing find.
+        limit = guard_find(backend, query, data_version(), key[3])
+        return _fetch(backend.find(query, _projection_without_id(projection), limit=limit), limited=bool(limit))
+
+    key = ("mongo", "find", data_version(), _dumps(_canonical_filter(query or {})), _dumps(projection))
+    return _cached(key, _run)
 
-# --- 2) Run a MongoDB query (find) ---
 def run_mongo_query(query: dict, projection: dict = None):
     """
     Run a MongoDB find query and return results as pandas DataFrame.
     :param query: MongoDB filter dict (e.g., {"Age": {"$gt": 30}})
     :param projection: MongoDB projection dict (e.g., {"Age": 1, "Spending_Score": 1})
     """
-    cursor = _collection.find(query, projection)
-    df = pd.DataFrame(list(cursor))
-    if "_id" in df.columns:
-        df.drop(columns=["_id"], inplace=True)
-    return df
+    on_backend = lambda: _backend_find(query, projection)
+    return _on_duckdb(
+        lambda fields: compile_find(fields, query, projection),
+        lambda conn, sql: _verified(run_query(conn, sql), on_backend),
+        on_backend,
+    )
+
+# --- 5) Run a MongoDB aggregation pipeline ---
+def rollup_version(backend):
+    """
+    Version of the collection contents the rollup (db/rollups.py) mirrors: this
+    process writes through invalidate_mongo_cache(); a real mongod may also be
+    written by others, so there the rollup expires as often as cached results.
+    """
+    if backend.name == "pymongo":
+        return (_generation, int(time.monotonic() // max(RESULT_TTL_SECONDS, 1.0)))
+    return (_generation,)
+
+def _from_rollup(backend, pipeline: list):
+    # A [$match on dimensions] + $group/$count head is answered from the
+    # collection's rollup cells (db/rollups.py) instead of scanning it: None = scan.
+    from db.catalog import get_catalog  # the catalog reads this module's backend
+
+    rollup = mongo_rollup(backend, rollup_version(backend), get_catalog().rollup_dims())
+    if rollup is None:
+        return None
+    with span("mongo_rollup"):
+        docs = answer_pipeline(rollup, pipeline)
+    count_mongo(docs is not None)
+    if docs is not None:
+        annotate(rollup=True)
+    return docs
+
+class _NoRollup(Exception):
+    pass
+
+def _backend_aggregate(pipeline: list, rollup_only: bool = False):
+    def _run():
+        backend = _get_backend()
+        docs = _from_rollup(backend, pipeline)
+        if docs is not None:
+            return _fetch(iter(docs))
+        if rollup_only:
+            raise _NoRollup()
+        guarded = guard_aggregate(backend, pipeline, data_version(), key[3])
+        return _fetch(backend.aggregate(_pipeline_without_id(guarded)), limited=guarded is not pipeline)
+
+    key = ("mongo", "aggregate", data_version(), _dumps(_canonical_pipeline(pipeline)))
+    return _cached(key, _run)
 
-# --- 3) Run a MongoDB aggregation pipeline ---
 def run_mongo_aggregate(pipeline: list):
     """
     Run a MongoDB aggregation pipeline and return results as pandas DataFrame.
     :param pipeline: list of MongoDB aggregation stages
     """
-    cursor = _collection.aggregate(pipeline)
-    df = pd.DataFrame(list(cursor))
-    if "_id" in df.columns:
-        df.drop(columns=["_id"], inplace=True)
-    return df
+    if current_backend() is not None:
+        # Rollup cells (or a cached answer) beat even a vectorized scan.
+        try:
+            return _backend_aggregate(pipeline, rollup_only=True)
+        except _NoRollup:
+            pass
+    on_backend = lambda: _backend_aggregate(pipeline)
+    return _on_duckdb(
+        lambda fields: compile_pipeline(fields, pipeline),
+        lambda conn, sql: _verified(run_query(conn, sql), on_backend),
+        on_backend,
+    )
+
+# --- 6) Streaming / pagination ---
+#   NL2DB_ROW_BUDGET  default cap on documents a stream yields (0 = unlimited)
+ROW_BUDGET = int(os.getenv("NL2DB_ROW_BUDGET", "100000"))
+
+def _iter_frames(cursor, batch_size: int):
+    docs = iter(cursor)
+    while True:
+        columns, rows = _decode(itertools.islice(docs, batch_size))
+        if not rows:
+            return
+        table = _to_arrow(columns)
+        yield to_pandas(table) if table is not None else pd.DataFrame(columns)
+
+def iter_mongo_batches(query: dict, projection: dict = None, batch_size: int = 1000, row_budget: int = None):
+    """
+    Stream a find as DataFrames of up to `batch_size` documents (the cursor's
+    server batch size too). At most `row_budget` documents (default ROW_BUDGET).
+    """
+    budget = ROW_BUDGET if row_budget is None else row_budget
+    compiled = _compiled(lambda fields: compile_find(fields, query, projection))
+    if compiled is not None:
+        _count("duckdb")
+        for batch in iter_query_batches(*compiled, batch_size=batch_size, row_budget=budget):
+            yield to_pandas(batch)
+        return
+    backend = _get_backend()
+    guard_find(backend, query, data_version(), _dumps(_canonical_filter(query or {})), limit=budget)
+    cursor = backend.find(query, _projection_without_id(projection), limit=budget, batch_size=batch_size)
+    yield from _iter_frames(cursor, batch_size)
+
+def iter_mongo_aggregate_batches(pipeline: list, batch_size: int = 1000, row_budget: int = None):
+    """Streaming twin of run_mongo_aggregate (a $limit stage enforces the budget)."""
+    budget = ROW_BUDGET if row_budget is None else row_budget
+    if budget:
+        pipeline = list(pipeline) + [{"$limit": budget}]
+    compiled = _compiled(lambda fields: compile_pipeline(fields, pipeline))
+    if compiled is not None:
+        _count("duckdb")
+        for batch in iter_query_batches(*compiled, batch_size=batch_size, row_budget=budget):
+            yield to_pandas(batch)
+        return
+    backend = _get_backend()
+    docs = _from_rollup(backend, pipeline)
+    if docs is not None:
+        yield from _iter_frames(docs, batch_size)
+        return
+    guard_aggregate(backend, pipeline, data_version(), _dumps(_canonical_pipeline(pipeline)))  # rejects only
+    yield from _iter_frames(backend.aggregate(_pipeline_without_id(pipeline), batch_size=batch_size), batch_size)
+
+def run_mongo_query_page(query: dict, projection: dict = None, limit: int = 100, offset: int = 0):
+    """
+    One page of a find (server-side skip/limit). Returns (DataFrame, has_more).
+    """
+    def _run():
+        backend = _get_backend()
+        guard_find(backend, query, data_version(), key[3], limit=limit + 1)
+        return _fetch(backend.find(query, _projection_without_id(projection), skip=offset, limit=limit + 1))
+
+    def on_backend():
+        return _cached(key, _run)
+
+    key = ("mongo", "find", data_version(), _dumps(_canonical_filter(query or {})), _dumps(projection), offset, limit)
+    df = _on_duckdb(
+        lambda fields: compile_find(fields, query, projection, skip=offset, limit=limit + 1),
+        lambda conn, sql: _verified(run_query(conn, sql), on_backend),
+        on_backend,
+    )
+    return df.iloc[:limit], len(df) > limit
+
+def run_mongo_aggregate_page(pipeline: list, limit: int = 100, offset: int = 0):
+    """
+    One page of an aggregation ($skip/$limit appended). Returns (DataFrame, has_more).
+    """
+    df = run_mongo_aggregate(list(pipeline) + [{"$skip": offset}, {"$limit": limit + 1}])
+    return df.iloc[:limit], len(df) > limit
 
-# --- 4) Demo (optional manual test) ---
+# --- 7) Demo (optional manual test) ---
 if __name__ == "__main__":
     # Simple filter
     print(run_mongo_query({"Genre": "Male"}).head())
@@ -42,4 +448,4 @@ if __name__ == "__main__":
         {"$match": {"Genre": "Male"}},
         {"$group": {"_id": None, "avg_income": {"$avg": "$Annual_Income_kUSD"}}}
     ]
-    print(run_mongo_aggregate(pipeline))
\ No newline at end of file
+    print(run_mongo_aggregate(pipeline))
@@ -0,0 +1,404 @@
+# db/mongo_sql.py
+"""
+MongoDB find / aggregate specs compiled to DuckDB SQL, so questions asked in the
+MongoDB language run vectorized on the table that mirrors the collection
+(db/mongo_runner.py sends them through db/query_runner.py: result cache, cost
+guard, prepared statements and rollups all apply).
+
+A FieldMap names the table and, per document field, its column (the
+collection's mirror table, Catalog.field_map in db/catalog.py):
+
+    {"$match": {"Age": {"$gt": 30}}}, {"$group": {"_id": "$Genre", "avg": {"$avg": "$Annual_Income_kUSD"}}}
+ -> SELECT "customers"."Genre" AS "_id", AVG("customers"."Annual_Income_kUSD") AS "avg"
+    FROM "customers" WHERE "customers"."Age" > 30 GROUP BY "customers"."Genre"
+
+Stages fold into one SELECT while SQL clause order allows it (WHERE, GROUP BY,
+HAVING, ORDER BY, LIMIT) and nest as subqueries otherwise.
+
+Translated: filters with $eq $ne $gt $gte $lt $lte $in $nin $exists $regex
+($options "i") $not $and $or $nor; projections (include / exclude, "$field",
+$literal, objects of those); stages $match $group ($sum $avg $min $max $count)
+$project $addFields/$set $sort $skip $limit $count. Anything else raises
+Untranslatable and the spec runs on the Mongo backend instead.
+
+Mongo semantics kept: comparisons only match within a type bracket (no string
+vs number coercion), {"f": null} matches NULL, $ne/$nin/$not match NULL, $sort
+puts nulls first, and $group/$count emit nothing for no input. A NULL column
+counts as a missing field ($exists).
+"""
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from db.sql_ast import sql_literal
+from db.storage import NUMERIC_TYPES
+
+class Untranslatable(ValueError):
+    """The spec uses something the compiler does not translate (run it on the backend)."""
+
+# Value kinds a field can hold; None = the field is not in the table (always missing).
+_INT, _FLOAT, _STRING, _BOOL, _OTHER = "int", "float", "string", "bool", "other"
+_INT_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT"}
+
+def _kind(ctype: str) -> str:
+    base = ctype.split("(")[0].upper()
+    if base in _INT_TYPES:
+        return _INT
+    if base in NUMERIC_TYPES:
+        return _FLOAT
+    if base == "VARCHAR":
+        return _STRING
+    if base == "BOOLEAN":
+        return _BOOL
+    return _OTHER
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+class FieldMap:
+    """
+    Document fields of the collection -> columns of the DuckDB table mirroring
+    it. `key` (a document field) breaks $sort ties, the way insertion order
+    does on the backend.
+    """
+    __slots__ = ("table", "fields", "key")
+
+    def __init__(self, table: str, columns: List[Tuple[str, str, str]], key: str = None):
+        # columns: (document field, table column, DuckDB type), in document order
+        self.table = table
+        self.fields = OrderedDict(
+            (field, (f"{_quote(table)}.{_quote(column)}", _kind(ctype))) for field, column, ctype in columns
+        )
+        self.key = self.fields.get(key)
+
+# ---------------------------
+# Filters
+# ---------------------------
+def _bracket(kind: Optional[str], value) -> bool:
+    # Mongo compares a value only with values of the same type bracket.
+    if isinstance(value, bool):
+        return kind == _BOOL
+    if isinstance(value, (int, float)):
+        return kind in (_INT, _FLOAT)
+    if isinstance(value, str):
+        return kind == _STRING
+    raise Untranslatable(f"value {value!r}")
+
+def _in(expr: str, kind, values) -> str:
+    if not isinstance(values, list):
+        raise Untranslatable("$in/$nin need an array")
+    parts = []
+    if any(v is None for v in values):
+        parts.append(f"{expr} IS NULL")
+    same = [v for v in values if v is not None and _bracket(kind, v)]
+    if same:
+        parts.append(f"{expr} IN ({', '.join(sql_literal(v) for v in same)})")
+    return "(" + " OR ".join(parts) + ")" if parts else "FALSE"
+
+def _negate(cond: str) -> str:
+    # Conditions may be NULL for NULL columns; a negation must still match those rows.
+    return f"NOT COALESCE({cond}, FALSE)"
+
+def _condition(expr: str, kind, cond) -> str:
+    if not (isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)):
+        return _condition(expr, kind, {"$eq": cond})
+    parts = []
+    for op, arg in cond.items():
+        if op == "$eq":
+            part = f"{expr} IS NULL" if arg is None else (f"{expr} = {sql_literal(arg)}" if _bracket(kind, arg) else "FALSE")
+        elif op == "$ne":
+            part = f"{expr} IS NOT NULL" if arg is None else (
+                f"{expr} IS DISTINCT FROM {sql_literal(arg)}" if _bracket(kind, arg) else "TRUE")
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            sign = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[op]
+            if arg is None:
+                part = f"{expr} IS NULL" if op in ("$gte", "$lte") else "FALSE"
+            else:
+                part = f"{expr} {sign} {sql_literal(arg)}" if _bracket(kind, arg) else "FALSE"
+        elif op == "$in":
+            part = _in(expr, kind, arg)
+        elif op == "$nin":
+            part = _negate(_in(expr, kind, arg))
+        elif op == "$exists":
+            part = f"{expr} IS NOT NULL" if arg else f"{expr} IS NULL"
+        elif op == "$regex":
+            options = cond.get("$options", "")
+            if not isinstance(arg, str) or options not in ("", "i"):
+                raise Untranslatable("$regex")
+            flags = ", 'i'" if options else ""
+            part = f"regexp_matches({expr}, {sql_literal(arg)}{flags})" if kind == _STRING else "FALSE"
+        elif op == "$options":
+            continue
+        elif op == "$not":
+            part = _negate(_condition(expr, kind, arg))
+        else:
+            raise Untranslatable(f"filter operator {op}")
+        parts.append(part)
+    return " AND ".join(f"({p})" for p in parts) if len(parts) > 1 else parts[0]
+
+def _filter(flt, fields) -> str:
+    if not isinstance(flt, dict):
+        raise Untranslatable("filter must be an object")
+    parts = []
+    for key, cond in flt.items():
+        if key in ("$and", "$or", "$nor"):
+            if not isinstance(cond, list) or not cond:
+                raise Untranslatable(f"{key} needs a non-empty array")
+            subs = [f"({_filter(f, fields)})" for f in cond]
+            if key == "$and":
+                parts.append(" AND ".join(subs))
+            elif key == "$or":
+                parts.append(" OR ".join(subs))
+            else:
+                parts.append(_negate("(" + " OR ".join(subs) + ")"))
+        elif key.startswith("$") or "." in key:
+            raise Untranslatable(f"filter key {key}")
+        else:
+            expr, kind = fields.get(key, ("NULL", None))
+            parts.append(_condition(expr, kind, cond))
+    if not parts:
+        return "TRUE"
+    return " AND ".join(f"({p})" for p in parts) if len(parts) > 1 else parts[0]
+
+# ---------------------------
+# Expressions and projections
+# ---------------------------
+def _expression(e, fields) -> Tuple[str, Optional[str]]:
+    if isinstance(e, str) and e.startswith("$"):
+        if "." in e:
+            raise Untranslatable(f"path {e}")
+        return fields.get(e[1:], ("NULL", None))
+    if isinstance(e, dict):
+        if list(e) == ["$literal"]:
+            value = e["$literal"]
+            if isinstance(value, (list, dict)):
+                raise Untranslatable("$literal array/object")
+            return ("NULL", None) if value is None else (sql_literal(value), _kind_of(value))
+        if not e or any(k.startswith("$") for k in e):
+            raise Untranslatable(f"expression {next(iter(e), '{}')}")
+        items = ", ".join(f"{sql_literal(k)}: {_expression(v, fields)[0]}" for k, v in e.items())
+        return "{" + items + "}", _OTHER
+    if e is None:
+        return "NULL", None
+    if isinstance(e, (list, dict)):
+        raise Untranslatable(f"expression {e!r}")
+    return sql_literal(e), _kind_of(e)
+
+def _kind_of(value) -> str:
+    if isinstance(value, bool):
+        return _BOOL
+    if isinstance(value, int):
+        return _INT
+    if isinstance(value, float):
+        return _FLOAT
+    return _STRING
+
+def _project(spec, fields) -> "OrderedDict[str, Tuple[str, Optional[str]]]":
+    if not isinstance(spec, dict):
+        raise Untranslatable("projection must be an object")
+    include = {k: v for k, v in spec.items() if k != "_id" and v not in (0, False)}
+    if any("." in k or k.startswith("$") for k in spec):
+        raise Untranslatable("projection path")
+    out = OrderedDict()
+    if include:
+        if "_id" in fields and spec.get("_id", 1) not in (0, False):
+            out["_id"] = fields["_id"]
+        for key, v in include.items():
+            if v in (1, True):
+                if key in fields:  # a missing field is left out, like Mongo
+                    out[key] = fields[key]
+            else:
+                out[key] = _expression(v, fields)
+    else:
+        out.update((k, f) for k, f in fields.items() if spec.get(k, 1) not in (0, False))
+    if not out:
+        raise Untranslatable("empty projection")
+    return out
+
+# ---------------------------
+# Pipelines
+# ---------------------------
+_GROUPED_ANY = "count(*) > 0"  # $group/$count without keys: no document in, none out
+
+class _Select:
+    """One SELECT being built; stages fold into it while SQL clause order allows."""
+    __slots__ = ("source", "fields", "where", "group", "having", "order", "limit", "offset")
+
+    def __init__(self, source: str, fields):
+        self.source = source
+        self.fields = fields      # output name -> (SQL expression, kind)
+        self.where: List[str] = []
+        self.group: Optional[List[str]] = None   # None = not aggregated
+        self.having: List[str] = []
+        self.order: List[Tuple[str, int]] = []
+        self.limit: Optional[int] = None
+        self.offset = 0
+
+    def sql(self) -> str:
+        cols = ", ".join(f"{expr} AS {_quote(name)}" for name, (expr, _) in self.fields.items())
+        parts = [f"SELECT {cols} FROM {self.source}"]
+        if self.where:
+            parts.append("WHERE " + " AND ".join(f"({w})" for w in self.where))
+        if self.group:
+            parts.append("GROUP BY " + ", ".join(self.group))
+        if self.having:
+            parts.append("HAVING " + " AND ".join(f"({h})" for h in self.having))
+        if self.order:
+            parts.append("ORDER BY " + ", ".join(
+                f"{expr} {'ASC NULLS FIRST' if d > 0 else 'DESC NULLS LAST'}" for expr, d in self.order))
+        if self.limit is not None:
+            parts.append(f"LIMIT {self.limit}")
+        if self.offset:
+            parts.append(f"OFFSET {self.offset}")
+        return " ".join(parts)
+
+    def wrap(self, depth: int) -> "_Select":
+        # This SELECT as the source of the next one (its sort order carried over by name).
+        alias = f"_s{depth}"
+        names = {expr: name for name, (expr, _) in self.fields.items()}
+        outer = _Select(f"({self.sql()}) AS {alias}",
+                        OrderedDict((n, (f"{alias}.{_quote(n)}", k)) for n, (_, k) in self.fields.items()))
+        if all(expr in names for expr, _ in self.order):
+            outer.order = [(f"{alias}.{_quote(names[expr])}", d) for expr, d in self.order]
+        return outer
+
+def _number(value, name: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise Untranslatable(f"{name} needs a non-negative integer")
+    return value
+
+def _group(sel: _Select, spec) -> None:
+    if not isinstance(spec, dict) or "_id" not in spec:
+        raise Untranslatable("$group needs an _id")
+    id_spec, keys = spec["_id"], []
+    if isinstance(id_spec, str) and id_spec.startswith("$"):
+        id_expr, id_kind = _expression(id_spec, sel.fields)
+        if id_kind is not None:
+            keys.append(id_expr)
+    elif isinstance(id_spec, dict) and list(id_spec) != ["$literal"]:
+        if any(not (isinstance(v, str) and v.startswith("$")) for v in id_spec.values()):
+            raise Untranslatable("$group _id object of fields only")
+        id_expr, id_kind = _expression(id_spec, sel.fields)
+        keys = [e for e, k in (_expression(v, sel.fields) for v in id_spec.values()) if k is not None]
+    else:
+        id_expr, id_kind = _expression(id_spec, sel.fields)
+
+    # A null _id is left out, as db/mongo_runner.py drops it from backend results.
+    out = OrderedDict([("_id", (id_expr, id_kind))] if id_kind is not None else [])
+    for name, acc in spec.items():
+        if name == "_id":
+            continue
+        if "." in name or name.startswith("$") or not isinstance(acc, dict) or len(acc) != 1:
+            raise Untranslatable(f"accumulator {name}")
+        (op, arg), = acc.items()
+        if op == "$count" and arg == {}:
+            out[name] = ("count(*)", _INT)
+            continue
+        if op == "$sum" and isinstance(arg, (int, float)) and not isinstance(arg, bool):
+            out[name] = (f"CAST(count(*) * {sql_literal(arg)} AS {'BIGINT' if isinstance(arg, int) else 'DOUBLE'})",
+                         _kind_of(arg))
+            continue
+        if not (isinstance(arg, str) and arg.startswith("$")):
+            raise Untranslatable(f"accumulator {op} argument")
+        expr, kind = _expression(arg, sel.fields)
+        numeric = kind in (_INT, _FLOAT)
+        if op == "$sum":
+            if kind == _INT:
+                out[name] = (f"CAST(COALESCE(sum({expr}), 0) AS BIGINT)", _INT)
+            elif kind == _FLOAT:
+                out[name] = (f"CAST(COALESCE(sum({expr}), 0) AS DOUBLE)", _FLOAT)
+            else:  # $sum skips non-numbers
+                out[name] = ("0", _INT)
+        elif op == "$avg":
+            out[name] = (f"avg({expr})", _FLOAT) if numeric else ("NULL", None)
+        elif op in ("$min", "$max"):
+            out[name] = (f"{op[1:]}({expr})", kind) if kind is not None else ("NULL", None)
+        else:
+            raise Untranslatable(f"accumulator {op}")
+
+    sel.fields = out
+    sel.group = keys
+    sel.order = []
+    if not keys:
+        sel.having.append(_GROUPED_ANY)
+
+def compile_pipeline(fmap: FieldMap, pipeline: list) -> str:
+    """DuckDB SQL for an aggregation `pipeline` over the collection (see the module docstring)."""
+    if not isinstance(pipeline, list):
+        raise Untranslatable("pipeline must be an array")
+    sel = _Select(_quote(fmap.table), OrderedDict(fmap.fields))
+    depth = 0
+
+    def fresh():
+        nonlocal sel, depth
+        depth += 1
+        sel = sel.wrap(depth)
+
+    for stage in pipeline:
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise Untranslatable("stage must have exactly one operator")
+        (op, arg), = stage.items()
+        if op == "$match":
+            if arg == {}:
+                continue
+            if sel.limit is not None or sel.offset:
+                fresh()
+            (sel.having if sel.group is not None else sel.where).append(_filter(arg, sel.fields))
+        elif op == "$group":
+            if sel.group is not None or sel.limit is not None or sel.offset:
+                fresh()
+            _group(sel, arg)
+        elif op == "$project":
+            sel.fields = _project(arg, sel.fields)
+        elif op in ("$addFields", "$set"):
+            if not isinstance(arg, dict) or any("." in k or k.startswith("$") for k in arg):
+                raise Untranslatable(op)
+            fields = OrderedDict(sel.fields)
+            for key, value in arg.items():
+                fields[key] = _expression(value, sel.fields)
+            sel.fields = fields
+        elif op == "$sort":
+            if not isinstance(arg, dict) or not arg or any(d not in (1, -1) for d in arg.values()):
+                raise Untranslatable("$sort")
+            if sel.limit is not None or sel.offset:
+                fresh()
+            order = []
+            for key, direction in arg.items():
+                if "." in key:
+                    raise Untranslatable(f"path {key}")
+                expr, kind = sel.fields.get(key, ("NULL", None))
+                if kind is not None:
+                    order.append((expr, direction))
+            if sel.group is None and fmap.key is not None and sel.source == _quote(fmap.table):
+                if all(expr != fmap.key[0] for expr, _ in order):
+                    order.append((fmap.key[0], 1))
+            sel.order = order
+        elif op == "$skip":
+            n = _number(arg, "$skip")
+            if sel.limit is not None:
+                fresh()
+            sel.offset += n
+        elif op == "$limit":
+            n = _number(arg, "$limit")
+            sel.limit = n if sel.limit is None else min(sel.limit, n)
+        elif op == "$count":
+            if not isinstance(arg, str) or not arg or arg.startswith("$") or "." in arg:
+                raise Untranslatable("$count")
+            if sel.group is not None or sel.limit is not None or sel.offset:
+                fresh()
+            sel.fields = OrderedDict([(arg, ("count(*)", _INT))])
+            sel.group, sel.order = [], []
+            sel.having.append(_GROUPED_ANY)
+        else:
+            raise Untranslatable(f"pipeline stage {op}")
+    return sel.sql()
+
+def compile_find(fmap: FieldMap, query: dict, projection: dict = None, skip: int = 0, limit: int = 0) -> str:
+    """DuckDB SQL for find(query, projection, skip, limit) on the collection."""
+    pipeline: List[Any] = [{"$match": query or {}}]
+    if projection:
+        pipeline.append({"$project": projection})
+    if skip:
+        pipeline.append({"$skip": skip})
+    if limit:
+        pipeline.append({"$limit": limit})
+    return compile_pipeline(fmap, pipeline)
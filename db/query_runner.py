@@ -1,37 +1,625 @@
 # db/query_runner.py
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import duckdb
 import pandas as pd
-import sqlglot
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlglot import exp
 
-# Load CSV into a DuckDB in-memory table
-def init_db(csv_path="db/mockdb_1.csv"):
-    # Read CSV into pandas
-    df = pd.read_csv(csv_path)
+from db.cost_guard import TRUNCATED, cap_rows, deadline, guard_sql
+from db.result_cache import result_cache
+from db.sql_ast import ParsedSQL, allowed_columns, parse_sql, sql_literal, validate_sql
+from db.rollups import CubeSpec, rewrite_sql
+from db.storage import attach_store, attached_identity, detach_stores, is_stale, stored_cube, store_path
+from db.tracing import annotate, metrics, span
 
-    # Create in-memory duckdb connection
-    conn = duckdb.connect(database=":memory:")
-    conn.register("mytable", df)  # register pandas df as table "mytable"
+# Per-connection table registrations: id(conn) -> {table: (source_path | None, generation)}.
+# The versions of the tables a query reads are part of its result-cache key, so
+# re-registering a table or touching its CSV invalidates cached results that
+# read it, and only those.
+_REGISTRATIONS = {}
+_GENERATION = 0
+
+# A DuckDB connection must not be used from two threads at once. Queries run on
+# pooled cursors (below); the lock guards direct use of the connection itself
+# (catalog changes, cursor creation).
+_CONN_LOCKS = {}
+
+def _conn_lock(conn) -> threading.RLock:
+    return _CONN_LOCKS.setdefault(id(conn), threading.RLock())
+
+# ---------------------------
+# Connection pool (per-thread cursors over one shared database)
+# ---------------------------
+class PoolTimeout(TimeoutError):
+    """No cursor slot became free within the pool's checkout timeout."""
+
+class ConnectionPool:
+    """
+    Hands out DuckDB cursors of ONE shared database to worker threads.
+    A DuckDBPyConnection must not be shared across threads; each thread gets its own
+    cursor (created lazily, reused for that thread's lifetime), and at most `size`
+    cursors run at once. Checkout blocks up to `timeout` seconds, then PoolTimeout.
+    A thread that already holds a slot (an open stream) does not take a second
+    one, so a query issued while it streams cannot deadlock a small pool.
+    :param threads: DuckDB `threads` setting for the database (None = DuckDB default)
+    :param memory_limit: DuckDB `memory_limit`, e.g. "2GB" (None = DuckDB default)
+    """
+
+    def __init__(self, conn, size: int = None, timeout: float = 10.0, threads: int = None, memory_limit: str = None):
+        self.conn = conn
+        self.size = max(1, size or os.cpu_count() or 4)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = []  # callbacks waiting for no cursor to be checked out (see when_idle)
+        self._stats = {"checkouts": 0, "timeouts": 0, "cursors_created": 0, "in_use": 0, "peak_in_use": 0, "wait_ms_total": 0.0}
+        with _conn_lock(conn):
+            if threads:
+                conn.execute(f"SET threads = {int(threads)}")
+            if memory_limit:
+                conn.execute(f"SET memory_limit = '{memory_limit}'")
+
+    def _thread_cursor(self):
+        cur = getattr(self._local, "cursor", None)
+        if cur is None:
+            with _conn_lock(self.conn):
+                cur = self._local.cursor = self.conn.cursor()
+            self._local.prepared = OrderedDict()  # template SQL -> statement name
+            with self._lock:
+                self._stats["cursors_created"] += 1
+        return cur
+
+    @contextmanager
+    def _slot(self):
+        t0 = time.perf_counter()
+        acquire = not getattr(self._local, "held", 0)
+        if acquire and not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"no DuckDB cursor free within {self.timeout}s (pool size {self.size})")
+        self._local.held = getattr(self._local, "held", 0) + 1
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_ms_total"] += (time.perf_counter() - t0) * 1000
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+        try:
+            yield
+        finally:
+            self._local.held -= 1
+            with self._lock:
+                self._stats["in_use"] -= 1
+                idle, self._idle = (self._idle, []) if not self._stats["in_use"] else ([], self._idle)
+            if acquire:
+                self._slots.release()
+            for fn in idle:
+                fn()
+
+    def when_idle(self, fn) -> None:
+        """
+        Run fn() once every cursor checked out now has been returned: at once
+        when none is, else on the thread returning the last one.
+        """
+        with self._lock:
+            if self._stats["in_use"]:
+                self._idle.append(fn)
+                return
+        fn()
+
+    @contextmanager
+    def cursor(self):
+        with self._slot():
+            yield self._thread_cursor()
+
+    @contextmanager
+    def dedicated_cursor(self):
+        """
+        A fresh cursor for one long-lived reader (a stream), closed on exit. The
+        thread's pooled cursor stays free: re-executing it would end the stream.
+        """
+        with self._slot():
+            with _conn_lock(self.conn):
+                cur = self.conn.cursor()
+            with self._lock:
+                self._stats["cursors_created"] += 1
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def prepared(self, cursor):
+        """
+        Prepared statements of `cursor` (template SQL -> name), if it is this
+        thread's pooled cursor; None otherwise.
+        """
+        if getattr(self._local, "cursor", None) is cursor:
+            return self._local.prepared
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["size"] = self.size
+        out["utilization"] = out["in_use"] / self.size
+        out["avg_wait_ms"] = out["wait_ms_total"] / out["checkouts"] if out["checkouts"] else 0.0
+        return out
+
+# id(conn) -> ConnectionPool. Settings come from env on first use:
+#   NL2DB_POOL_SIZE (default: CPU count)   NL2DB_POOL_TIMEOUT (seconds, default 10)
+#   NL2DB_DUCKDB_THREADS                   NL2DB_DUCKDB_MEMORY_LIMIT (e.g. "2GB")
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(conn) -> ConnectionPool:
+    pool = _POOLS.get(id(conn))
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(id(conn))
+            if pool is None:
+                pool = _POOLS[id(conn)] = ConnectionPool(
+                    conn,
+                    size=int(os.getenv("NL2DB_POOL_SIZE", "0")) or None,
+                    timeout=float(os.getenv("NL2DB_POOL_TIMEOUT", "10")),
+                    threads=int(os.getenv("NL2DB_DUCKDB_THREADS", "0")) or None,
+                    memory_limit=os.getenv("NL2DB_DUCKDB_MEMORY_LIMIT") or None,
+                )
+                if len(_POOLS) == 1:
+                    metrics.register_source("duckdb_pool", pool.stats)
+    return pool
+
+def register_table(conn, name: str, df: pd.DataFrame, source: str = None):
+    """
+    Materialize a DataFrame as a DuckDB table and bump the data version for `conn`.
+    A real table (not a registered view) is visible to every cursor of `conn`,
+    which parallel execution relies on.
+    :param source: optional backing file path (its mtime/size join the version)
+    """
+    with _conn_lock(conn):
+        conn.register("__nl2db_src", df)
+        conn.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM __nl2db_src')
+        conn.unregister("__nl2db_src")
+    _track_table(conn, name, source)
+
+def _track_table(conn, name: str, source: str = None):
+    global _GENERATION
+    with _SHARED_LOCK:
+        _GENERATION += 1
+        _REGISTRATIONS.setdefault(id(conn), {})[name] = (source, _GENERATION)
+
+def _retire(conn):
+    # attach_store's `retire`: detach replaced stores once the queries that may
+    # still read them (every cursor checked out at the swap) have finished.
+    def retire(aliases):
+        def detach():
+            with _conn_lock(conn):
+                detach_stores(conn, aliases)
+        get_pool(conn).when_idle(detach)
+    return retire
+
+def data_version(conn) -> tuple:
+    """
+    Snapshot of everything registered on `conn`: table names, generations and
+    backing-file stats. Cheap (one os.stat per source file).
+    """
+    parts = []
+    for name, (source, gen) in sorted(_REGISTRATIONS.get(id(conn), {}).items()):
+        stat = None
+        if source:
+            try:
+                st = os.stat(source)
+                stat = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stat = "missing"
+        parts.append((name, gen, stat))
+    return (id(conn), tuple(parts))
+
+def table_version(conn, tables) -> tuple:
+    """
+    data_version(conn) restricted to `tables` (lower-case names, e.g.
+    ParsedSQL.tables): a refresh of one table leaves every other version as is.
+    """
+    version_id, parts = data_version(conn)
+    return (version_id, tuple(p for p in parts if p[0].lower() in tables))
+
+def shared_version(conn, tables):
+    """
+    table_version(conn, tables) without the per-process parts (connection id,
+    registration generations): the identity of each store file this process
+    has attached, so the same data has the same version in every process that
+    reads it (shared result-cache tier). None when a table is not backed by a
+    store (a registered DataFrame).
+    """
+    parts = []
+    for name, (source, _) in sorted(_REGISTRATIONS.get(id(conn), {}).items()):
+        if name.lower() not in tables:
+            continue
+        db_path = store_path(source) if source else None
+        identity = attached_identity(db_path) if db_path else None
+        if identity is None:
+            return None
+        parts.append((name, os.path.abspath(db_path)) + tuple(identity))
+    return tuple(parts)
+
+def reattach_source(path: str) -> int:
+    """
+    Re-attach the store of `path` on every shared connection that reads it,
+    after db/refresh.py updated it, and drop the cached results that read those
+    tables (only those). Returns the number of tables re-attached.
+    """
+    path = os.path.abspath(path)
+    with _SHARED_LOCK:
+        targets = [(conn, name) for key, conn in _SHARED_CONNS.items() for name, p in key if p == path]
+    for conn, name in targets:
+        with _conn_lock(conn):
+            attach_store(conn, path, table=name, retire=_retire(conn))
+        _track_table(conn, name, source=path)
+        lowered = name.lower()
+        result_cache.invalidate("duckdb", lambda key, c=id(conn): key[1][0] == c and any(p[0].lower() == lowered for p in key[1][1]))
+    return len(targets)
+
+# One shared connection per set of sources (all SQL agents use the same catalog)
+_SHARED_CONNS = {}
+_SHARED_LOCK = threading.RLock()  # also guards _GENERATION / _REGISTRATIONS (see _track_table)
+
+# Expose the CSV as DuckDB table "mytable" (or every table of `tables`)
+def init_db(csv_path="db/mockdb_1.csv", tables: dict = None, rollups: dict = None):
+    """
+    Return the shared DuckDB connection for `csv_path`, or for `tables`
+    ({table: CSV/Parquet/JSON path}, see db/catalog.py). Each source is ingested
+    once into a persistent store (db/storage.py) and attached read-only; later
+    calls and process starts only re-ingest a source when its file changed.
+    `rollups` ({table: dimension columns}) keeps a cube of pre-aggregates in
+    those stores (db/rollups.py).
+    """
+    rollups = rollups or {}
+    tables = tables or {"mytable": csv_path}
+    key = tuple(sorted((name, os.path.abspath(path)) for name, path in tables.items()))
+    with _SHARED_LOCK:
+        conn = _SHARED_CONNS.get(key)
+        fresh = conn is None
+        if fresh:
+            # In-memory main catalog; the data itself stays in the attached files.
+            conn = duckdb.connect(database=":memory:")
+            _SHARED_CONNS[key] = conn
+        for name, path in tables.items():
+            if fresh or is_stale(path, store_path(path)):
+                with _conn_lock(conn):
+                    attach_store(conn, path, table=name, rollup=rollups.get(name), retire=_retire(conn))
+                _track_table(conn, name, source=path)
     return conn
 
+# Parse once (memoized in db/sql_ast.py); translation, validation and the
+# result-cache key all come from the same AST.
+def _parse(query: str, dialect: str) -> ParsedSQL:
+    try:
+        return parse_sql(query, dialect)
+    except Exception as e:
+        raise ValueError(f"Could not translate query: {e}")
+
 # Translate query into DuckDB-compatible SQL
 def translate_query(query: str, dialect: str) -> str:
     """
     dialect can be: 'mysql', 'postgres', 'sqlite', 'duckdb'
     """
+    return _parse(query, dialect).duckdb_sql
+
+# Canonical DuckDB text for result-cache keys (None = don't cache)
+def canonicalize_sql(query: str, dialect: str = "duckdb"):
+    """
+    Regenerate the parsed query as DuckDB SQL, so whitespace/keyword-case/quoting
+    differences between phrasings map to one key. Only read-only queries qualify.
+    """
     try:
-        translated = sqlglot.transpile(query, read=dialect, write="duckdb")[0]
+        return parse_sql(query, dialect).canonical
+    except Exception:
+        return None
 
-        return translated
-    except Exception as e:
-        raise ValueError(f"Could not translate query: {e}")
+# ---------------------------
+# Allowlist validation
+# ---------------------------
+#   NL2DB_SQL_VALIDATE  check agent SQL against the registered tables/columns (default 1)
+VALIDATE_SQL = os.getenv("NL2DB_SQL_VALIDATE", "1") != "0"
+
+# data_version(conn) -> {table: columns}; refreshed whenever a table changes.
+_ALLOWLISTS = {}
+
+def _allowlist(conn, cursor):
+    version = data_version(conn)
+    allowed = _ALLOWLISTS.get(version)
+    if allowed is None:
+        allowed = allowed_columns(cursor, _REGISTRATIONS.get(id(conn), {}))
+        for stale in [v for v in _ALLOWLISTS if v[0] == id(conn)]:
+            del _ALLOWLISTS[stale]
+        _ALLOWLISTS[version] = allowed
+    return allowed
+
+def _checked(conn, cursor, query: str, dialect: str) -> ParsedSQL:
+    parsed = _parse(query, dialect)
+    if VALIDATE_SQL:
+        with span("validate_sql"):
+            validate_sql(parsed, _allowlist(conn, cursor))
+    return parsed
+
+# data_version(conn) -> {table: CubeSpec} of the stores that keep a cube.
+_CUBES = {}
+
+def _cubes(conn, cursor) -> dict:
+    version = data_version(conn)
+    cubes = _CUBES.get(version)
+    if cubes is None:
+        cubes = {}
+        for name in _REGISTRATIONS.get(id(conn), {}):
+            spec = stored_cube(cursor, name)
+            if spec is not None:
+                cubes[name.lower()] = CubeSpec(spec)
+        for stale in [v for v in _CUBES if v[0] == id(conn)]:
+            del _CUBES[stale]
+        _CUBES[version] = cubes
+    return cubes
+
+def _rolled_up(conn, cursor, parsed: ParsedSQL, version) -> ParsedSQL:
+    # Aggregates over a table with a cube read the cube instead (db/rollups.py).
+    rewritten = rewrite_sql(cursor, parsed, _cubes(conn, cursor), version)
+    if rewritten is not parsed:
+        annotate(rollup=True)
+    return rewritten
+
+# ---------------------------
+# Prepared statements per query template
+# ---------------------------
+# Queries that differ only in literals share a template (db/sql_ast.py); each
+# pooled cursor PREPAREs a template once and EXECUTEs it with the new literals.
+#   NL2DB_PREPARED_STATEMENTS  reuse prepared statements (default 1)
+#   NL2DB_PREPARED_PER_CURSOR  prepared statements kept per cursor (default 256)
+#   NL2DB_TEMPLATE_STATS_SIZE  templates tracked in template_stats() (default 1000)
+PREPARED_STATEMENTS = os.getenv("NL2DB_PREPARED_STATEMENTS", "1") != "0"
+PREPARED_PER_CURSOR = int(os.getenv("NL2DB_PREPARED_PER_CURSOR", "256"))
+TEMPLATE_STATS_SIZE = int(os.getenv("NL2DB_TEMPLATE_STATS_SIZE", "1000"))
+
+_stmt_ids = itertools.count(1)
+_TEMPLATES = OrderedDict()   # template SQL -> counters
+_TEMPLATES_LOCK = threading.Lock()
+_TEMPLATE_TOTALS = {"executions": 0, "prepares": 0, "prepared_reuses": 0, "unpreparable": 0}
+_DISTINCT_PARAMS_CAP = 1024
+
+def _record_template(template, ms: float, state: str) -> None:
+    with _TEMPLATES_LOCK:
+        entry = _TEMPLATES.get(template.sql)
+        if entry is None:
+            entry = _TEMPLATES[template.sql] = {
+                "executions": 0, "prepares": 0, "prepared_reuses": 0, "total_ms": 0.0, "params": set(),
+            }
+            while len(_TEMPLATES) > TEMPLATE_STATS_SIZE:
+                _TEMPLATES.popitem(last=False)
+        else:
+            _TEMPLATES.move_to_end(template.sql)
+        entry["executions"] += 1
+        entry["total_ms"] += ms
+        if len(entry["params"]) < _DISTINCT_PARAMS_CAP:
+            entry["params"].add(template.params)
+        _TEMPLATE_TOTALS["executions"] += 1
+        if state == "prepared":
+            entry["prepares"] += 1
+            _TEMPLATE_TOTALS["prepares"] += 1
+        elif state == "reused":
+            entry["prepared_reuses"] += 1
+            _TEMPLATE_TOTALS["prepared_reuses"] += 1
+        elif state == "unpreparable":
+            _TEMPLATE_TOTALS["unpreparable"] += 1
+
+def template_stats(top: int = 20) -> list:
+    """
+    Most-executed query templates: SQL, executions, distinct literal sets,
+    prepared-statement reuses and mean execution time.
+    """
+    with _TEMPLATES_LOCK:
+        items = [(sql, dict(e, params=len(e["params"]))) for sql, e in _TEMPLATES.items()]
+    items.sort(key=lambda kv: kv[1]["executions"], reverse=True)
+    return [
+        {
+            "template": sql,
+            "executions": e["executions"],
+            "distinct_params": e["params"],
+            "prepares": e["prepares"],
+            "prepared_reuses": e["prepared_reuses"],
+            "mean_ms": e["total_ms"] / e["executions"],
+        }
+        for sql, e in items[:top]
+    ]
+
+def template_summary() -> dict:
+    with _TEMPLATES_LOCK:
+        out = dict(_TEMPLATE_TOTALS)
+        out["templates"] = len(_TEMPLATES)
+    return out
+
+metrics.register_source("sql_templates", template_summary)
+
+def _execute_arrow(conn, cursor, parsed: ParsedSQL):
+    """
+    Execute `parsed` on `cursor` -> (Arrow table, prepared state). Parameterized
+    queries go through this cursor's prepared statement for their template.
+    """
+    template = parsed.template if PREPARED_STATEMENTS else None
+    statements = get_pool(conn).prepared(cursor) if template is not None else None
+    if statements is None:
+        return cursor.execute(parsed.duckdb_sql).fetch_arrow_table(), None
 
-# Execute query on DuckDB
+    name = statements.get(template.sql, False)
+    state = "reused"
+    if name is False:
+        name = f"nl2db_q{next(_stmt_ids)}"
+        try:
+            cursor.execute(f"PREPARE {name} AS {template.sql}")
+            state = "prepared"
+        except duckdb.Error:
+            name = None  # parameter types not inferable here: run it as plain SQL
+        statements[template.sql] = name
+        while len(statements) > PREPARED_PER_CURSOR:
+            _, old = statements.popitem(last=False)
+            if old:
+                cursor.execute(f"DEALLOCATE {old}")
+    else:
+        statements.move_to_end(template.sql)
+
+    t0 = time.perf_counter()
+    if name is None:
+        table, state = cursor.execute(parsed.duckdb_sql).fetch_arrow_table(), "unpreparable"
+    else:
+        args = ", ".join(sql_literal(v) for v in template.params)
+        table = cursor.execute(f"EXECUTE {name}({args})").fetch_arrow_table()
+    _record_template(template, (time.perf_counter() - t0) * 1000, state)
+    return table, state
+
+# Execute query on DuckDB (on a pooled per-thread cursor; safe from any thread)
 def run_query(conn, query: str, dialect: str = "duckdb"):
-    # Convert MySQL/Postgres -> DuckDB SQL
-    if dialect != "duckdb":
-        query = translate_query(query, dialect)
+    with get_pool(conn).cursor() as cur:
+        return _run_on(conn, cur, query, dialect)
+
+def _run_on(conn, cursor, query: str, dialect: str):
+    # `conn` identifies the database (cache version); `cursor` executes.
+    # One parse: MySQL/Postgres -> DuckDB SQL, allowlist check, cache key.
+    parsed = _checked(conn, cursor, query, dialect)
+    # Versions follow the tables the question names, even when a cube answers it.
+    version = table_version(conn, parsed.tables)
+    shared = shared_version(conn, parsed.tables) if result_cache.enabled else None
+    parsed = _rolled_up(conn, cursor, parsed, version)
+    # EXPLAIN-based admission (db/cost_guard.py): may reject, or add a LIMIT
+    # (one row over AUTO_LIMIT, so a cut result can be told from one that fits).
+    guarded = guard_sql(cursor, parsed, version)
+    limited, parsed = guarded is not parsed, guarded
+
+    key = None
+    if result_cache.enabled:
+        if parsed.canonical is not None:
+            key = ("duckdb", version, parsed.canonical)
+            if shared is not None:
+                shared = ("duckdb", shared, parsed.canonical)
+            cached = result_cache.get(key, shared)
+            annotate(result_cache="hit" if cached is not None else "miss")
+            if cached is not None:
+                with span("to_pandas", rows=cached.num_rows):
+                    return to_pandas(cached)
+
+    # Execute query (Arrow first: it is what the cache stores)
+    with span("duckdb_execute") as sp, deadline(cursor):
+        table, prepared = _execute_arrow(conn, cursor, parsed)
+        sp["rows"] = table.num_rows
+        if prepared:
+            sp["prepared"] = prepared
+    if limited:
+        table = cap_rows(table)
+    if key is not None:
+        result_cache.put(key, table, shared_key=shared)
+    with span("to_pandas", rows=table.num_rows):
+        return to_pandas(table)
+
+# ---------------------------
+# Arrow -> pandas (fetchdf() dtypes)
+# ---------------------------
+_NULLABLE_INTS = {
+    pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype(),
+    pa.uint8(): pd.UInt8Dtype(), pa.uint16(): pd.UInt16Dtype(), pa.uint32(): pd.UInt32Dtype(), pa.uint64(): pd.UInt64Dtype(),
+}
 
-    # Execute query
-    result_df = conn.execute(query).fetchdf()
-    return result_df
+def to_pandas(data) -> pd.DataFrame:
+    """
+    DataFrame of an Arrow table/batch with the dtypes fetchdf() gives: DECIMAL
+    and HUGEINT (SUM of integers) as float64, DATE as datetime64, integer
+    columns holding NULLs as nullable Int*. Plain pyarrow conversion would give
+    Decimal objects, datetime.date objects and float64 for those. A result the
+    automatic LIMIT cut (cost_guard.cap_rows) keeps that mark in df.attrs.
+    """
+    if isinstance(data, pa.RecordBatch):
+        data = pa.Table.from_batches([data])
+    truncated = (data.schema.metadata or {}).get(TRUNCATED.encode())
+    nullable = []
+    for i, field in enumerate(data.schema):
+        if pa.types.is_decimal(field.type):
+            data = data.set_column(i, field.name, pc.cast(data.column(i), pa.float64()))
+        elif pa.types.is_date(field.type):
+            data = data.set_column(i, field.name, pc.cast(data.column(i), pa.timestamp("us")))
+        elif field.type in _NULLABLE_INTS and data.column(i).null_count:
+            nullable.append(i)
+    df = data.to_pandas()
+    for i in nullable:
+        df.isetitem(i, data.column(i).to_pandas(types_mapper=_NULLABLE_INTS.get))
+    if truncated:
+        df.attrs[TRUNCATED] = int(truncated)
+    return df
+
+# ---------------------------
+# Streaming / pagination
+# ---------------------------
+#   NL2DB_ROW_BUDGET  default cap on rows a stream yields (0 = unlimited)
+ROW_BUDGET = int(os.getenv("NL2DB_ROW_BUDGET", "100000"))
+
+def iter_query_batches(conn, query: str, dialect: str = "duckdb", batch_size: int = 10_000, row_budget: int = None):
+    """
+    Stream a query as pyarrow RecordBatches instead of materializing a DataFrame.
+    Stops after `row_budget` rows (default ROW_BUDGET; 0 = unlimited).
+    Holds a pool slot and its own cursor until exhausted/closed; consume it on a
+    single thread (queries run meanwhile on that thread share the slot).
+    The cost guard still rejects; the row budget replaces its automatic LIMIT.
+    """
+    budget = ROW_BUDGET if row_budget is None else row_budget
+    seen = 0
+    with get_pool(conn).dedicated_cursor() as cur:
+        parsed = _checked(conn, cur, query, dialect)
+        version = table_version(conn, parsed.tables)
+        parsed = _rolled_up(conn, cur, parsed, version)
+        query = guard_sql(cur, parsed, version, auto_limit=False).duckdb_sql
+        reader = cur.execute(query).fetch_record_batch(batch_size)
+        for batch in reader:
+            if budget and seen + batch.num_rows > budget:
+                batch = batch.slice(0, budget - seen)
+            seen += batch.num_rows
+            if batch.num_rows:
+                yield batch
+            if budget and seen >= budget:
+                break
+
+def paginate_sql(query: str, limit: int, offset: int = 0, dialect: str = "duckdb") -> str:
+    """
+    Wrap a query so the server returns only one page (LIMIT/OFFSET); DuckDB SQL out.
+    """
+    inner = parse_sql(query, dialect).tree.copy()  # the cached AST is shared
+    page = exp.select("*").from_(inner.subquery("_page")).limit(limit).offset(offset)
+    return page.sql(dialect="duckdb")
+
+def run_query_page(conn, query: str, dialect: str = "duckdb", limit: int = 100, offset: int = 0):
+    """
+    One page of a query's result. Returns (DataFrame, has_more); fetches one
+    extra row to know whether another page exists.
+    """
+    df = run_query(conn, paginate_sql(query, limit + 1, offset, dialect=dialect))
+    return df.iloc[:limit], len(df) > limit
+
+# Execute many queries in parallel, one pooled DuckDB cursor per worker thread
+def run_queries_parallel(conn, queries: list, dialect: str = "duckdb", max_workers: int = 4):
+    """
+    Run independent read-only queries concurrently on cursors of `conn`.
+    Returns a list aligned with `queries` of (DataFrame | Exception, elapsed_seconds);
+    one failing query never sinks the others.
+    """
+    def _one(query):
+        t0 = time.perf_counter()
+        try:
+            out = run_query(conn, query, dialect)
+        except Exception as e:
+            out = e
+        return out, time.perf_counter() - t0
 
+    # Each task runs in a copy of the caller's context so its spans join the current trace.
+    contexts = [contextvars.copy_context() for _ in queries]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="nl2db-batch") as pool:
+        return list(pool.map(lambda ctx, q: ctx.run(_one, q), contexts, queries))
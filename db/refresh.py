@@ -0,0 +1,438 @@
+# db/refresh.py
+"""
+Incremental refresh: apply changed CSV / JSON sources to the DuckDB tables and
+the Mongo collection instead of reloading them.
+
+A source is compared with the file state recorded when it was last loaded
+(size, mtime, sha256; in the DuckDB store / the Mongo meta collection):
+
+  append   the old file is an unchanged prefix of the new one (CSV, TSV, JSON
+           lines): only the appended bytes are parsed and inserted
+  diff     any other edit, given a key column (Catalog.key_column): the new file
+           is compared with the current rows; only new/changed rows are
+           replaced and vanished keys deleted
+  rebuild  no key, duplicate/NULL keys or a different column set: full reload
+
+Every worker runs a watcher, so a refresh holds its source's store lock
+(storage.store_lock, a file lock) from reading the recorded state until the
+change is applied: an append is applied by one process, the others find it done.
+DuckDB stores are updated copy-on-write (storage.update_store) and re-attached,
+dropping only the cached results that read that table; other processes notice
+the replaced store file on their next poll and just re-attach it. The Mongo
+collection gets per-document replaces/deletes, after its DuckDB mirror (what
+Mongo queries run on, db/mongo_runner.py) was refreshed like a table. Cached translations survive
+unless the schema's shape changed (Catalog.fingerprint). Rollups follow
+(db/rollups.py): a store's cube is merged on appends and rebuilt otherwise; the
+Mongo rollup takes appended documents in place.
+
+refresh(name) / refresh_all() run on demand; append_rows(name, rows) takes a
+pushed batch (appended to the source file, then applied like any append);
+start_watcher() polls every source on a daemon thread.
+
+  NL2DB_REFRESH_INTERVAL  seconds between watcher polls (default 60; 0 = no watcher)
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import duckdb
+
+from db.catalog import get_catalog
+from db.mongo_backends import SOURCE_JSON, current_backend, read_documents
+from db.mongo_runner import invalidate_mongo_cache, rollup_version
+from db.query_runner import reattach_source
+from db.storage import (
+    STORE_DIR, StoreChanged, attached_identity, ensure_store, store_identity, store_lock, store_meta, store_path,
+    update_store,
+)
+from db.rollups import extend_mongo_rollup
+from db.tracing import metrics, span
+
+REFRESH_INTERVAL = float(os.getenv("NL2DB_REFRESH_INTERVAL", "60"))
+
+# Readers for the changed data: CSV as text and cast on insert into the typed
+# table, so a few new rows cannot infer different types than the whole file did.
+_READERS = {
+    ".csv": "read_csv(?, header = true, all_varchar = true)",
+    ".tsv": "read_csv(?, header = true, delim = '\t', all_varchar = true)",
+    ".parquet": "read_parquet(?)",
+    ".json": "read_json_auto(?)",
+    ".jsonl": "read_json_auto(?, format = 'newline_delimited')",
+    ".ndjson": "read_json_auto(?, format = 'newline_delimited')",
+}
+_LINE_FORMATS = (".csv", ".tsv", ".jsonl", ".ndjson")   # appends are new lines
+_HEADER_FORMATS = (".csv", ".tsv")
+_APPENDED = "_nl2db_appended"
+
+class Change:
+    """What one refresh did to one source."""
+    __slots__ = ("name", "mode", "rows", "deleted", "ms")
+
+    def __init__(self, name: str, mode: str, rows: int = 0, deleted: int = 0, ms: float = 0.0):
+        self.name = name
+        self.mode = mode        # none / reattach / append / diff / rebuild / error
+        self.rows = rows        # rows inserted or replaced
+        self.deleted = deleted  # rows deleted (diff only)
+        self.ms = ms
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "mode": self.mode, "rows": self.rows, "deleted": self.deleted, "ms": self.ms}
+
+    def __repr__(self) -> str:
+        return f"Change({self.name!r}, {self.mode!r}, rows={self.rows}, deleted={self.deleted}, ms={self.ms:.1f})"
+
+class _Rebuild(Exception):
+    """The change cannot be applied row by row; reload the source."""
+
+_lock = threading.RLock()   # one refresh at a time (they share the store files)
+_seen: Dict[str, tuple] = {}  # source path -> (size, mtime_ns) already known to be unchanged
+_COUNTERS = {"append": "appends", "diff": "diffs", "rebuild": "rebuilds", "reattach": "reattaches"}
+_stats = {"refreshes": 0, "appends": 0, "diffs": 0, "rebuilds": 0, "reattaches": 0,
+          "rows": 0, "deleted": 0, "errors": 0, "last_ms": 0.0}
+
+# ---------------------------
+# Source file state
+# ---------------------------
+def _sha256(path: str, size: int = None):
+    """(hasher over the first `size` bytes (all if None), last byte hashed)."""
+    h, last, left = hashlib.sha256(), b"", size
+    with open(path, "rb") as f:
+        while left is None or left > 0:
+            block = f.read(1 << 20 if left is None else min(1 << 20, left))
+            if not block:
+                break
+            h.update(block)
+            last = block[-1:]
+            if left is not None:
+                left -= len(block)
+    return h, last
+
+def _appended(path: str, size: int, sha: str):
+    """
+    (offset of the new lines, sha256 of the whole file) when `path` is the file
+    recorded as (size, sha) plus whole new lines; None otherwise.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _LINE_FORMATS or not size or os.path.getsize(path) <= size:
+        return None
+    h, last = _sha256(path, size)
+    if h.hexdigest() != sha:
+        return None
+    with open(path, "rb") as f:
+        f.seek(size)
+        tail = f.read()
+    offset = size
+    if last not in (b"\n", b"\r"):
+        # The old last line had no line break: the append must start with one.
+        lead = len(tail) - len(tail.lstrip(b"\r\n"))
+        if not lead:
+            return None
+        offset += lead
+    h.update(tail)
+    return offset, h.hexdigest()
+
+def _unchanged(path: str, st: os.stat_result, recorded: tuple) -> bool:
+    size, mtime_ns, sha = recorded
+    if (st.st_size, st.st_mtime_ns) == (size, mtime_ns) or _seen.get(path) == (st.st_size, st.st_mtime_ns):
+        return True
+    if st.st_size == size and _sha256(path)[0].hexdigest() == sha:
+        _seen[path] = (st.st_size, st.st_mtime_ns)  # touched, same content: hash once
+        return True
+    return False
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+# ---------------------------
+# DuckDB tables
+# ---------------------------
+def _tail_file(path: str, offset: int, db_path: str) -> str:
+    # The appended lines as a file of their own (CSV/TSV keep the header line).
+    ext = os.path.splitext(path)[1].lower()
+    tmp = os.path.join(os.path.dirname(db_path) or STORE_DIR, f".tail.{os.getpid()}.{threading.get_ident()}{ext}")
+    with open(path, "rb") as src, open(tmp, "wb") as out:
+        if ext in _HEADER_FORMATS:
+            out.write(src.readline())
+        src.seek(offset)
+        for block in iter(lambda: src.read(1 << 20), b""):
+            out.write(block)
+    return tmp
+
+def _append(table: str, tail_path: str):
+    # The new rows are staged in _APPENDED so the store merges their stats (storage.merge_stats).
+    def apply(conn) -> int:
+        reader = _READERS[os.path.splitext(tail_path)[1].lower()]
+        conn.execute(f"CREATE TEMP TABLE {_APPENDED} AS SELECT * FROM {_quote(table)} LIMIT 0")
+        conn.execute(f"INSERT INTO {_APPENDED} BY NAME SELECT * FROM {reader}", [tail_path])
+        return conn.execute(f"INSERT INTO {_quote(table)} SELECT * FROM {_APPENDED}").fetchone()[0]
+    return apply
+
+def _diff(table: str, path: str, key: str, counts: Dict[str, int]):
+    def apply(conn) -> int:
+        t, k = _quote(table), _quote(key)
+        reader = _READERS[os.path.splitext(path)[1].lower()]
+        columns = [d[0] for d in conn.execute(f"SELECT * FROM {t} LIMIT 0").description]
+        incoming = [d[0] for d in conn.execute(f"SELECT * FROM {reader} LIMIT 0", [path]).description]
+        if sorted(columns) != sorted(incoming) or key not in columns:
+            raise _Rebuild()
+        conn.execute(f"CREATE TEMP TABLE _nl2db_new AS SELECT * FROM {t} LIMIT 0")
+        conn.execute(f"INSERT INTO _nl2db_new BY NAME SELECT * FROM {reader}", [path])
+        for rel in ("_nl2db_new", t):
+            total, keys = conn.execute(f"SELECT count(*), count(DISTINCT {k}) FROM {rel}").fetchone()
+            if total != keys:  # duplicate or NULL keys: rows are not addressable by key
+                raise _Rebuild()
+        conn.execute(f"CREATE TEMP TABLE _nl2db_changed AS SELECT * FROM _nl2db_new EXCEPT SELECT * FROM {t}")
+        counts["deleted"] = conn.execute(
+            f"SELECT count(*) FROM {t} WHERE {k} NOT IN (SELECT {k} FROM _nl2db_new)").fetchone()[0]
+        conn.execute(
+            f"DELETE FROM {t} WHERE {k} IN (SELECT {k} FROM _nl2db_changed) OR {k} NOT IN (SELECT {k} FROM _nl2db_new)")
+        return conn.execute(f"INSERT INTO {t} SELECT * FROM _nl2db_changed").fetchone()[0]
+    return apply
+
+def _run_update(path: str, table: str, apply, sha: str, db_path: str, expect, appended: str = None) -> int:
+    st = os.stat(path)
+    inserted = []
+    update_store(path, table, lambda conn: inserted.append(apply(conn)), st, sha, db_path=db_path,
+                 appended=appended, expect=expect)
+    return inserted[0]
+
+def refresh_table(name: str) -> Change:
+    """Apply the changes of table `name`'s source file (see the module docstring)."""
+    catalog = get_catalog()
+    return _refresh_store(name, catalog.sources()[name]["path"], catalog.connection)
+
+def _refresh_store(name: str, path: str, connect) -> Change:
+    # Table `name` of the store of `path`, on the connection connect() returns.
+    catalog = get_catalog()
+    connect()  # attached (ingested if missing) before anything is compared
+    db_path = store_path(path)
+    # Held from reading the store's meta until the update replaced the store:
+    # every worker's watcher may be looking at the same change.
+    with store_lock(db_path):
+        meta, st = store_meta(db_path), os.stat(path)
+        change = Change(name, "none")
+        if meta is not None and _unchanged(path, st, meta):
+            if attached_identity(db_path) != store_identity(db_path):
+                change.mode = "reattach"  # another process updated the store
+        else:
+            appended = _appended(path, meta[0], meta[2]) if meta is not None else None
+            key = catalog.key_column(name) if meta is not None and appended is None else None
+            try:
+                if appended is not None:
+                    tail = _tail_file(path, appended[0], db_path)
+                    try:
+                        change.rows = _run_update(path, name, _append(name, tail), appended[1], db_path, meta, _APPENDED)
+                    finally:
+                        os.remove(tail)
+                    change.mode = "append"
+                elif key is not None:
+                    counts = {"deleted": 0}
+                    change.rows = _run_update(path, name, _diff(name, path, key, counts),
+                                              _sha256(path)[0].hexdigest(), db_path, meta)
+                    change.mode, change.deleted = "diff", counts["deleted"]
+                else:
+                    raise _Rebuild()
+            except (_Rebuild, StoreChanged, duckdb.Error):
+                ensure_store(path, table=name, rollup=catalog.rollup_dims(name))
+                change.mode, change.rows, change.deleted = "rebuild", 0, 0
+    if change.mode != "none":
+        reattach_source(path)
+    return change
+
+# ---------------------------
+# Mongo collection
+# ---------------------------
+def refresh_collection() -> Change:
+    """
+    Apply the changes of the collection's source file to its DuckDB mirror
+    (like a table) and to the Mongo backend; the mirror goes first, so the
+    backend's write is announced as mirrored.
+    """
+    catalog = get_catalog()
+    name = catalog.collection().name
+    # The mirror's store lock also covers the backend: every worker's watcher
+    # reads the same synced_meta() of a shared collection (mongod, mongita on
+    # disk), and only one may insert what was appended since.
+    with store_lock(store_path(SOURCE_JSON)):
+        mirror = _refresh_store(name, SOURCE_JSON, catalog.collection_connection)
+        return _sync_backend(catalog, name, mirror)
+
+def _sync_backend(catalog, name: str, mirror: Change) -> Change:
+    backend = current_backend()
+    change = Change(name, "none")
+    seen = backend.synced_meta() if backend is not None else None
+    if seen is None:  # not loaded yet: the first get_backend() seeds the current file
+        return mirror
+    st = os.stat(SOURCE_JSON)
+    recorded = (seen.get("size"), seen.get("mtime_ns"), seen.get("sha256"))
+    if _unchanged(SOURCE_JSON, st, recorded):
+        return mirror
+
+    appended = _appended(SOURCE_JSON, recorded[0], recorded[2]) if recorded[2] else None
+    if appended is not None:
+        docs = read_documents(SOURCE_JSON, offset=appended[0])
+        if docs:
+            backend.collection.insert_many(docs)
+        backend.mark_synced(SOURCE_JSON, appended[1])
+        change.mode, change.rows = "append", len(docs)
+        # The rollup takes the new documents in place instead of a rescan.
+        before = rollup_version(backend)
+        invalidate_mongo_cache(mirrored=True)
+        extend_mongo_rollup(docs, before, rollup_version(backend))
+        return change
+    else:
+        sha = _sha256(SOURCE_JSON)[0].hexdigest()
+        key = catalog.key_column(name)
+        try:
+            if key is None:
+                raise _Rebuild()
+            upserts, deletes = _diff_documents(read_documents(SOURCE_JSON), backend.find({}, {"_id": 0}), key)
+            backend.apply_changes(key, upserts, deletes)
+            backend.mark_synced(SOURCE_JSON, sha)
+            change.mode, change.rows, change.deleted = "diff", len(upserts), len(deletes)
+        except (_Rebuild, TypeError):
+            backend.reseed(SOURCE_JSON)
+            change.mode = "rebuild"
+    invalidate_mongo_cache(mirrored=True)
+    return change
+
+def _diff_documents(new_docs: List[dict], current_docs, key: str):
+    """(documents to replace, keys to delete) turning `current_docs` into `new_docs`."""
+    new = {}
+    for doc in new_docs:
+        k = doc.get(key)
+        if k is None or k in new:
+            raise _Rebuild()
+        new[k] = doc
+    current = {}
+    for doc in current_docs:
+        k = doc.get(key)
+        if k is None or k in current:
+            raise _Rebuild()
+        current[k] = doc
+    upserts = [doc for k, doc in new.items() if current.get(k) != doc]
+    return upserts, [k for k in current if k not in new]
+
+# ---------------------------
+# Entry points
+# ---------------------------
+def refresh(name: str) -> Change:
+    """Refresh one table or the collection by name; records timing and stats."""
+    t0 = time.perf_counter()
+    with _lock, span("refresh", source=name) as sp:
+        try:
+            if name == get_catalog().collection().name:
+                change = refresh_collection()
+            else:
+                change = refresh_table(name)
+        except Exception:
+            _stats["errors"] += 1
+            raise
+        change.ms = (time.perf_counter() - t0) * 1000
+        sp["mode"] = change.mode
+        _stats["refreshes"] += 1
+        if change.mode in _COUNTERS:
+            _stats[_COUNTERS[change.mode]] += 1
+            _stats["last_ms"] = change.ms
+        _stats["rows"] += change.rows
+        _stats["deleted"] += change.deleted
+    return change
+
+def refresh_all() -> List[Change]:
+    """Refresh every table and the collection; a failing source never stops the others."""
+    catalog = get_catalog()
+    out = []
+    for name in list(catalog.sources()) + [catalog.collection().name]:
+        try:
+            out.append(refresh(name))
+        except Exception:
+            out.append(Change(name, "error"))
+    return out
+
+def append_rows(name: str, rows: List[Dict[str, Any]]) -> Change:
+    """
+    Push a batch of new rows into table or collection `name`: they are appended
+    to its source file (so restarts and other processes see them too) and then
+    applied like any other append. CSV/TSV rows follow the header's columns
+    (missing = empty); a JSON array source is rewritten and applied as a diff.
+    """
+    catalog = get_catalog()
+    path = SOURCE_JSON if name == catalog.collection().name else catalog.sources()[name]["path"]
+    with _lock:
+        _append_to_file(path, rows)
+        return refresh(name)
+
+def _append_to_file(path: str, rows: List[Dict[str, Any]]) -> None:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _HEADER_FORMATS:
+        with open(path, "rb") as f:
+            first = f.readline()
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size:
+                f.seek(size - 1)
+                last = f.read(1)
+        newline = "\r\n" if first.endswith(b"\r\n") else "\n"
+        delim = "\t" if ext == ".tsv" else ","
+        header = next(csv.reader([first.decode("utf-8-sig").rstrip("\r\n")], delimiter=delim))
+        buf = io.StringIO()
+        if size and last not in (b"\n", b"\r"):
+            buf.write(newline)
+        csv.writer(buf, delimiter=delim, lineterminator=newline).writerows(
+            [["" if row.get(c) is None else row.get(c) for c in header] for row in rows])
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            f.write(buf.getvalue())
+    elif ext in _LINE_FORMATS:
+        with open(path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+    elif ext == ".json":
+        docs = read_documents(path) + list(rows)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("[\n" + ",\n".join("  " + json.dumps(d) for d in docs) + "\n]")
+        os.replace(tmp, path)
+    else:
+        raise ValueError(f"cannot append rows to {path}")
+
+# ---------------------------
+# Watcher
+# ---------------------------
+_watcher: Optional[threading.Thread] = None
+_stop = threading.Event()
+_watcher_lock = threading.Lock()
+
+def _watch(interval: float) -> None:
+    while not _stop.wait(interval):
+        refresh_all()
+
+def start_watcher(interval: float = None) -> Optional[threading.Thread]:
+    """
+    Poll every source each `interval` seconds (default NL2DB_REFRESH_INTERVAL)
+    on a daemon thread. Idempotent per process (Streamlit reruns); 0 disables.
+    """
+    global _watcher
+    interval = REFRESH_INTERVAL if interval is None else interval
+    with _watcher_lock:
+        if _watcher is None and interval > 0:
+            _stop.clear()
+            _watcher = threading.Thread(target=_watch, args=(interval,), name="nl2db-refresh", daemon=True)
+            _watcher.start()
+    return _watcher
+
+def stop_watcher() -> None:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _stop.set()
+            _watcher.join()
+            _watcher = None
+
+def refresh_stats() -> Dict[str, Any]:
+    return dict(_stats, watching=int(_watcher is not None))
+
+metrics.register_source("refresh", refresh_stats)
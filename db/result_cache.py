@@ -0,0 +1,199 @@
+# db/result_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import pyarrow as pa
+
+from db.tracing import metrics
+
+# ---------------------------
+# Result-set cache (Arrow tables, byte-bounded LRU)
+# ---------------------------
+def _ipc_bytes(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _digest(shared_key: tuple) -> str:
+    # Shared keys hold only str/int/float/None, so repr() is stable across processes.
+    return hashlib.sha256(repr(shared_key).encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Caches query results as pyarrow Tables (compact, immutable; no DataFrame copies).
+    Keys are built by the runners from canonical query text + a data version, so a
+    changed source file or table registration simply stops matching old entries.
+    - Tier 1: in-process LRU, bounded by max_bytes (sum of Table.nbytes).
+    - Tier 2: optional SQLite file of Arrow IPC streams, bounded by disk_max_bytes
+      and shared by every process that opens it (API workers, Streamlit, batch).
+      Only entries stored with a `shared_key` reach it: the runners' own keys hold
+      per-process parts (connection ids, generations), so they also pass a
+      version built from file paths and stats alone.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, sqlite_path: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[pa.Table, int, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if sqlite_path:
+            # WAL: readers in other processes never block on a writer.
+            self._db = sqlite3.connect(sqlite_path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, namespace TEXT NOT NULL, body BLOB NOT NULL,"
+                " size INTEGER NOT NULL, expires REAL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _drop(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, shared_key: Optional[tuple] = None) -> Optional[pa.Table]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                table, _, expires = entry
+                if expires is None or time.time() <= expires:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return table
+                self._drop(key)
+        found = self._disk_get(shared_key) if shared_key is not None and self._db is not None else None
+        if found is not None:
+            table, expires = found
+            self._mem_put(key, table, expires)  # promote to tier 1
+        with self._lock:
+            self._stats["disk_hits" if found is not None else "misses"] += 1
+        return found[0] if found is not None else None
+
+    def put(self, key: Hashable, table: pa.Table, ttl_seconds: Optional[float] = None,
+            shared_key: Optional[tuple] = None) -> None:
+        expires = time.time() + ttl_seconds if ttl_seconds else None
+        self._mem_put(key, table, expires)
+        if shared_key is not None and self._db is not None:
+            self._disk_put(shared_key, table, expires)
+
+    def _mem_put(self, key: Hashable, table: pa.Table, expires: Optional[float]) -> None:
+        size = table.nbytes
+        with self._lock:
+            # A single result larger than the whole budget is not worth caching.
+            if size > self.max_bytes:
+                self._stats["rejected"] += 1
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (table, size, expires)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def _disk_get(self, shared_key: tuple) -> Optional[Tuple[pa.Table, Optional[float]]]:
+        digest, now = _digest(shared_key), time.time()
+        with self._db_lock:
+            row = self._db.execute("SELECT body, expires FROM results WHERE key = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            body, expires = row
+            if expires is not None and now > expires:
+                self._db.execute("DELETE FROM results WHERE key = ?", (digest,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, digest))
+            self._db.commit()
+        return pa.ipc.open_stream(body).read_all(), expires
+
+    def _disk_put(self, shared_key: tuple, table: pa.Table, expires: Optional[float]) -> None:
+        body = _ipc_bytes(table)
+        if len(body) > self.disk_max_bytes:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, namespace, body, size, expires, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (_digest(shared_key), str(shared_key[0]), body, len(body), expires, now),
+            )
+            self._db.execute("DELETE FROM results WHERE expires IS NOT NULL AND expires < ?", (now,))
+            over = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0] - self.disk_max_bytes
+            if over > 0:
+                victims = []
+                for digest, size in self._db.execute("SELECT key, size FROM results ORDER BY last_used ASC"):
+                    if over <= 0:
+                        break
+                    victims.append((digest,))
+                    over -= size
+                self._db.executemany("DELETE FROM results WHERE key = ?", victims)
+                with self._lock:
+                    self._stats["evictions"] += len(victims)
+            self._db.commit()
+
+    def invalidate(self, namespace: Optional[str] = None, match: Optional[Callable[[tuple], bool]] = None) -> int:
+        """
+        Drop everything, or only keys whose first element equals `namespace`
+        (runners use "duckdb" / "mongo") and, if given, for which match(key) is
+        true. Returns the number of entries dropped. Without `match`, the shared
+        tier is cleared the same way (with it, shared entries are left to their
+        file-stat versions, which stop matching once a source changes).
+        """
+        dropped = 0
+        with self._lock:
+            for key in list(self._entries):
+                if namespace is None or (isinstance(key, tuple) and key and key[0] == namespace):
+                    if match is None or match(key):
+                        self._drop(key)
+                        dropped += 1
+        if self._db is not None and match is None:
+            with self._db_lock:
+                if namespace is None:
+                    cur = self._db.execute("DELETE FROM results")
+                else:
+                    cur = self._db.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+                self._db.commit()
+            dropped += cur.rowcount
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["bytes"] = self._bytes
+            out["max_bytes"] = self.max_bytes
+        if self._db is not None:
+            with self._db_lock:
+                entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            out.update(disk_entries=entries, disk_bytes=size, disk_max_bytes=self.disk_max_bytes)
+        return out
+
+# ---------------------------
+# Shared instance
+# ---------------------------
+#   NL2DB_RESULT_CACHE_MB     memory ceiling in MiB (default 256; 0 disables the cache)
+#   NL2DB_RESULT_CACHE_DB     SQLite file for the cross-process tier (unset = memory only)
+#   NL2DB_RESULT_CACHE_DB_MB  on-disk ceiling in MiB (default 1024)
+result_cache = ResultCache(
+    max_bytes=int(float(os.getenv("NL2DB_RESULT_CACHE_MB", "256")) * 1024 * 1024),
+    sqlite_path=os.getenv("NL2DB_RESULT_CACHE_DB") or None,
+    disk_max_bytes=int(float(os.getenv("NL2DB_RESULT_CACHE_DB_MB", "1024")) * 1024 * 1024),
+)
+metrics.register_source("result_cache", result_cache.stats)
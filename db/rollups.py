@@ -0,0 +1,442 @@
+# db/rollups.py
+"""
+Aggregate questions answered from materialized rollups instead of a full scan.
+
+DuckDB: a table with rollup dimensions (manifest "rollup", db/catalog.py) keeps
+a CUBE of pre-aggregates in its store (db/storage.py: built at ingest, merged on
+appends, rebuilt after other changes). rewrite_sql() turns every SELECT over
+such a table that filters/groups only by dimensions and aggregates with COUNT /
+SUM / AVG / MIN / MAX (or COUNT(DISTINCT dimension)) into the same SELECT over
+the cuboid grouped by exactly the dimensions it uses:
+
+    SELECT "Genre", AVG("Age") FROM mytable WHERE "Age" > 30 GROUP BY "Genre"
+ -> SELECT "Genre", CAST(SUM(_s_2) AS DOUBLE) / SUM(_n_2) AS "avg(""Age"")"
+    FROM _nl2db_cube_mytable AS mytable WHERE "Age" > 30 AND mytable._gid = 3 GROUP BY "Genre"
+
+Subqueries are rewritten on their own (a MAX() subquery, a paging wrapper). A
+rewrite is used only when DuckDB binds it to the same column names and types as
+the original; the decision is memoized per query and data version.
+
+Mongo: the collection's rollup dimensions get a MongoRollup (one cell per
+combination present, built in one pass per data version, extended in place
+when db/refresh.py appends documents). answer_pipeline() answers a leading
+$match on dimensions followed by a $group ($sum/$avg/$min/$max/$count) or a
+$count from those cells; the rest of the pipeline runs on the grouped rows.
+
+Either way the work follows the number of dimension combinations, not rows.
+
+  NL2DB_ROLLUPS             rewrite queries to use the rollups (default 1)
+  NL2DB_ROLLUP_CACHE_SIZE   rewrite decisions kept (default 2048)
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlglot import exp
+
+from db.mongo_backends import evaluate, matches, run_pipeline, sort_key
+from db.sql_ast import ParsedSQL, parse_sql
+from db.storage import cube_view
+from db.tracing import metrics
+
+ENABLED = os.getenv("NL2DB_ROLLUPS", "1") != "0"
+CACHE_SIZE = int(os.getenv("NL2DB_ROLLUP_CACHE_SIZE", "2048"))
+
+_stats = {"sql_rewrites": 0, "sql_fallbacks": 0, "mongo_hits": 0, "mongo_misses": 0, "mongo_builds": 0}
+
+# ---------------------------
+# DuckDB: SQL rewrite onto the cube
+# ---------------------------
+class CubeSpec:
+    """A stored cube (storage.stored_cube): dimensions and per-column aggregates."""
+    __slots__ = ("table", "dims", "columns", "view")
+
+    def __init__(self, spec: dict):
+        self.table = spec["table"]
+        self.dims = {d.lower(): i for i, d in enumerate(spec["dims"])}
+        # lower-case column -> (index i of _n_i/_lo_i/_hi_i/_s_i, numeric)
+        self.columns = {name.lower(): (i, numeric) for i, (name, _, numeric) in enumerate(spec["columns"])}
+        self.view = cube_view(self.table)
+
+    def gid(self, used) -> int:
+        # GROUPING() bits: set for every dimension the query does not use.
+        n = len(self.dims)
+        return sum(1 << (n - 1 - i) for d, i in self.dims.items() if d not in used)
+
+def _agg_args(node: exp.AggFunc) -> List[exp.Expression]:
+    return [a for a in [node.this] + list(node.expressions) if a is not None]
+
+def _replacement(node: exp.AggFunc, cube: CubeSpec, used: set) -> Optional[exp.Expression]:
+    """The cube expression computing aggregate `node`, or None if it has none."""
+    args = _agg_args(node)
+    if isinstance(node, exp.Count):
+        if isinstance(node.this, exp.Star):
+            return exp.cast(exp.func("COALESCE", exp.func("SUM", exp.column("_rows")), exp.Literal.number(0)), "BIGINT")
+        if isinstance(node.this, exp.Distinct):
+            cols = node.this.expressions
+            if len(cols) == 1 and isinstance(cols[0], exp.Column) and cols[0].name.lower() in cube.dims:
+                used.add(cols[0].name.lower())
+                return node.copy()
+            return None
+    if len(args) != 1 or not isinstance(args[0], exp.Column) or args[0].name.lower() not in cube.columns:
+        return None
+    i, numeric = cube.columns[args[0].name.lower()]
+    if isinstance(node, exp.Count):
+        return exp.cast(exp.func("COALESCE", exp.func("SUM", exp.column(f"_n_{i}")), exp.Literal.number(0)), "BIGINT")
+    if isinstance(node, exp.Min):
+        return exp.func("MIN", exp.column(f"_lo_{i}"))
+    if isinstance(node, exp.Max):
+        return exp.func("MAX", exp.column(f"_hi_{i}"))
+    if not numeric:
+        return None
+    if isinstance(node, exp.Sum):
+        return exp.func("SUM", exp.column(f"_s_{i}"))
+    if isinstance(node, exp.Avg):
+        return exp.Paren(this=exp.Div(
+            this=exp.cast(exp.func("SUM", exp.column(f"_s_{i}")), "DOUBLE"),
+            expression=exp.func("SUM", exp.column(f"_n_{i}")),
+        ))
+    return None
+
+def _rewrite_select(select: exp.Select, cubes: Dict[str, CubeSpec]) -> Optional[exp.Select]:
+    """`select` reading the matching cuboid instead of its table (None = not eligible)."""
+    source = select.args.get("from")
+    if source is None or not isinstance(source.this, exp.Table) or select.args.get("joins"):
+        return None
+    table = source.this
+    cube = cubes.get(table.name.lower())
+    if cube is None or table.args.get("db") or table.args.get("catalog"):
+        return None
+    alias = table.alias_or_name
+    if any(isinstance(n, (exp.Window, exp.Filter, exp.Subquery)) for n in select.walk()):
+        return None
+    aggs = list(select.find_all(exp.AggFunc))
+    if not aggs and not (select.args.get("distinct") and select.args.get("group") is None):
+        return None  # a listing: the cube has no rows to list
+    if select.args.get("where") is not None and select.args["where"].find(exp.AggFunc):
+        return None
+
+    new = select.copy()
+    used: set = set()
+    for node in list(new.find_all(exp.AggFunc)):
+        if node.find_ancestor(exp.AggFunc) is not None:
+            return None  # nested aggregate
+        repl = _replacement(node, cube, used)
+        if repl is None:
+            return None
+        node.replace(repl)
+
+    names = {p.alias_or_name.lower() for p in new.expressions if isinstance(p, exp.Alias)}
+    inside = set()  # columns the replacements themselves introduced or kept (COUNT DISTINCT)
+    for node in new.find_all(exp.AggFunc):
+        inside.update(id(c) for c in node.find_all(exp.Column))
+    for col in new.find_all(exp.Column):
+        if id(col) in inside:
+            continue
+        if isinstance(col.this, exp.Star):
+            return None
+        qualifier = col.table
+        name = col.name.lower()
+        if qualifier and qualifier.lower() != alias.lower():
+            return None  # another table or an outer query
+        if name in cube.dims:
+            used.add(name)
+        elif qualifier or name not in names:
+            return None  # a non-dimension column outside an aggregate
+    if any(isinstance(p, exp.Star) for p in new.expressions):
+        return None
+
+    table_node = new.args["from"].this
+    table_node.replace(exp.Table(
+        this=exp.to_identifier(cube.view, quoted=True),
+        alias=exp.TableAlias(this=exp.to_identifier(alias, quoted=True)),
+    ))
+    return new.where(exp.EQ(this=exp.column("_gid", table=exp.to_identifier(alias, quoted=True)),
+                            expression=exp.Literal.number(cube.gid(used))), copy=False)
+
+def _describe(cursor, select: exp.Expression) -> List[Tuple[str, str]]:
+    return [(r[0], r[1]) for r in cursor.execute(f"DESCRIBE {select.sql(dialect='duckdb')}").fetchall()]
+
+def _named(rewritten: exp.Select, names: List[str]) -> exp.Select:
+    # Keep the original output names (DuckDB names unaliased columns by their text).
+    projections = []
+    for proj, name in zip(rewritten.expressions, names):
+        if isinstance(proj, exp.Alias):
+            projections.append(proj)
+        elif isinstance(proj, exp.Column) and proj.name == name:
+            projections.append(proj)
+        else:
+            projections.append(exp.alias_(proj, name, quoted=True))
+    rewritten.set("expressions", projections)
+    return rewritten
+
+_decisions: "OrderedDict[tuple, Optional[ParsedSQL]]" = OrderedDict()
+_lock = threading.Lock()
+
+def rewrite_sql(cursor, parsed: ParsedSQL, cubes: Dict[str, CubeSpec], version: Any) -> ParsedSQL:
+    """
+    `parsed` with every eligible SELECT reading its table's cube, or `parsed`
+    itself. `cubes`: lower-case table -> CubeSpec of the tables `cursor` sees;
+    `version`: their data version (decisions are memoized per version).
+    """
+    if not ENABLED or parsed.canonical is None or not cubes or not (parsed.tables & set(cubes)):
+        return parsed
+    key = (version, parsed.canonical)
+    with _lock:
+        if key in _decisions:
+            _decisions.move_to_end(key)
+            hit = _decisions[key]
+            return parsed if hit is None else hit
+
+    tree = parsed.tree.copy()
+    changed = False
+    # Innermost first: a rewritten subquery no longer reads the base table.
+    for select in reversed(list(tree.find_all(exp.Select))):
+        if any(s is not select for s in select.find_all(exp.Select)):
+            continue
+        rewritten = _rewrite_select(select, cubes)
+        if rewritten is None:
+            continue
+        try:
+            original = _describe(cursor, select)
+            rewritten = _named(rewritten, [name for name, _ in original])
+            if _describe(cursor, rewritten) != original:
+                continue
+        except Exception:
+            continue
+        if select is tree:
+            tree = rewritten
+        else:
+            select.replace(rewritten)
+        changed = True
+
+    result = parse_sql(tree.sql(dialect="duckdb"), "duckdb") if changed else None
+    with _lock:
+        _stats["sql_rewrites" if changed else "sql_fallbacks"] += 1
+        _decisions[key] = result
+        while len(_decisions) > CACHE_SIZE:
+            _decisions.popitem(last=False)
+    return parsed if result is None else result
+
+# ---------------------------
+# Mongo: rollup cells for a leading $match + $group
+# ---------------------------
+class _Cell:
+    __slots__ = ("rows", "n", "s", "lo", "hi")
+
+    def __init__(self):
+        self.rows = 0
+        self.n: Dict[str, int] = {}
+        self.s: Dict[str, Any] = {}
+        self.lo: Dict[str, Any] = {}
+        self.hi: Dict[str, Any] = {}
+
+    def add(self, doc: dict) -> None:
+        self.rows += 1
+        for field, v in doc.items():
+            if v is None or field == "_id":
+                continue
+            self._bounds(field, v, v)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):  # what $sum/$avg count
+                self.n[field] = self.n.get(field, 0) + 1
+                self.s[field] = self.s.get(field, 0) + v
+
+    def merge(self, other: "_Cell") -> None:
+        self.rows += other.rows
+        for field, lo in other.lo.items():
+            self._bounds(field, lo, other.hi[field])
+        for field, n in other.n.items():
+            self.n[field] = self.n.get(field, 0) + n
+            self.s[field] = self.s.get(field, 0) + other.s[field]
+
+    def _bounds(self, field: str, lo, hi) -> None:
+        if field not in self.lo or sort_key(lo) < sort_key(self.lo[field]):
+            self.lo[field] = lo
+        if field not in self.hi or sort_key(hi) > sort_key(self.hi[field]):
+            self.hi[field] = hi
+
+class MongoRollup:
+    """
+    The collection aggregated over `dims`: one _Cell per combination present
+    (missing = None), in first-seen order like a server-side $group; coarser
+    groupings (cuboids) are derived on demand and memoized.
+    """
+
+    def __init__(self, dims: List[str]):
+        self.dims = list(dims)
+        self.cells: "OrderedDict[tuple, _Cell]" = OrderedDict()
+        self._cuboids: Dict[tuple, "OrderedDict[tuple, _Cell]"] = {}
+        self._lock = threading.Lock()
+
+    def add(self, docs) -> None:
+        """Fold documents in (raises TypeError for unhashable dimension values)."""
+        with self._lock:
+            for doc in docs:
+                key = tuple(doc.get(d) for d in self.dims)
+                cell = self.cells.get(key)
+                if cell is None:
+                    cell = self.cells[key] = _Cell()
+                cell.add(doc)
+            self._cuboids.clear()
+
+    def cuboid(self, used: Tuple[str, ...]) -> "OrderedDict[tuple, _Cell]":
+        """Cells grouped by the dimensions `used` only (in self.dims order)."""
+        with self._lock:
+            out = self._cuboids.get(used)
+            if out is None:
+                idx = [self.dims.index(d) for d in used]
+                out = OrderedDict()
+                for key, cell in self.cells.items():
+                    sub = tuple(key[i] for i in idx)
+                    agg = out.get(sub)
+                    if agg is None:
+                        agg = out[sub] = _Cell()
+                    agg.merge(cell)
+                self._cuboids[used] = out
+            return out
+
+def _filter_fields(flt, out: set) -> bool:
+    # Top-level fields of a filter; False for operators a cell cannot evaluate.
+    for key, cond in flt.items():
+        if key in ("$and", "$or", "$nor"):
+            if not all(isinstance(f, dict) and _filter_fields(f, out) for f in cond):
+                return False
+        elif key.startswith("$") or "." in key:
+            return False
+        else:
+            if isinstance(cond, dict) and any(op in ("$exists", "$type", "$expr", "$where", "$elemMatch") for op in cond):
+                return False
+            out.add(key)
+    return True
+
+def _group_fields(id_spec, out: set) -> bool:
+    if isinstance(id_spec, str) and id_spec.startswith("$"):
+        if "." in id_spec:
+            return False
+        out.add(id_spec[1:])
+        return True
+    if isinstance(id_spec, dict):
+        return all(not k.startswith("$") and _group_fields(v, out) for k, v in id_spec.items())
+    return not isinstance(id_spec, list)
+
+def _accumulate(op: str, arg, cells: List[_Cell]):
+    if op == "$count" or (op == "$sum" and isinstance(arg, (int, float)) and not isinstance(arg, bool)):
+        total = sum(c.rows for c in cells)
+        return total if op == "$count" else arg * total
+    field = arg[1:]
+    if op == "$sum":
+        return sum(c.s.get(field, 0) for c in cells)
+    if op == "$avg":
+        n = sum(c.n.get(field, 0) for c in cells)
+        return sum(c.s.get(field, 0) for c in cells) / n if n else None
+    bounds = [c.lo[field] if op == "$min" else c.hi[field] for c in cells if field in c.lo]
+    if not bounds:
+        return None
+    return min(bounds, key=sort_key) if op == "$min" else max(bounds, key=sort_key)
+
+_ACCUMULATORS = ("$sum", "$avg", "$min", "$max", "$count")
+
+def answer_pipeline(rollup: MongoRollup, pipeline: list) -> Optional[List[dict]]:
+    """
+    Result of `pipeline` computed from `rollup`, or None when its head is not a
+    [$match on dimensions] + $group/$count the cells can answer.
+    """
+    stages = list(pipeline)
+    flt: dict = {}
+    used: set = set()
+    if stages and isinstance(stages[0], dict) and list(stages[0]) == ["$match"]:
+        flt = stages.pop(0)["$match"]
+        if not isinstance(flt, dict) or not _filter_fields(flt, used):
+            return None
+    if not stages or not isinstance(stages[0], dict) or len(stages[0]) != 1:
+        return None
+    (op, spec), = stages[0].items()
+    accs = {}
+    if op == "$group":
+        if not isinstance(spec, dict) or not _group_fields(spec.get("_id"), used):
+            return None
+        for name, acc in spec.items():
+            if name == "_id":
+                continue
+            if not isinstance(acc, dict) or len(acc) != 1:
+                return None
+            (acc_op, arg), = acc.items()
+            numeric = isinstance(arg, (int, float)) and not isinstance(arg, bool)
+            field = isinstance(arg, str) and arg.startswith("$") and "." not in arg
+            if acc_op not in _ACCUMULATORS or not (field or (acc_op == "$sum" and numeric) or acc_op == "$count"):
+                return None
+            accs[name] = (acc_op, arg)
+    elif op != "$count" or not isinstance(spec, str):
+        return None
+    if not used <= set(rollup.dims):
+        return None
+
+    dims = tuple(d for d in rollup.dims if d in used)
+    groups: "OrderedDict[str, list]" = OrderedDict()
+    for key, cell in rollup.cuboid(dims).items():
+        doc = dict(zip(dims, key))
+        if flt and not matches(doc, flt):
+            continue
+        if op == "$count":
+            groups.setdefault("", [None, []])[1].append(cell)
+            continue
+        gkey = evaluate(doc, spec.get("_id"))
+        groups.setdefault(repr(gkey), [gkey, []])[1].append(cell)
+
+    if op == "$count":
+        total = sum(c.rows for _, cells in groups.values() for c in cells)
+        out = [{spec: total}] if total else []
+    else:
+        out = [dict({"_id": gkey}, **{name: _accumulate(a, arg, cells) for name, (a, arg) in accs.items()})
+               for gkey, cells in groups.values()]
+    return list(run_pipeline(out, stages[1:]))
+
+_mongo: Optional[Tuple[Any, MongoRollup]] = None
+_mongo_lock = threading.Lock()
+
+def mongo_rollup(backend, version: Any, dims: List[str]) -> Optional[MongoRollup]:
+    """The MongoRollup of `backend`'s collection at data `version` (built on first use)."""
+    global _mongo
+    if not ENABLED or not dims:
+        return None
+    current = _mongo
+    if current is not None and current[0] == version and current[1].dims == list(dims):
+        return current[1]
+    with _mongo_lock:
+        if _mongo is None or _mongo[0] != version or _mongo[1].dims != list(dims):
+            rollup = MongoRollup(dims)
+            try:
+                rollup.add(backend.find({}, {"_id": 0}))
+            except TypeError:  # unhashable dimension values (arrays/objects)
+                return None
+            _stats["mongo_builds"] += 1
+            _mongo = (version, rollup)
+        return _mongo[1]
+
+def extend_mongo_rollup(docs: List[dict], old_version: Any, new_version: Any) -> None:
+    """
+    db/refresh.py appended `docs` to the collection: fold them into the rollup
+    of `old_version` and keep it as the rollup of `new_version` (no rescan).
+    """
+    global _mongo
+    with _mongo_lock:
+        if _mongo is not None and _mongo[0] == old_version:
+            rollup = _mongo[1]
+            try:
+                rollup.add(docs)
+            except TypeError:
+                _mongo = None
+                return
+            _mongo = (new_version, rollup)
+
+def count_mongo(hit: bool) -> None:
+    _stats["mongo_hits" if hit else "mongo_misses"] += 1
+
+def rollup_stats() -> Dict[str, Any]:
+    out = dict(_stats)
+    out["mongo_cells"] = len(_mongo[1].cells) if _mongo is not None else 0
+    out["sql_decisions"] = len(_decisions)
+    return out
+
+metrics.register_source("rollups", rollup_stats)
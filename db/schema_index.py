@@ -0,0 +1,130 @@
+# db/schema_index.py
+"""
+Lexical retrieval over the catalog schema, so a prompt lists only the tables and
+columns a question needs instead of the whole warehouse.
+
+One BM25 document per column (its name + its categorical values, so "male
+customers" finds Genre through the value 'Male') and one per table (name +
+description). Names are split on case/underscores/punctuation and plurals are
+folded; there are no synonyms on purpose ("gender" must NOT find Genre).
+
+SchemaIndex.select(question) ranks tables by their best column plus their own
+name/description, keeps the top tables, and prunes wide tables to their best
+columns, topped up with their leading columns, plus id-like columns (for
+joins). Narrow tables are listed whole.
+
+  NL2DB_SCHEMA_TOP_TABLES    tables per prompt (default 3)
+  NL2DB_SCHEMA_TOP_COLUMNS   columns kept per pruned table (default 15)
+  NL2DB_SCHEMA_MAX_COLUMNS   tables up to this width are never pruned (default 30)
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+TOP_TABLES = int(os.getenv("NL2DB_SCHEMA_TOP_TABLES", "3"))
+TOP_COLUMNS = int(os.getenv("NL2DB_SCHEMA_TOP_COLUMNS", "15"))
+MAX_COLUMNS = int(os.getenv("NL2DB_SCHEMA_MAX_COLUMNS", "30"))
+
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+_TOKEN = re.compile(r"[a-z]+|[0-9]+")
+_K1, _B = 1.2, 0.75
+
+def fold(tok: str) -> str:
+    """Plural -> singular for one lower-case word ("customers" -> "customer")."""
+    if len(tok) > 4 and tok.endswith("ies"):
+        return tok[:-3] + "y"
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+        return tok[:-1]
+    return tok
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens; camelCase and snake_case split, plurals folded, bare numbers dropped."""
+    return [fold(tok) for tok in _TOKEN.findall(_CAMEL.sub(r"\1 \2", text or "").lower()) if not tok.isdigit()]
+
+class _BM25:
+    def __init__(self, docs: List[Counter]):
+        self.docs = docs
+        self.avg_len = (sum(sum(d.values()) for d in docs) / len(docs)) if docs else 0.0
+        df = Counter()
+        for d in docs:
+            df.update(d.keys())
+        n = len(docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def score(self, i: int, query: Iterable[str]) -> float:
+        doc = self.docs[i]
+        length = sum(doc.values())
+        s = 0.0
+        for t in query:
+            tf = doc.get(t)
+            if tf:
+                s += self.idf[t] * tf * (_K1 + 1) / (tf + _K1 * (1 - _B + _B * length / (self.avg_len or 1)))
+        return s
+
+class SchemaIndex:
+    """
+    Built from catalog TableInfo objects (db/catalog.py); immutable, so one
+    index per catalog data version can be shared by every thread.
+    """
+
+    def __init__(self, tables: List, top_tables: int = None, top_columns: int = None, max_columns: int = None):
+        self.tables = tables
+        self.top_tables = TOP_TABLES if top_tables is None else top_tables
+        self.top_columns = TOP_COLUMNS if top_columns is None else top_columns
+        self.max_columns = MAX_COLUMNS if max_columns is None else max_columns
+        self._columns: List[Tuple[int, int]] = []   # doc -> (table idx, column idx)
+        col_docs, table_docs = [], []
+        for ti, t in enumerate(tables):
+            context = tokenize(t.name) + tokenize(t.description or "")
+            table_docs.append(Counter(context))
+            for ci, c in enumerate(t.columns):
+                words = tokenize(c.name)  # table context scores the table, not each column
+                for v in c.values or ():
+                    words += tokenize(str(v))
+                col_docs.append(Counter(words))
+                self._columns.append((ti, ci))
+        self._col_bm25 = _BM25(col_docs)
+        self._table_bm25 = _BM25(table_docs)
+
+    def settings(self) -> Tuple[int, int, int]:
+        return self.top_tables, self.top_columns, self.max_columns
+
+    def scores(self, question: str) -> Tuple[List[float], List[Dict[int, float]]]:
+        """(score per table, {column idx: score} per table) for `question`."""
+        query = set(tokenize(question))
+        col_scores: List[Dict[int, float]] = [{} for _ in self.tables]
+        for doc, (ti, ci) in enumerate(self._columns):
+            s = self._col_bm25.score(doc, query)
+            if s > 0:
+                col_scores[ti][ci] = s
+        table_scores = [
+            self._table_bm25.score(ti, query) + max(col_scores[ti].values(), default=0.0)
+            for ti in range(len(self.tables))
+        ]
+        return table_scores, col_scores
+
+    def select(self, question: str) -> List[Tuple[object, List[int]]]:
+        """
+        [(table, column indexes to list)] for `question`, best table first.
+        Nothing matching falls back to the first tables in catalog order.
+        """
+        table_scores, col_scores = self.scores(question)
+        ranked = sorted((i for i, s in enumerate(table_scores) if s > 0), key=lambda i: -table_scores[i])
+        if not ranked:
+            ranked = list(range(len(self.tables)))
+        out = []
+        for ti in ranked[: self.top_tables or None]:
+            table = self.tables[ti]
+            cols = list(range(len(table.columns)))
+            if self.max_columns and len(cols) > self.max_columns:
+                keep = set(sorted(col_scores[ti], key=lambda ci: -col_scores[ti][ci])[: self.top_columns])
+                for ci in cols:  # room left: leading columns (what "list all X" would show first)
+                    if len(keep) >= self.top_columns:
+                        break
+                    keep.add(ci)
+                keep |= {ci for ci in cols if table.columns[ci].name.lower().endswith("id")}
+                cols = [ci for ci in cols if ci in keep]
+            out.append((table, cols))
+        return out
@@ -0,0 +1,247 @@
+# db/sql_ast.py
+"""
+Parse-once layer for agent SQL.
+
+parse_sql(query, dialect) parses with sqlglot ONCE per distinct (dialect, text)
+and memoizes the result: the AST, the DuckDB text to execute and the canonical
+form used for result-cache keys. Translation (MySQL/PostgreSQL -> DuckDB),
+validation and canonicalization all read that one parse.
+
+validate_sql(parsed, allowed) checks the AST against a table/column allowlist
+(the tables registered on the connection, i.e. `mytable`): read-only queries
+only, no other tables, table functions or file reads, no unknown columns.
+
+parsed.template pulls the literals out of predicates and LIMIT/OFFSET
+(`Age > 40` -> `Age > $1`, params (40,)), so statements that differ only in
+literals share one template (and one prepared statement in query_runner).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import sqlglot
+from sqlglot import exp
+
+from db.tracing import annotate, metrics, span
+
+class QueryValidationError(ValueError):
+    """The statement is not a read-only query over the allowed tables/columns."""
+
+class SQLTemplate:
+    """DuckDB SQL with $1..$n in place of literals, plus the literal values."""
+    __slots__ = ("sql", "params")
+
+    def __init__(self, sql: str, params: Tuple[Any, ...]):
+        self.sql = sql
+        self.params = params
+
+_UNSET = object()
+
+class ParsedSQL:
+    """
+    One parsed statement. `tree` is shared by every caller: never mutate it,
+    work on tree.copy() instead.
+    """
+    __slots__ = ("source", "dialect", "tree", "duckdb_sql", "canonical", "_template", "_renders", "_tables")
+
+    def __init__(self, source: str, dialect: str, tree: exp.Expression):
+        self.source = source
+        self.dialect = dialect
+        self.tree = tree
+        self.duckdb_sql = tree.sql(dialect="duckdb")
+        # Only read-only queries get a canonical form (and so a result-cache key).
+        self.canonical = self.duckdb_sql if isinstance(tree, exp.Query) else None
+        self._template = _UNSET
+        self._renders: Dict[str, str] = {"duckdb": self.duckdb_sql}
+        self._tables: Optional[FrozenSet[str]] = None
+
+    def render(self, dialect: str) -> str:
+        """This statement as `dialect` SQL (memoized; "" = sqlglot's generic SQL)."""
+        text = self._renders.get(dialect)
+        if text is None:
+            text = self._renders[dialect] = self.tree.sql(dialect=dialect)
+        return text
+
+    @property
+    def tables(self) -> FrozenSet[str]:
+        """Lower-case names of the tables referenced (CTE names included; harmless)."""
+        if self._tables is None:
+            self._tables = frozenset(t.name.lower() for t in self.tree.find_all(exp.Table) if t.name)
+        return self._tables
+
+    @property
+    def template(self) -> Optional[SQLTemplate]:
+        """Parameterized form (None when the query has no literals to pull out)."""
+        if self._template is _UNSET:
+            self._template = _make_template(self.tree) if self.canonical is not None else None
+        return self._template
+
+    @property
+    def params(self) -> Tuple[Any, ...]:
+        t = self.template
+        return t.params if t is not None else ()
+
+# ---------------------------
+# Memoized parse
+# ---------------------------
+#   NL2DB_SQL_PARSE_CACHE_SIZE  distinct statements kept (default 2048; 0 disables)
+PARSE_CACHE_SIZE = int(os.getenv("NL2DB_SQL_PARSE_CACHE_SIZE", "2048"))
+
+_parsed: "OrderedDict[Tuple[str, str], ParsedSQL]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def parse_sql(query: str, dialect: str = "duckdb") -> ParsedSQL:
+    """
+    Parse `query` (first statement, like transpile()[0]) in `dialect`.
+    Raises sqlglot's ParseError on unparsable input.
+    """
+    key = (dialect, query)
+    with _lock:
+        hit = _parsed.get(key)
+        if hit is not None:
+            _parsed.move_to_end(key)
+            _stats["hits"] += 1
+    if hit is not None:
+        annotate(sql_parse_cache="hit")
+        return hit
+
+    annotate(sql_parse_cache="miss")
+    with span("sql_parse", dialect=dialect):
+        statements = [s for s in sqlglot.parse(query, read=dialect) if s is not None]
+        if not statements:
+            raise sqlglot.errors.ParseError("empty statement")
+        parsed = ParsedSQL(query, dialect, statements[0])
+
+    with _lock:
+        _stats["misses"] += 1
+        if PARSE_CACHE_SIZE > 0:
+            _parsed[key] = parsed
+            while len(_parsed) > PARSE_CACHE_SIZE:
+                _parsed.popitem(last=False)
+    return parsed
+
+def clear_parse_cache() -> None:
+    with _lock:
+        _parsed.clear()
+
+def parse_cache_stats() -> Dict[str, int]:
+    with _lock:
+        out = dict(_stats)
+        out["entries"] = len(_parsed)
+    return out
+
+metrics.register_source("sql_parse_cache", parse_cache_stats)
+
+# ---------------------------
+# Allowlist validation
+# ---------------------------
+def validate_sql(parsed: ParsedSQL, allowed: Dict[str, Set[str]]) -> None:
+    """
+    Raise QueryValidationError unless `parsed` is a read-only query that only
+    reads tables in `allowed` (lower-case table -> lower-case column names).
+    Names the query defines itself (CTEs, aliases) are allowed too.
+    """
+    tree = parsed.tree
+    if not isinstance(tree, exp.Query):
+        raise QueryValidationError(f"only SELECT queries are allowed, got {tree.key.upper()}")
+
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    for table in tree.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            raise QueryValidationError("table functions are not allowed")
+        name = table.name.lower()
+        if table.args.get("db") or table.args.get("catalog"):
+            raise QueryValidationError(f"qualified table {table.sql(dialect='duckdb')} is not allowed")
+        if name not in allowed and name not in ctes:
+            raise QueryValidationError(f"unknown table {table.name}")
+
+    known = set().union(*allowed.values()) if allowed else set()
+    known |= {a.alias.lower() for a in tree.find_all(exp.Alias) if a.alias}
+    for alias in tree.find_all(exp.TableAlias):
+        known |= {c.name.lower() for c in alias.columns}
+    for column in tree.find_all(exp.Column):
+        if column.name and column.name.lower() not in known:
+            raise QueryValidationError(f"unknown column {column.name}")
+
+# ---------------------------
+# Parameterized templates
+# ---------------------------
+# Literals count as parameters only where a value is expected: comparison
+# operands, IN lists, BETWEEN bounds, LIKE patterns, LIMIT/OFFSET. Select-list
+# constants, GROUP BY/ORDER BY positions and casts stay part of the template.
+_PARAM_SLOTS = {
+    exp.EQ: ("this", "expression"), exp.NEQ: ("this", "expression"),
+    exp.GT: ("this", "expression"), exp.GTE: ("this", "expression"),
+    exp.LT: ("this", "expression"), exp.LTE: ("this", "expression"),
+    exp.Like: ("expression",), exp.ILike: ("expression",),
+    exp.In: ("expressions",), exp.Between: ("low", "high"),
+    exp.Limit: ("expression",), exp.Offset: ("expression",),
+}
+_NO_VALUE = object()
+
+def _number(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def _literal_value(node: exp.Expression):
+    if isinstance(node, exp.Literal):
+        return node.this if node.is_string else _number(node.this)
+    if isinstance(node, exp.Neg) and isinstance(node.this, exp.Literal) and not node.this.is_string:
+        return -_number(node.this.this)
+    return _NO_VALUE
+
+def param_nodes(tree: exp.Expression) -> List[Tuple[exp.Expression, Any]]:
+    """(node, value) for every parameterizable literal, in a stable walk order."""
+    out = []
+    for node in tree.walk(bfs=False):
+        parent = node.parent
+        slots = _PARAM_SLOTS.get(type(parent)) if parent is not None else None
+        if not slots or node.arg_key not in slots:
+            continue
+        value = _literal_value(node)
+        if value is not _NO_VALUE:
+            out.append((node, value))
+    return out
+
+def _make_template(tree: exp.Expression) -> Optional[SQLTemplate]:
+    copy = tree.copy()
+    nodes = param_nodes(copy)
+    if not nodes:
+        return None
+    for i, (node, _) in enumerate(nodes, 1):
+        node.replace(exp.Placeholder(this=str(i)))
+    return SQLTemplate(copy.sql(dialect="duckdb"), tuple(v for _, v in nodes))
+
+def sql_literal(value: Any) -> str:
+    """DuckDB literal text for a template parameter."""
+    return exp.convert(value).sql(dialect="duckdb")
+
+def render_sql(parsed: ParsedSQL, values: Dict[int, Any], dialect: Optional[str] = None) -> str:
+    """
+    Re-render `parsed` with some parameters (by index in parsed.params) replaced,
+    in `dialect` (default: the dialect it was parsed from).
+    """
+    copy = parsed.tree.copy()
+    for i, (node, _) in enumerate(param_nodes(copy)):
+        if i in values:
+            node.replace(exp.convert(values[i]))
+    return copy.sql(dialect=dialect or parsed.dialect)
+
+def allowed_columns(cursor, tables) -> Dict[str, Set[str]]:
+    """
+    Allowlist for `tables` as seen by `cursor`: lower-case table -> column names.
+    """
+    wanted = {t.lower() for t in tables}
+    rows = cursor.execute(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_catalog = current_database() AND table_schema = 'main'"
+    ).fetchall()
+    out: Dict[str, Set[str]] = {t: set() for t in wanted}
+    for table, column in rows:
+        if table.lower() in wanted:
+            out[table.lower()].add(column.lower())
+    return out
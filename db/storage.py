@@ -0,0 +1,494 @@
+# db/storage.py
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ---------------------------
+# Persistent columnar store for CSV / Parquet / JSON sources
+# ---------------------------
+# Each source file is ingested ONCE into its own DuckDB file under STORE_DIR. Later
+# process starts only stat the file (and hash it if the mtime moved) and attach the
+# store read-only; nothing is parsed or copied into pandas. Column statistics are
+# computed at ingest and stored next to the data (_nl2db_columns), so the catalog
+# (db/catalog.py) never rescans a table to describe it. Changed sources are applied
+# incrementally by db/refresh.py (update_store), not re-ingested.
+#
+# A table with rollup dimensions also keeps a CUBE of pre-aggregates over them
+# (_nl2db_cube, see build_cube), maintained with the table; db/rollups.py rewrites
+# aggregate queries to read it.
+#   NL2DB_STORE_DIR        where .duckdb store files live (default db/.store)
+#   NL2DB_ROLLUP_MAX_DIMS  dimensions per cube; it holds 2^n groupings (default 6)
+STORE_DIR = os.getenv("NL2DB_STORE_DIR", os.path.join("db", ".store"))
+ROLLUP_MAX_DIMS = int(os.getenv("NL2DB_ROLLUP_MAX_DIMS", "6"))
+
+_META_TABLE = "_nl2db_source"
+_STATS_TABLE = "_nl2db_columns"
+_CUBE_TABLE = "_nl2db_cube"
+_ROLLUP_TABLE = "_nl2db_rollup"
+_build_lock = threading.RLock()
+# store path -> [lock file descriptor, depth] of the store_lock()s this process holds
+_file_locks = {}
+# store path -> store_identity() of the file last attached in this process
+_attached = {}
+# Stores attach as "store_<table>#<n>": a swap attaches the new file under a new
+# alias, so queries already running on the old one are never cut off.
+_ALIAS_SEQ = itertools.count(1)
+
+# File extension -> DuckDB reader
+_READERS = {
+    ".csv": "read_csv(?, header = true)",
+    ".tsv": "read_csv(?, header = true, delim = '\t')",
+    ".parquet": "read_parquet(?)",
+    ".json": "read_json_auto(?)",
+    ".jsonl": "read_json_auto(?, format = 'newline_delimited')",
+    ".ndjson": "read_json_auto(?, format = 'newline_delimited')",
+}
+
+# Text columns with at most this many distinct values keep their values (for prompts).
+CATEGORICAL_MAX = 20
+
+def _reader(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _READERS:
+        raise ValueError(f"unsupported source format: {path}")
+    return _READERS[ext]
+
+def column_stats(conn, relation: str):
+    """
+    Per-column stats of `relation` (a quoted table/view name) in one SUMMARIZE pass:
+    [{"name", "type", "distinct", "min", "max", "null_pct", "rows", "values"}].
+    "values" lists the values of low-cardinality text columns (else None).
+    """
+    out = []
+    for name, ctype, lo, hi, distinct, rows, null_pct in conn.execute(
+        f"SELECT column_name, column_type, min, max, approx_unique, count, null_percentage FROM (SUMMARIZE {relation})"
+    ).fetchall():
+        values = None
+        if ctype == "VARCHAR" and distinct is not None and distinct <= CATEGORICAL_MAX:
+            quoted = '"' + name.replace('"', '""') + '"'
+            values = [v for (v,) in conn.execute(
+                f"SELECT DISTINCT {quoted} FROM {relation} WHERE {quoted} IS NOT NULL ORDER BY 1 LIMIT {CATEGORICAL_MAX + 1}"
+            ).fetchall()]
+            if len(values) > CATEGORICAL_MAX:
+                values = None
+        out.append({
+            "name": name, "type": ctype, "distinct": distinct, "min": lo, "max": hi,
+            "null_pct": float(null_pct) if null_pct is not None else None, "rows": rows, "values": values,
+        })
+    return out
+
+NUMERIC_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                 "UINTEGER", "UBIGINT", "UHUGEINT", "FLOAT", "DOUBLE", "DECIMAL")
+
+def _bound(pick, ctype: str, a, b):
+    # SUMMARIZE reports min/max as text: compare numbers as numbers.
+    if a is None or b is None:
+        return b if a is None else a
+    if ctype.split("(")[0] in NUMERIC_TYPES:
+        return a if pick(float(a), float(b)) == float(a) else b
+    return pick(a, b)
+
+def merge_stats(old, added):
+    """
+    Column stats after appending rows whose own stats are `added` to a table
+    described by `old` (see column_stats), without rescanning the table.
+    Distinct counts are exact for columns that keep their values, otherwise
+    approximate (the larger of the two).
+    """
+    by_name = {s["name"]: s for s in added}
+    out = []
+    for o in old:
+        a = by_name.get(o["name"])
+        if a is None or not a["rows"]:
+            out.append(o)
+            continue
+        rows = o["rows"] + a["rows"]
+        values = None
+        if o["values"] is not None and a["values"] is not None:
+            values = sorted(set(o["values"]) | set(a["values"]))
+            if len(values) > CATEGORICAL_MAX:
+                values = None
+        null_pct = None
+        if o["null_pct"] is not None and a["null_pct"] is not None:
+            null_pct = (o["null_pct"] * o["rows"] + a["null_pct"] * a["rows"]) / rows
+        out.append(dict(
+            o, rows=rows, values=values, null_pct=null_pct,
+            min=_bound(min, o["type"], o["min"], a["min"]), max=_bound(max, o["type"], o["max"], a["max"]),
+            distinct=len(values) if values is not None else max(o["distinct"] or 0, a["distinct"] or 0),
+        ))
+    return out
+
+def store_path(csv_path: str) -> str:
+    """
+    <stem>-<hash of the absolute source path>.duckdb: data/a/x.csv, data/b/x.csv
+    and x.parquet each get their own store.
+    """
+    path = os.path.abspath(csv_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha256(path.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(STORE_DIR, f"{name}-{digest}.duckdb")
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _read_meta(db_path: str):
+    try:
+        conn = duckdb.connect(db_path, read_only=True)
+    except duckdb.Error:
+        return None
+    try:
+        row = conn.execute(f"SELECT size, mtime_ns, sha256 FROM {_META_TABLE}").fetchone()
+    except duckdb.Error:
+        row = None
+    finally:
+        conn.close()
+    return row
+
+class StoreChanged(Exception):
+    """The store no longer holds the source state an update was computed against."""
+
+@contextmanager
+def store_lock(db_path: str):
+    """
+    Exclusive lock on the store `db_path` across threads and processes (a lock
+    on "<store>.lock"), re-entrant within the holding thread. Every worker runs
+    a refresh watcher: whoever reads a store's meta to change it must hold this
+    from the read until its copy replaced the store.
+    """
+    with _build_lock:
+        held = _file_locks.get(db_path)
+        if held is None:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            fd = os.open(f"{db_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            except BaseException:
+                os.close(fd)
+                raise
+            held = _file_locks[db_path] = [fd, 0]
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if not held[1]:
+                del _file_locks[db_path]
+                if fcntl is not None:
+                    fcntl.flock(held[0], fcntl.LOCK_UN)
+                else:
+                    os.lseek(held[0], 0, os.SEEK_SET)
+                    msvcrt.locking(held[0], msvcrt.LK_UNLCK, 1)
+                os.close(held[0])
+
+def store_meta(db_path: str):
+    """(size, mtime_ns, sha256) of the source as last ingested into `db_path`, or None."""
+    if not os.path.exists(db_path):
+        return None
+    return _read_meta(db_path)
+
+def is_stale(csv_path: str, db_path: str = None) -> bool:
+    """
+    True when the store is missing or the CSV changed since ingest.
+    Cheap path: size + mtime. A moved mtime with identical content (sha256) is not stale.
+    """
+    db_path = db_path or store_path(csv_path)
+    if not os.path.exists(db_path):
+        return True
+    meta = _read_meta(db_path)
+    if meta is None:
+        return True
+    size, mtime_ns, sha = meta
+    st = os.stat(csv_path)
+    if st.st_size != size:
+        return True
+    if st.st_mtime_ns == mtime_ns:
+        return False
+    return _file_sha256(csv_path) != sha
+
+# ---------------------------
+# Rollup cube
+# ---------------------------
+# Scalar types a cube keeps count/min/max of (and sum, when numeric).
+_CUBE_TYPES = NUMERIC_TYPES + ("VARCHAR", "BOOLEAN", "DATE", "TIME", "TIMESTAMP", "TIMESTAMP WITH TIME ZONE")
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _cube_select(relation: str, spec: dict) -> str:
+    # GROUPING(...) has the bit of every rolled-up dimension set (first dimension = highest bit).
+    dims = ", ".join(_quote(d) for d in spec["dims"])
+    parts = [f"GROUPING({dims}) AS _gid", dims, "count(*) AS _rows"]
+    for i, (name, _, numeric) in enumerate(spec["columns"]):
+        c = _quote(name)
+        parts += [f"count({c}) AS _n_{i}", f"min({c}) AS _lo_{i}", f"max({c}) AS _hi_{i}"]
+        if numeric:
+            parts.append(f"sum({c}) AS _s_{i}")
+    return f"SELECT {', '.join(parts)} FROM {relation} GROUP BY CUBE ({dims})"
+
+def build_cube(conn, table: str, dims) -> None:
+    """
+    (Re)build the cube of `table` over `dims` in a store being written: for every
+    subset of the dimensions (told apart by _gid), one row per combination
+    present with the row count and, per column i, count/min/max (_n_i/_lo_i/_hi_i)
+    and the sum of numeric columns (_s_i). Empty `dims` drops the cube.
+    """
+    conn.execute(f"DROP TABLE IF EXISTS {_CUBE_TABLE}")
+    conn.execute(f"CREATE OR REPLACE TABLE {_ROLLUP_TABLE} (spec VARCHAR)")
+    if not dims:
+        return
+    dims = list(dims)
+    if len(dims) > ROLLUP_MAX_DIMS:
+        raise ValueError(f"{len(dims)} rollup dimensions for {table}; at most {ROLLUP_MAX_DIMS}")
+    types = dict(conn.execute(f"SELECT column_name, column_type FROM (DESCRIBE {_quote(table)})").fetchall())
+    missing = [d for d in dims if d not in types]
+    if missing:
+        raise ValueError(f"rollup dimensions not in {table}: {missing}")
+    spec = {"table": table, "dims": dims, "columns": [
+        [name, ctype, ctype.split("(")[0] in NUMERIC_TYPES]
+        for name, ctype in types.items() if ctype.split("(")[0] in _CUBE_TYPES
+    ]}
+    conn.execute(f"CREATE TABLE {_CUBE_TABLE} AS {_cube_select(_quote(table), spec)} ORDER BY _gid")
+    conn.execute(f"INSERT INTO {_ROLLUP_TABLE} VALUES (?)", [json.dumps(spec)])
+
+def _cube_spec(conn, prefix: str = ""):
+    try:
+        row = conn.execute(f"SELECT spec FROM {prefix}{_ROLLUP_TABLE}").fetchone()
+    except duckdb.Error:
+        return None
+    return json.loads(row[0]) if row else None
+
+def merge_cube(conn, appended: str) -> None:
+    """
+    Fold the rows of `appended` (just added to the table) into its cube: the
+    cube of the new rows is combined with the old one group by group, so the
+    cost follows the cube's size, not the table's.
+    """
+    spec = _cube_spec(conn)
+    if spec is None:
+        return
+    keys = ["_gid"] + [_quote(d) for d in spec["dims"]]
+    parts = keys + ["sum(_rows)::BIGINT AS _rows"]
+    for i, (_, _, numeric) in enumerate(spec["columns"]):
+        parts += [f"sum(_n_{i})::BIGINT AS _n_{i}", f"min(_lo_{i}) AS _lo_{i}", f"max(_hi_{i}) AS _hi_{i}"]
+        if numeric:
+            parts.append(f"sum(_s_{i}) AS _s_{i}")
+    conn.execute(
+        f"CREATE OR REPLACE TABLE {_CUBE_TABLE} AS SELECT {', '.join(parts)} FROM "
+        f"(SELECT * FROM {_CUBE_TABLE} UNION ALL BY NAME {_cube_select(appended, spec)}) "
+        f"GROUP BY {', '.join(keys)} ORDER BY _gid"
+    )
+
+def cube_view(table: str) -> str:
+    """Main-catalog view over the attached cube of `table` (see attach_store)."""
+    return f"_nl2db_cube_{table}"
+
+def stored_cube(conn, table: str = "mytable", alias: str = None):
+    """
+    Spec of the cube kept for an attached `table` ({"table", "dims", "columns":
+    [[name, type, numeric], ...]}; column i is _n_i/_lo_i/_hi_i/_s_i), or None.
+    """
+    return _cube_spec(conn, f'"{alias or current_alias(conn, table)}".main.')
+
+def _stored_dims(db_path: str):
+    try:
+        conn = duckdb.connect(db_path, read_only=True)
+    except duckdb.Error:
+        return None
+    try:
+        spec = _cube_spec(conn)
+    finally:
+        conn.close()
+    return spec["dims"] if spec else []
+
+def ingest_source(source_path: str, table: str = "mytable", db_path: str = None, rollup=None) -> str:
+    """
+    (Re)build the store for `source_path` (CSV, Parquet or JSON): DuckDB's own reader
+    straight into a columnar table plus its column stats (and its cube over the
+    `rollup` dimensions), written to a temp file and swapped in atomically so
+    readers (other processes) never see a half-built store. Returns the store path.
+    """
+    db_path = db_path or store_path(source_path)
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    tmp_path = f"{db_path}.{os.getpid()}.{int(time.time() * 1000)}.tmp"
+    st = os.stat(source_path)
+    sha = _file_sha256(source_path)
+
+    conn = duckdb.connect(tmp_path)
+    try:
+        conn.execute(f'CREATE TABLE "{table}" AS SELECT * FROM {_reader(source_path)}', [source_path])
+        conn.execute(f"CREATE TABLE {_STATS_TABLE} (ord INTEGER, stats VARCHAR)")
+        conn.execute(f"CREATE TABLE {_META_TABLE} (path VARCHAR, tbl VARCHAR, size BIGINT, mtime_ns BIGINT, sha256 VARCHAR)")
+        _write_meta(conn, source_path, table, st, sha)
+        build_cube(conn, table, rollup)
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return db_path
+
+def _write_meta(conn, source_path: str, table: str, st: os.stat_result, sha: str, stats=None) -> None:
+    # Column stats of `table` (scanned unless given) plus the source file state they correspond to.
+    if stats is None:
+        stats = column_stats(conn, f'"{table}"')
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {_STATS_TABLE} (ord INTEGER, stats VARCHAR)")  # stores from before stats
+    conn.execute(f"DELETE FROM {_STATS_TABLE}")
+    conn.executemany(
+        f"INSERT INTO {_STATS_TABLE} VALUES (?, ?)",
+        [[i, json.dumps(s, default=str)] for i, s in enumerate(stats)],
+    )
+    conn.execute(f"DELETE FROM {_META_TABLE}")
+    conn.execute(
+        f"INSERT INTO {_META_TABLE} VALUES (?, ?, ?, ?, ?)",
+        [os.path.abspath(source_path), table, st.st_size, st.st_mtime_ns, sha],
+    )
+
+def update_store(source_path: str, table: str, apply, st: os.stat_result, sha: str,
+                 db_path: str = None, appended: str = None, rollup=None, expect=None) -> str:
+    """
+    Incremental counterpart of ingest_source: copy the current store, let
+    apply(conn) change `table` in the copy (only the new/changed rows), refresh
+    its column stats, cube and the recorded source state (`st`, `sha`: the file
+    the changes came from), then swap the copy in atomically. Copying the
+    compressed columnar file is far cheaper than parsing the whole source again.
+    :param appended: a relation apply() left in the copy holding only rows it
+        appended; stats and cube are then merged from it, not rebuilt
+    :param rollup: rebuild the cube over these dimensions instead ([] drops it)
+    :param expect: the store_meta() the changes were computed from; StoreChanged
+        (nothing written) when the copy holds another source state
+    """
+    db_path = db_path or store_path(source_path)
+    tmp_path = f"{db_path}.{os.getpid()}.{int(time.time() * 1000)}.tmp"
+    with store_lock(db_path):
+        shutil.copyfile(db_path, tmp_path)
+        try:
+            conn = duckdb.connect(tmp_path)
+            try:
+                if expect is not None:
+                    found = conn.execute(f"SELECT size, mtime_ns, sha256 FROM {_META_TABLE}").fetchone()
+                    if tuple(found or ()) != tuple(expect):
+                        raise StoreChanged(db_path)
+                apply(conn)
+                stats = None
+                if appended is not None:
+                    old = [json.loads(s) for (s,) in conn.execute(f"SELECT stats FROM {_STATS_TABLE} ORDER BY ord").fetchall()]
+                    stats = merge_stats(old, column_stats(conn, appended)) if old else None
+                _write_meta(conn, source_path, table, st, sha, stats)
+                if rollup is not None:
+                    build_cube(conn, table, rollup)
+                elif appended is not None:
+                    merge_cube(conn, appended)
+                else:
+                    spec = _cube_spec(conn)
+                    if spec is not None:
+                        build_cube(conn, table, spec["dims"])
+                conn.execute("CHECKPOINT")
+            finally:
+                conn.close()
+            os.replace(tmp_path, db_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return db_path
+
+def ensure_store(csv_path: str, table: str = "mytable", rollup=None) -> str:
+    """
+    Return a fresh store path for `csv_path`, ingesting only when missing/stale.
+    With `rollup` (dimensions; [] = none), a cube over other dimensions is
+    rebuilt from the stored table (the source is not read again).
+    """
+    db_path = store_path(csv_path)
+    with store_lock(db_path):
+        if is_stale(csv_path, db_path):
+            ingest_source(csv_path, table=table, db_path=db_path, rollup=rollup)
+        elif rollup is not None and _stored_dims(db_path) != list(rollup):
+            sha = store_meta(db_path)[2]
+            update_store(csv_path, table, lambda conn: None, os.stat(csv_path), sha, db_path=db_path, rollup=rollup)
+    return db_path
+
+def store_identity(db_path: str):
+    """Changes whenever the store file is replaced (by this or another process)."""
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def attached_identity(db_path: str):
+    """store_identity() of `db_path` when this process last attached it (None = never)."""
+    return _attached.get(os.path.abspath(db_path))
+
+def _aliases(conn, table: str):
+    # (n, alias) of the attached stores of `table`, oldest first.
+    prefix = f"store_{table}#"
+    found = []
+    for (name,) in conn.execute("SELECT database_name FROM duckdb_databases()").fetchall():
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            found.append((int(name[len(prefix):]), name))
+    return sorted(found)
+
+def current_alias(conn, table: str = "mytable") -> str:
+    """Alias of the store the `table` view reads (the newest one attached)."""
+    found = _aliases(conn, table)
+    return found[-1][1] if found else f"store_{table}"
+
+def attach_store(conn, csv_path: str, table: str = "mytable", alias: str = None, rollup=None, retire=None) -> str:
+    """
+    ATTACH the (fresh) store read-only into `conn` and expose `table` as a view
+    in the main catalog, so queries keep saying `FROM mytable` (and its cube, if
+    any, as cube_view(table)). Re-attaching after the CSV changed swaps in the
+    rebuilt file: it is attached under a new alias and the views switch to it;
+    the previous aliases go to retire(aliases), which must DETACH them once no
+    query still reads them (default: at once). `rollup`: see ensure_store.
+    """
+    db_path = ensure_store(csv_path, table=table, rollup=rollup)
+    old = [name for _, name in _aliases(conn, table)]
+    alias = alias or f"store_{table}#{next(_ALIAS_SEQ)}"
+    quoted = db_path.replace("'", "''")  # ATTACH takes no bind parameters
+    conn.execute(f"ATTACH '{quoted}' AS \"{alias}\" (READ_ONLY)")
+    conn.execute(f'CREATE OR REPLACE VIEW "{table}" AS SELECT * FROM "{alias}".main."{table}"')
+    if stored_cube(conn, table, alias) is not None:
+        conn.execute(f'CREATE OR REPLACE VIEW {_quote(cube_view(table))} AS SELECT * FROM "{alias}".main.{_CUBE_TABLE}')
+    else:
+        conn.execute(f"DROP VIEW IF EXISTS {_quote(cube_view(table))}")
+    _attached[os.path.abspath(db_path)] = store_identity(db_path)
+    if old:
+        (retire or (lambda aliases: detach_stores(conn, aliases)))(old)
+    return db_path
+
+def detach_stores(conn, aliases) -> None:
+    """DETACH store aliases retired by attach_store."""
+    for alias in aliases:
+        conn.execute(f'DETACH DATABASE IF EXISTS "{alias}"')
+
+def stored_stats(conn, table: str = "mytable", alias: str = None):
+    """
+    Column stats saved at ingest for an attached store (see column_stats), or
+    None for stores built before stats were kept.
+    """
+    alias = alias or current_alias(conn, table)
+    try:
+        rows = conn.execute(f'SELECT stats FROM "{alias}".main.{_STATS_TABLE} ORDER BY ord').fetchall()
+    except duckdb.Error:
+        return None
+    return [json.loads(s) for (s,) in rows]
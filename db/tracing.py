@@ -0,0 +1,245 @@
+# db/tracing.py
+"""
+Per-request tracing and process-wide metrics.
+
+- trace(name): one per request (run_supervisor & co.); collects spans + attributes
+- span(stage): times one stage (supervisor_llm, agent_llm, sql_parse, validate_sql,
+  duckdb_execute, mongo_execute, to_pandas, ...) into the current trace and the
+  stage histograms; an exception marks the span (and the trace) with the stage
+  that failed, even though agents still return the generic "error occurred"
+- annotate(**attrs): cache status, token counts, route, ... on the current trace
+- render_prometheus() / serve_metrics(port): Prometheus text exposition
+Finished traces are logged as one JSON line on the "nl2db.trace" logger.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("nl2db.trace")
+if os.getenv("NL2DB_TRACE_LOG"):
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("nl2db_trace", default=None)
+
+# ---------------------------
+# Traces and spans
+# ---------------------------
+class Trace:
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.spans = []
+        self.total_ms = None
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, ms: float, **attrs) -> None:
+        with self._lock:
+            self.spans.append({"name": name, "ms": round(ms, 3), **attrs})
+            if "error" in attrs and "error_stage" not in self.attrs:
+                self.attrs["error_stage"] = name
+                self.attrs["error_type"] = attrs["error"]
+
+    def set(self, **attrs) -> None:
+        with self._lock:
+            self.attrs.update(attrs)
+
+    def add(self, key: str, value: float) -> None:
+        with self._lock:
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def finish(self) -> None:
+        self.total_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "total_ms": self.total_ms,
+                "spans": list(self.spans),
+                **self.attrs,
+            }
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    Start a request trace. Nested calls reuse the outer trace (one per request).
+    """
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+    t = Trace(name, **attrs)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        t.finish()
+        _finish_trace(t)
+
+@contextmanager
+def span(stage: str, **attrs):
+    """
+    Time a stage. Yields a dict the caller may add attributes to (rows, cache, ...).
+    """
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        metrics.observe(stage, ms, attrs.get("error"))
+        t = _current.get()
+        if t is not None:
+            t.add_span(stage, ms, **attrs)
+
+def annotate(**attrs) -> None:
+    t = _current.get()
+    if t is not None:
+        t.set(**attrs)
+
+def record_tokens(prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    """Add LLM token usage to the current trace and the process counters."""
+    metrics.inc("llm_tokens_total", prompt_tokens, kind="prompt")
+    metrics.inc("llm_tokens_total", completion_tokens, kind="completion")
+    t = _current.get()
+    if t is not None:
+        t.add("prompt_tokens", prompt_tokens)
+        t.add("completion_tokens", completion_tokens)
+
+def _finish_trace(t: Trace) -> None:
+    success = t.attrs.get("success")
+    metrics.inc("requests_total", 1, entry=t.name, route=str(t.attrs.get("route")), success=str(success).lower())
+    metrics.observe("request", t.total_ms, None if success is not False else t.attrs.get("error_type", "failed"))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(t.to_dict(), default=str))
+
+# ---------------------------
+# Metrics (Prometheus text format)
+# ---------------------------
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[str, list] = {}       # stage -> [bucket counts..., count, sum]
+        self._counters: Dict[tuple, float] = {}
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def observe(self, stage: str, ms: float, error: Optional[str] = None) -> None:
+        with self._lock:
+            h = self._hist.setdefault(stage, [0] * (len(BUCKETS_MS) + 2))
+            for i, edge in enumerate(BUCKETS_MS):
+                if ms <= edge:
+                    h[i] += 1
+            h[-2] += 1
+            h[-1] += ms
+            if error:
+                key = ("stage_errors_total", (("error", error), ("stage", stage)))
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_source(self, name: str, fn: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Expose a stats() dict (cache/pool counters) as gauges `nl2db_<name>_<key>`.
+        """
+        with self._lock:
+            self._sources[name] = fn
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            hist = {k: list(v) for k, v in self._hist.items()}
+            counters = dict(self._counters)
+            sources = dict(self._sources)
+
+        if hist:
+            lines.append("# HELP nl2db_stage_duration_ms Time spent per pipeline stage.")
+            lines.append("# TYPE nl2db_stage_duration_ms histogram")
+            for stage, h in sorted(hist.items()):
+                for i, edge in enumerate(BUCKETS_MS):
+                    lines.append(f'nl2db_stage_duration_ms_bucket{{stage="{stage}",le="{edge}"}} {h[i]}')
+                lines.append(f'nl2db_stage_duration_ms_bucket{{stage="{stage}",le="+Inf"}} {h[-2]}')
+                lines.append(f'nl2db_stage_duration_ms_count{{stage="{stage}"}} {h[-2]}')
+                lines.append(f'nl2db_stage_duration_ms_sum{{stage="{stage}"}} {h[-1]:.3f}')
+
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE nl2db_{name} counter")
+                seen.add(name)
+            label_txt = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"nl2db_{name}{{{label_txt}}} {value:g}")
+
+        for source, fn in sorted(sources.items()):
+            try:
+                stats = fn()
+            except Exception:
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE nl2db_{source}_{key} gauge")
+                lines.append(f"nl2db_{source}_{key} {value:g}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def render_prometheus() -> str:
+    return metrics.render()
+
+# ---------------------------
+# /metrics endpoint
+# ---------------------------
+_server = None
+_server_lock = threading.Lock()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # keep stderr quiet
+        pass
+
+def serve_metrics(port: int = 9464, host: str = "127.0.0.1"):
+    """
+    Serve GET /metrics on a daemon thread. Idempotent per process (Streamlit reruns).
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="nl2db-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,286 @@
+# server.py
+"""
+Headless HTTP/JSON API around run_supervisor: a plain ASGI app (no web
+framework), served by uvicorn with several worker processes. The Streamlit UI
+becomes a client of it when NL2DB_API_URL is set (see api_client.py).
+
+  python server.py --workers 4 --port 8000
+  uvicorn server:app --workers 4          # same app, any ASGI server
+
+Endpoints:
+  POST /query    {"query": "...", "language": "SQL", "routing": "auto", "page_size": 200}
+  POST /page     {"token": <"page"."token" of a /query or /page result>, "offset": 400}   (offset optional)
+  GET  /health   {"status": "ok", "pid": ...}
+  GET  /metrics  Prometheus text of the worker that answers
+
+Results are run_supervisor dicts as JSON, "data" as a list of records. With
+"Accept: application/vnd.apache.arrow.stream" a tabular result comes back as an
+Arrow IPC stream instead; its schema metadata "nl2db" holds the other keys as
+JSON (errors and non-tabular results stay JSON). A listing cut by the cost
+guard's automatic LIMIT says so: "truncated": true, "row_limit": 10000.
+
+A paged result's "page" holds route/offset/limit/has_more and an opaque
+"token": the query to page through, signed (HMAC-SHA256) by the server. /page
+runs only what a valid, unexpired token names, so clients cannot send queries
+of their own there. All workers sign with the same key:
+  NL2DB_API_SECRET     signing key (default: random, kept in NL2DB_CACHE_DIR/page.key)
+  NL2DB_PAGE_TOKEN_TTL seconds a page token stays valid (default 3600)
+
+Workers share the translation and result caches through SQLite files (WAL), so
+a question answered by one worker is a cache hit on all of them:
+  NL2DB_CACHE_DIR      directory of the shared cache files (default db/.cache)
+  NL2DB_API_WORKERS    worker processes for `python server.py` (default 4)
+NL2DB_TRANSLATION_CACHE_DB / NL2DB_RESULT_CACHE_DB, when set, take precedence.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+import time
+
+# Before the caches are imported: every worker imports this module and opens
+# the same files.
+CACHE_DIR = os.getenv("NL2DB_CACHE_DIR", os.path.join("db", ".cache"))
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.environ.setdefault("NL2DB_TRANSLATION_CACHE_DB", os.path.join(CACHE_DIR, "translations.sqlite"))
+os.environ.setdefault("NL2DB_RESULT_CACHE_DB", os.path.join(CACHE_DIR, "results.sqlite"))
+
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+from agents.supervisor import arun_supervisor, fetch_page  # noqa: E402
+from db.executor import run_blocking  # noqa: E402
+from db.refresh import start_watcher  # noqa: E402
+from db.tracing import render_prometheus  # noqa: E402
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MAX_BODY_BYTES = 1024 * 1024
+PAGE_TOKEN_TTL = float(os.getenv("NL2DB_PAGE_TOKEN_TTL", "3600"))
+_PAGE_PUBLIC = ("route", "offset", "limit", "has_more")
+
+class _BadRequest(Exception):
+    pass
+
+# ---------------------------
+# Page tokens
+# ---------------------------
+def _load_secret() -> bytes:
+    secret = os.getenv("NL2DB_API_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    path = os.path.join(CACHE_DIR, "page.key")
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    # First worker up writes the key; link() fails if another one won the race.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_bytes(32))
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+    with open(path, "rb") as f:
+        return f.read()
+
+_SECRET = _load_secret()
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def sign_page(page: dict) -> dict:
+    """The client's view of a page descriptor: its public keys plus a signed "token"."""
+    body = json.dumps({"page": page, "exp": time.time() + PAGE_TOKEN_TTL}, separators=(",", ":"), default=str)
+    payload = body.encode("utf-8")
+    mac = hmac.new(_SECRET, payload, hashlib.sha256).digest()
+    public = {k: page[k] for k in _PAGE_PUBLIC if k in page}
+    return {**public, "token": _b64(payload) + "." + _b64(mac)}
+
+def verify_page(token) -> dict:
+    """The page descriptor `token` was signed for; _BadRequest if forged, mangled or expired."""
+    try:
+        payload, mac = (_unb64(part) for part in token.split("."))
+    except (AttributeError, ValueError):
+        raise _BadRequest("invalid page token")
+    if not hmac.compare_digest(mac, hmac.new(_SECRET, payload, hashlib.sha256).digest()):
+        raise _BadRequest("invalid page token")
+    signed = json.loads(payload)
+    if signed["exp"] < time.time():
+        raise _BadRequest("page token expired; run the query again")
+    return signed["page"]
+
+# ---------------------------
+# Encoding
+# ---------------------------
+def _meta(out: dict) -> str:
+    return json.dumps({k: v for k, v in out.items() if k != "data"}, default=str)
+
+def encode_json(out: dict) -> bytes:
+    data = out.get("data")
+    if isinstance(data, pd.DataFrame):
+        records = data.to_json(orient="records", date_format="iso", default_handler=str)
+    else:
+        records = json.dumps(data, default=str)
+    # Splice the records in as text: no json.loads/dumps round trip of the rows.
+    return ('{"data": ' + records + ", " + _meta(out)[1:]).encode("utf-8")
+
+def encode_arrow(out: dict):
+    """Arrow IPC stream of out["data"] with the other keys in the schema metadata; None = send JSON."""
+    data = out.get("data")
+    if not out.get("success") or not isinstance(data, pd.DataFrame):
+        return None
+    try:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None  # mixed-type column (e.g., free-form Mongo documents)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"nl2db": _meta(out).encode("utf-8")})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+# ---------------------------
+# Handlers
+# ---------------------------
+async def _query(request: dict) -> dict:
+    query, language = request.get("query"), request.get("language")
+    if not isinstance(query, str) or not query.strip() or not isinstance(language, str):
+        raise _BadRequest("'query' and 'language' are required strings")
+    page_size, routing = request.get("page_size"), request.get("routing", "auto")
+    if page_size is not None and (not isinstance(page_size, int) or isinstance(page_size, bool) or page_size < 1):
+        raise _BadRequest("'page_size' must be a positive integer")
+    if not isinstance(routing, str):
+        raise _BadRequest("'routing' must be \"auto\" or \"llm\"")
+    try:
+        out = await arun_supervisor(query, language, routing=routing, page_size=page_size)
+    except ValueError as e:  # unknown routing mode
+        raise _BadRequest(str(e))
+    if out.get("page"):
+        out = {**out, "page": sign_page(out["page"])}
+    return out
+
+async def _page(request: dict) -> dict:
+    if set(request) - {"token", "offset"}:
+        raise _BadRequest("/page takes only 'token' and 'offset'")
+    token, offset = request.get("token"), request.get("offset")
+    if not isinstance(token, str):
+        raise _BadRequest("'token' must be the page token of a /query result")
+    if offset is not None and (not isinstance(offset, int) or isinstance(offset, bool) or offset < 0):
+        raise _BadRequest("'offset' must be a non-negative integer")
+    page = verify_page(token)
+    try:
+        df, page = await run_blocking(fetch_page, {"page": page}, offset)
+    except Exception as e:
+        return {"success": False, "error": f"error occurred ({type(e).__name__})", "data": None}
+    return {"success": True, "error": None, "data": df, "page": sign_page(page)}
+
+ROUTES = {"/query": _query, "/page": _page}
+
+# ---------------------------
+# ASGI
+# ---------------------------
+async def _send(send, status: int, body: bytes, content_type: str = "application/json") -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode("latin-1")), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _read_body(receive) -> bytes:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise _BadRequest("request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Each worker follows source changes; stores are swapped atomically,
+            # so workers pick up each other's rebuilds (db/refresh.py).
+            start_watcher()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+def _error(message: str) -> bytes:
+    return json.dumps({"success": False, "error": message, "data": None}).encode("utf-8")
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    method, path = scope["method"], scope["path"]
+    if method == "GET" and path == "/health":
+        await _send(send, 200, json.dumps({"status": "ok", "pid": os.getpid()}).encode("utf-8"))
+        return
+    if method == "GET" and path == "/metrics":
+        await _send(send, 200, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        return
+    handler = ROUTES.get(path)
+    if handler is None:
+        await _send(send, 404, _error("not found"))
+        return
+    if method != "POST":
+        await _send(send, 405, _error("method not allowed"))
+        return
+    try:
+        request = json.loads(await _read_body(receive) or b"{}")
+        if not isinstance(request, dict):
+            raise _BadRequest("request body must be a JSON object")
+        out = await handler(request)
+    except json.JSONDecodeError:
+        await _send(send, 400, _error("request body is not valid JSON"))
+        return
+    except _BadRequest as e:
+        await _send(send, 400, _error(str(e)))
+        return
+    accept = dict(scope.get("headers") or []).get(b"accept", b"").decode("latin-1")
+    body = encode_arrow(out) if ARROW_STREAM in accept else None
+    if body is not None:
+        await _send(send, 200, body, ARROW_STREAM)
+    else:
+        await _send(send, 200, encode_json(out))
+
+# ---------------------------
+# Entry point
+# ---------------------------
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("NL2DB_API_WORKERS", "4")))
+    args = ap.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("server.py needs uvicorn (pip install uvicorn), or run `app` on another ASGI server", file=sys.stderr)
+        return 2
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers,
+                app_dir=os.path.dirname(os.path.abspath(__file__)), log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# tests/conftest.py
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db import mongo_backends, mongo_runner, refresh, rollups, storage  # noqa: E402
+from db.catalog import DEFAULT_MANIFEST, Catalog, set_catalog  # noqa: E402
+from db.mongo_backends import MongitaBackend, set_backend  # noqa: E402
+from db.result_cache import result_cache  # noqa: E402
+
+@pytest.fixture
+def mongo_source(tmp_path, monkeypatch):
+    """
+    attach(source, collection, tables): the collection (a catalog manifest entry)
+    on the JSON file `source`, seeded into a fresh in-memory backend.
+    """
+    monkeypatch.setattr(storage, "STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(rollups, "_mongo", None)  # the rollup of another test's backend
+
+    def attach(source, collection=DEFAULT_MANIFEST["collection"], tables=()):
+        for module in (mongo_backends, mongo_runner, refresh):
+            monkeypatch.setattr(module, "SOURCE_JSON", str(source))
+        backend = MongitaBackend("demo_db", collection["name"])
+        backend.ensure_seeded(str(source))
+        set_backend(backend)
+        set_catalog(Catalog({"tables": list(tables), "collection": collection}))
+        monkeypatch.setattr(mongo_runner, "_mirrored", mongo_runner._generation)  # a fresh mirror
+        result_cache.invalidate()
+
+    yield attach
+    set_backend(None)
+    set_catalog(None)
+    result_cache.invalidate()
+
+@pytest.fixture
+def demo(tmp_path, mongo_source):
+    """The demo table and collection on copies of their sources."""
+    csv, source = tmp_path / "customers.csv", tmp_path / "customers.json"
+    shutil.copy(os.path.join(ROOT, "db", "mockdb_1.csv"), csv)
+    shutil.copy(os.path.join(ROOT, "db", "mockdb_2.json"), source)
+    mongo_source(source, tables=[{"name": "mytable", "path": str(csv)}])
@@ -0,0 +1,54 @@
+# tests/test_cost_guard.py
+import duckdb
+import pandas as pd
+import pytest
+
+from agents.mongodb_agent import _execute_mongo
+from agents.sql_engine import _execute_sql
+from db import cost_guard, mongo_runner
+from db.cost_guard import truncation
+from db.query_runner import register_table, run_query
+
+@pytest.fixture
+def limit(monkeypatch):
+    # mongo_runner imports the limit by value, as it does the guards.
+    for module in (cost_guard, mongo_runner):
+        monkeypatch.setattr(module, "AUTO_LIMIT", 10)
+    cost_guard.clear_verdicts()
+    yield 10
+    cost_guard.clear_verdicts()
+
+def test_listing_cut_by_the_automatic_limit_is_reported(limit):
+    conn = duckdb.connect()
+    register_table(conn, "t", pd.DataFrame({"n": range(30)}))
+    for _ in range(2):  # executed, then served from the result cache
+        df = run_query(conn, "SELECT n FROM t")
+        assert len(df) == limit
+        assert truncation(df) == {"truncated": True, "row_limit": limit}
+
+def test_listing_that_fits_is_not_reported(limit):
+    conn = duckdb.connect()
+    register_table(conn, "t", pd.DataFrame({"n": range(limit)}))
+    df = run_query(conn, "SELECT n FROM t")
+    assert len(df) == limit
+    assert truncation(df) == {}
+    assert truncation(run_query(conn, "SELECT n FROM t WHERE n < 3")) == {}
+
+def test_sql_result_dict_carries_the_flag(demo, limit):
+    out = _execute_sql("SELECT * FROM mytable", "SQL")
+    assert len(out["data"]) == limit
+    assert (out["truncated"], out["row_limit"]) == (True, limit)
+    out = _execute_sql("SELECT COUNT(*) AS n FROM mytable", "SQL")
+    assert "truncated" not in out
+
+@pytest.mark.parametrize("engine", ["duckdb", "backend"])
+def test_mongo_listings_cut_by_the_automatic_limit_are_reported(demo, limit, monkeypatch, engine):
+    monkeypatch.setattr(mongo_runner, "ENGINE", engine)
+    for spec in ('{"filter": {}}', '{"aggregate": [{"$match": {"Age": {"$gte": 18}}}]}'):
+        out = _execute_mongo(spec)
+        assert len(out["data"]) == limit
+        assert (out["truncated"], out["row_limit"]) == (True, limit)
+    out = _execute_mongo('{"filter": {"Age": {"$gt": 69}}}')  # 2 customers over 69
+    assert len(out["data"]) < limit and "truncated" not in out
+    out = _execute_mongo('{"aggregate": [{"$group": {"_id": "$Genre", "n": {"$sum": 1}}}]}')
+    assert "truncated" not in out
@@ -0,0 +1,99 @@
+# tests/test_llm_gateway.py
+import asyncio
+
+import pytest
+
+from agents.llm_gateway import GatedLLM, LLMGateway
+
+class _SlowClient:
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+        self.configs = []
+
+    def invoke(self, prompt, config=None, **kwargs):
+        self.configs.append(config)
+        return f"answer to {prompt}"
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        self.calls += 1
+        self.configs.append(config)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"answer to {prompt}"
+
+def _gateway() -> LLMGateway:
+    return LLMGateway(rpm=0, tpm=0, retries=0)
+
+def test_follower_timeout_does_not_fail_the_leader():
+    async def main():
+        gw, client = _gateway(), _SlowClient()
+        leader = asyncio.ensure_future(gw.acall(client, "q"))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(gw.acall(client, "q"), 0.05)
+        assert await leader == "answer to q"
+        assert client.calls == 1
+
+    asyncio.run(main())
+
+def test_leader_timeout_does_not_cancel_the_followers():
+    async def main():
+        gw, client = _gateway(), _SlowClient()
+        leader = asyncio.ensure_future(asyncio.wait_for(gw.acall(client, "q"), 0.05))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(gw.acall(client, "q"))
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        assert await follower == "answer to q"
+        assert client.calls == 1
+
+    asyncio.run(main())
+
+def test_abandoned_call_is_stopped_when_nobody_waits():
+    async def main():
+        gw, client = _gateway(), _SlowClient()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(gw.acall(client, "q"), 0.05)
+        # The flight is closed: the next caller starts its own call.
+        assert await gw.acall(client, "q") == "answer to q"
+        assert client.calls == 2
+        assert gw.stats()["inflight"] == 0
+
+    asyncio.run(main())
+
+def test_call_is_stopped_once_leader_and_followers_all_gave_up():
+    async def main():
+        gw, client = _gateway(), _SlowClient()
+        waiters = [asyncio.ensure_future(gw.acall(client, "q")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        for w in waiters[1:] + waiters[:1]:  # followers first: the leader leaves last
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert client.calls == 1 and client.cancelled == 1
+        assert gw.stats()["inflight"] == 0
+        # Leader first: the call goes on while a follower waits, and stops with it.
+        waiters = [asyncio.ensure_future(gw.acall(client, "q")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert client.cancelled == 1
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert client.calls == 2 and client.cancelled == 2
+
+    asyncio.run(main())
+
+def test_gated_llm_passes_the_config_on():
+    client, config = _SlowClient(delay=0), {"tags": ["nl2db"], "max_concurrency": 2}
+    llm = GatedLLM(client, _gateway())
+    llm.invoke("a", config=config)
+    asyncio.run(llm.ainvoke("b", config=config))
+    llm.batch(["c", "d"], config=config)
+    assert client.configs == [config] * 4
@@ -0,0 +1,29 @@
+# tests/test_local_compiler.py
+import json
+
+import pytest
+
+from agents.local_compiler import compile_local
+from db.sql_ast import parse_sql
+
+@pytest.mark.parametrize("kind", ["sql", "mongodb"])
+@pytest.mark.parametrize("question", ["top customers by income", "oldest customers", "youngest people"])
+def test_plural_top_without_a_count_goes_to_the_llm(kind, question):
+    assert compile_local(kind, question) is None
+
+def test_counts_and_single_subjects_still_compile():
+    assert compile_local("sql", "Top 10 customers by spending score").endswith("DESC LIMIT 10")
+    assert compile_local("sql", "the oldest customer") == "SELECT * FROM mytable ORDER BY Age DESC LIMIT 1"
+
+@pytest.mark.parametrize("question", ["customers aged between 30 and 20", "customers aged 30 to 20"])
+def test_reversed_range_bounds_are_ordered(question):
+    assert compile_local("sql", question) == "SELECT * FROM mytable WHERE Age >= 20 AND Age <= 30"
+    assert json.loads(compile_local("mongodb", question)) == {"filter": {"Age": {"$gte": 20, "$lte": 30}}}
+
+@pytest.mark.parametrize("question", ["average income", "Average annual income by genre",
+                                      "what is the highest spending score"])
+def test_sql_and_mongo_name_the_aggregate_alike(question):
+    sql = parse_sql(compile_local("sql", question), "duckdb")
+    alias = sql.tree.expressions[-1].alias
+    group = next(s["$group"] for s in json.loads(compile_local("mongodb", question))["aggregate"] if "$group" in s)
+    assert [k for k in group if k != "_id"] == [alias]
@@ -0,0 +1,29 @@
+# tests/test_mongo_refresh.py
+from db import mongo_backends, mongo_runner, refresh
+
+def _count():
+    out = mongo_runner.run_mongo_aggregate([{"$count": "n"}])
+    return int(out["n"][0])
+
+def test_appended_documents_reach_find_and_count(demo):
+    assert len(mongo_runner.run_mongo_query({})) == 200
+    refresh.append_rows("customers", [{"CustomerID": 201, "Genre": "Female", "Age": 99,
+                                       "Annual_Income_kUSD": 50, "Spending_Score": 50}])
+    assert len(mongo_runner.run_mongo_query({})) == 201
+    assert len(mongo_runner.run_mongo_query({"Age": 99})) == 1
+    assert _count() == 201
+    assert mongo_runner.engine_stats()["duckdb"] > 0
+
+def test_table_appends_stay_out_of_the_collection(demo):
+    refresh.append_rows("mytable", [{"CustomerID": 201, "Genre": "Male", "Age": 98}])
+    assert len(mongo_runner.run_mongo_query({})) == 200
+    assert mongo_runner.run_mongo_query({"Age": 98}).empty
+    assert _count() == 200
+
+def test_local_writes_run_on_the_backend_until_mirrored(demo):
+    mongo_runner.run_mongo_query({})  # backend seeded, mirror attached
+    mongo_backends.get_backend().collection.insert_one({"CustomerID": 202, "Genre": "Male", "Age": 97})
+    mongo_runner.invalidate_mongo_cache()
+    before = mongo_runner.engine_stats()["backend"]
+    assert len(mongo_runner.run_mongo_query({"Age": 97})) == 1
+    assert mongo_runner.engine_stats()["backend"] == before + 1
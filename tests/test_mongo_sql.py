@@ -0,0 +1,105 @@
+# tests/test_mongo_sql.py
+import json
+
+import pytest
+
+from db import mongo_runner
+from db.mongo_runner import engine_stats, run_mongo_aggregate, run_mongo_query, same_rows
+from db.result_cache import result_cache
+
+# Homogeneous columns with gaps: "age" has a null and a missing value, "tag" is
+# missing once (a NULL column is a missing field to the mirror, so no explicit
+# null where $exists is asked).
+DOCS = [
+    {"id": "01", "name": "Ann", "age": 30, "score": 1.5, "tag": "a", "vip": True},
+    {"id": "02", "name": "bob", "age": None, "score": 2.0, "tag": "b", "vip": False},
+    {"id": "03", "name": "Cid", "age": 45, "score": 0.5, "vip": False},
+    {"id": "04", "name": "dee", "score": 3.25, "tag": "a", "vip": True},
+    {"id": "05", "name": "Eve", "age": 45, "score": 2.0, "tag": "c", "vip": False},
+    {"id": "06", "name": "fay", "age": 22, "score": 1.0, "tag": "b", "vip": True},
+]
+
+@pytest.fixture
+def people(tmp_path, mongo_source):
+    source = tmp_path / "people.json"
+    source.write_text(json.dumps(DOCS))
+    mongo_source(source, collection={"name": "people", "key": "id"})  # no rollup: the backend itself answers
+
+FINDS = {
+    # type brackets: no string/number/bool coercion
+    "string_vs_int": ({"age": {"$gt": "30"}}, None),
+    "int_vs_string": ({"name": {"$lt": 100}}, None),
+    "eq_wrong_type": ({"age": "45"}, None),
+    "in_mixed_types": ({"age": {"$in": ["45", 22]}}, None),
+    "bool_vs_number": ({"vip": {"$gte": 0}}, None),
+    "int_vs_float": ({"score": {"$gte": 2}}, None),
+    "bool_eq": ({"vip": True}, None),
+    # NULL handling
+    "eq_null": ({"age": None}, None),
+    "ne_null": ({"age": {"$ne": None}}, None),
+    "ne_value": ({"age": {"$ne": 45}}, None),
+    "nin": ({"tag": {"$nin": ["a"]}}, None),
+    "nin_null": ({"tag": {"$nin": [None, "b"]}}, None),
+    "in_null": ({"tag": {"$in": [None, "c"]}}, None),
+    "not": ({"age": {"$not": {"$gt": 40}}}, None),
+    "not_in": ({"tag": {"$not": {"$in": ["a", "b"]}}}, None),
+    "exists": ({"tag": {"$exists": False}}, None),
+    "range": ({"age": {"$gte": 22, "$lt": 45}}, None),
+    "regex": ({"name": {"$regex": "^[a-d]", "$options": "i"}}, None),
+    "and_or_nor": ({"$or": [{"age": {"$lt": 25}}, {"tag": "a"}], "$nor": [{"vip": False}]}, None),
+    "and": ({"$and": [{"score": {"$gt": 1}}, {"score": {"$lt": 3}}]}, None),
+    # projections
+    "include": ({"age": {"$gt": 25}}, {"name": 1, "age": 1}),
+    "exclude": ({}, {"score": 0, "vip": 0}),
+    "computed": ({"tag": "b"}, {"who": "$name", "one": {"$literal": 1}, "_id": 0}),
+}
+
+@pytest.mark.parametrize("query, projection", FINDS.values(), ids=list(FINDS))
+def test_find_matches_the_backend(people, monkeypatch, query, projection):
+    _same_on_both(monkeypatch, lambda: run_mongo_query(query, projection=projection))
+
+PIPELINES = {
+    # accumulators, NULL group keys, nothing out of no input
+    "group": ([{"$group": {"_id": "$tag", "n": {"$sum": 1}, "avg": {"$avg": "$age"},
+                           "lo": {"$min": "$age"}, "hi": {"$max": "$name"}, "c": {"$count": {}}}}], None),
+    "group_all": ([{"$group": {"_id": None, "total": {"$sum": "$score"}, "n": {"$sum": 1}}}], None),
+    "group_no_input": ([{"$match": {"age": {"$gt": 100}}}, {"$group": {"_id": None, "n": {"$sum": 1}}}], None),
+    "group_by_key_no_input": ([{"$match": {"tag": "z"}}, {"$group": {"_id": "$tag", "n": {"$sum": 1}}}], None),
+    "count": ([{"$match": {"vip": True}}, {"$count": "n"}], None),
+    "count_no_input": ([{"$match": {"age": {"$lt": 0}}}, {"$count": "n"}], None),
+    # $sort: nulls (and missing) first ascending, last descending; ties in insertion order
+    "sort_asc": ([{"$sort": {"age": 1}}, {"$project": {"name": 1, "age": 1, "_id": 0}}], "name"),
+    "sort_desc": ([{"$sort": {"age": -1}}, {"$project": {"name": 1, "age": 1, "_id": 0}}], "name"),
+    "sort_two_keys": ([{"$sort": {"tag": 1, "score": -1}}], "name"),
+    "sort_skip_limit": ([{"$sort": {"score": 1}}, {"$skip": 1}, {"$limit": 3}], "name"),
+    # stages that fold into one SELECT (WHERE, GROUP BY, HAVING, ORDER BY, LIMIT)
+    "fold": ([{"$match": {"score": {"$gt": 0.5}}},
+              {"$group": {"_id": "$tag", "n": {"$sum": 1}}},
+              {"$match": {"n": {"$gt": 1}}},
+              {"$sort": {"_id": 1}},
+              {"$limit": 2}], "_id"),
+    # stages that must nest as subqueries
+    "match_after_limit": ([{"$sort": {"score": -1}}, {"$limit": 3}, {"$match": {"vip": True}}], "name"),
+    "group_after_limit": ([{"$sort": {"id": 1}}, {"$limit": 4}, {"$group": {"_id": "$vip", "n": {"$sum": 1}}}], None),
+    "group_of_group": ([{"$group": {"_id": "$tag", "n": {"$sum": 1}}}, {"$group": {"_id": "$n", "tags": {"$sum": 1}}}], None),
+    "match_on_projected": ([{"$project": {"years": "$age", "name": 1}}, {"$match": {"years": {"$gt": 25}}}], None),
+    "set_then_match": ([{"$set": {"bucket": "$tag"}}, {"$match": {"bucket": {"$ne": "a"}}}, {"$project": {"name": 1, "bucket": 1, "_id": 0}}], None),
+    "skip_then_sort": ([{"$sort": {"id": 1}}, {"$skip": 2}, {"$sort": {"age": 1}}], "name"),
+}
+
+@pytest.mark.parametrize("pipeline, ordered", PIPELINES.values(), ids=list(PIPELINES))
+def test_pipeline_matches_the_backend(people, monkeypatch, pipeline, ordered):
+    _same_on_both(monkeypatch, lambda: run_mongo_aggregate(pipeline), ordered)
+
+def _same_on_both(monkeypatch, run, ordered=None):
+    # The DuckDB mirror's answer (it must not fall back) against the backend's.
+    result_cache.invalidate()
+    before = engine_stats()["duckdb"]
+    on_duckdb = run()
+    assert engine_stats()["duckdb"] == before + 1, "not translated"
+    monkeypatch.setattr(mongo_runner, "ENGINE", "backend")
+    result_cache.invalidate()
+    on_backend = run()
+    assert same_rows(on_duckdb, on_backend), f"\n{on_duckdb}\n{on_backend}"
+    if ordered:
+        assert on_duckdb[ordered].tolist() == on_backend[ordered].tolist()
@@ -0,0 +1,30 @@
+# tests/test_query_runner.py
+import duckdb
+import pandas as pd
+
+from db.query_runner import register_table, run_query
+
+def _conn():
+    conn = duckdb.connect()
+    df = pd.DataFrame({
+        "g": ["a", "a", "b"],
+        "n": [1, 2, 3],
+        "price": [1.5, 2.25, 3.0],
+        "day": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]),
+    })
+    register_table(conn, "t", df)
+    return conn
+
+def test_arrow_results_keep_fetchdf_dtypes():
+    conn = _conn()
+    query = (
+        "SELECT g, SUM(n) AS total, SUM(CAST(price AS DECIMAL(10, 2))) AS amount, "
+        "MIN(CAST(day AS DATE)) AS first_day, MAX(CASE WHEN n > 1 THEN n END) AS big "
+        "FROM t GROUP BY g ORDER BY g"
+    )
+    expected = conn.execute(query).fetchdf()
+    for _ in range(2):  # executed, then served from the result cache
+        df = run_query(conn, query)
+        assert df.dtypes.to_dict() == expected.dtypes.to_dict()
+        assert df["total"].dtype == "float64"
+        assert df["total"].tolist() == [3.0, 3.0]
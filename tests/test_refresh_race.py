@@ -0,0 +1,129 @@
+# tests/test_refresh_race.py
+"""Two worker processes refreshing the same appended sources at the same time."""
+import json
+import multiprocessing
+import os
+import shutil
+import time
+
+import duckdb
+
+from db import storage
+from db.mongo_backends import MongoBackend
+
+class _FileCollection:
+    # A collection every process sees: documents as JSON lines in one file.
+    def __init__(self, path: str, name: str):
+        self.path, self.name = path, name
+
+    def find(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def find_one(self, query):
+        return next((d for d in self.find() if all(d.get(k) == v for k, v in query.items())), None)
+
+    def insert_many(self, docs):
+        time.sleep(0.3)  # a slow write: the other worker reads the same synced meta meanwhile
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(d) + "\n" for d in docs)
+
+    def replace_one(self, query, doc, upsert=False):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(doc) + "\n")
+
+    def delete_many(self, query):
+        open(self.path, "w").close()
+
+    def count_documents(self, query):
+        return len(self.find())
+
+    def create_index(self, field):
+        pass
+
+class _FileBackend(MongoBackend):
+    name = "file"
+
+    def __init__(self, directory: str):
+        self.collection = _FileCollection(os.path.join(directory, "docs.jsonl"), "customers")
+        self.meta = _FileCollection(os.path.join(directory, "meta.jsonl"), "meta")
+
+    def find(self, query, projection=None, skip=0, limit=0, batch_size=None):
+        docs = self.collection.find()
+        return docs[:limit] if limit else docs
+
+    def estimated_count(self):
+        return self.collection.count_documents({})
+
+def _worker(tmp: str, names, ready, go, delay: float) -> None:
+    from db.catalog import get_catalog
+    from db.mongo_backends import set_backend
+    from db.refresh import refresh
+
+    copy = storage.shutil.copyfile
+
+    def slow_copy(src, dst):  # widens read-meta -> copy, like a large store
+        time.sleep(delay)
+        return copy(src, dst)
+
+    backend = _FileBackend(tmp)
+    backend.ensure_seeded(os.environ["NL2DB_MONGO_SOURCE"])
+    set_backend(backend)
+    get_catalog().connection()  # a running worker: stores attached before the sources change
+    get_catalog().collection_connection()
+    storage.shutil.copyfile = slow_copy
+    ready.wait()
+    go.wait()
+    for name in names:
+        refresh(name)
+
+def _run(tmp: str, names, processes: int, change) -> None:
+    # `processes` workers start, change() edits the sources, then all of them refresh.
+    ctx = multiprocessing.get_context("spawn")
+    ready, go = ctx.Barrier(processes + 1), ctx.Barrier(processes + 1)
+    # Staggered: the later worker copies the store after the first one replaced it.
+    procs = [ctx.Process(target=_worker, args=(tmp, names, ready, go, 0.3 + 0.6 * i)) for i in range(processes)]
+    for p in procs:
+        p.start()
+    ready.wait(120)
+    change()
+    go.wait(120)
+    for p in procs:
+        p.join(120)
+        assert p.exitcode == 0
+
+def test_concurrent_refreshes_apply_an_append_once(tmp_path, monkeypatch):
+    tmp = str(tmp_path)
+    csv, source = tmp_path / "customers.csv", tmp_path / "customers.jsonl"
+    shutil.copy("db/mockdb_1.csv", csv)
+    with open("db/mockdb_2.json") as f:
+        source.write_text("".join(json.dumps(d) + "\n" for d in json.load(f)))
+    manifest = tmp_path / "catalog.json"
+    manifest.write_text(json.dumps({
+        "tables": [{"name": "mytable", "path": str(csv)}],
+        "collection": {"name": "customers", "rollup": ["Genre"]},
+    }))
+    store = tmp_path / "store"
+    for var, value in (("NL2DB_STORE_DIR", store), ("NL2DB_CATALOG", manifest),
+                       ("NL2DB_MONGO_SOURCE", source), ("NL2DB_REFRESH_INTERVAL", 0)):
+        monkeypatch.setenv(var, str(value))
+
+    def append():
+        with open(csv, "ab") as f:  # the demo CSV has CRLF lines and no final newline
+            f.write(b"\r\n0201,Male,98,50,50\r\n0202,Female,97,60,60")
+        with open(source, "a") as f:
+            f.write(json.dumps({"CustomerID": 201, "Genre": "Male", "Age": 98}) + "\n")
+
+    _run(tmp, ["mytable", "customers"], 1, lambda: None)  # stores ingested, collection seeded
+    _run(tmp, ["mytable", "customers"], 2, append)
+
+    monkeypatch.setattr(storage, "STORE_DIR", str(store))
+    counts = {}
+    for name, path in (("mytable", csv), ("customers", source)):
+        conn = duckdb.connect(storage.store_path(str(path)), read_only=True)
+        counts[name] = conn.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+        conn.close()
+    assert counts == {"mytable": 202, "customers": 201}
+    assert _FileBackend(tmp).estimated_count() == 201
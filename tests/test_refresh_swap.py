@@ -0,0 +1,25 @@
+# tests/test_refresh_swap.py
+import pandas as pd
+
+from db import storage
+from db.query_runner import ConnectionPool, _POOLS, init_db, iter_query_batches, reattach_source, run_query
+
+def test_store_swap_leaves_running_queries_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORE_DIR", str(tmp_path / "store"))
+    csv = tmp_path / "swap.csv"
+    pd.DataFrame({"n": range(200)}).to_csv(csv, index=False)
+    conn = init_db(tables={"swap": str(csv)})
+    _POOLS[id(conn)] = ConnectionPool(conn, size=2, timeout=1.0)
+
+    rows = 0
+    for i, batch in enumerate(iter_query_batches(conn, "SELECT n FROM swap", batch_size=50, row_budget=0)):
+        rows += batch.num_rows
+        if i == 0:
+            pd.DataFrame({"n": range(300)}).to_csv(csv, index=False)
+            assert reattach_source(str(csv)) == 1
+            # New queries see the new store while the stream still reads the old one.
+            assert run_query(conn, "SELECT COUNT(*) AS c FROM swap")["c"][0] == 300
+            assert len(storage._aliases(conn, "swap")) == 2
+    assert rows == 200
+    # The replaced store is detached once the stream is done.
+    assert [a for _, a in storage._aliases(conn, "swap")] == [storage.current_alias(conn, "swap")]
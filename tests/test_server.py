@@ -0,0 +1,72 @@
+# tests/test_server.py
+import asyncio
+import importlib
+import json
+
+import pytest
+
+from db import storage
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("NL2DB_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(storage, "STORE_DIR", str(tmp_path / "store"))
+    import server
+    return importlib.reload(server)  # picks up the key file in the new cache dir
+
+def _post(server, path: str, request) -> tuple:
+    messages = [{"type": "http.request", "body": json.dumps(request).encode("utf-8")}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": []}
+    asyncio.run(server.app(scope, receive, send))
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+PAGE = {"route": "SQL", "query": "SELECT CustomerID FROM mytable ORDER BY CustomerID",
+        "offset": 0, "limit": 5, "has_more": True}
+
+def test_page_runs_only_signed_tokens(server):
+    page = server.sign_page(PAGE)
+    assert "query" not in page and page["has_more"]
+    status, out = _post(server, "/page", {"token": page["token"]})
+    assert status == 200 and out["success"]
+    assert [r["CustomerID"] for r in out["data"]] == ["0006", "0007", "0008", "0009", "0010"]
+    assert out["page"]["offset"] == 5 and "token" in out["page"]
+
+    # A client-built descriptor is refused, as is a token whose payload was edited.
+    status, out = _post(server, "/page", {"page": {**PAGE, "query": "SELECT 42"}})
+    assert status == 400
+    payload, mac = page["token"].split(".")
+    forged = json.loads(server._unb64(payload))
+    forged["page"]["query"] = "SELECT 42"
+    token = server._b64(json.dumps(forged).encode("utf-8")) + "." + mac
+    status, out = _post(server, "/page", {"token": token})
+    assert status == 400 and out["error"] == "invalid page token"
+
+def test_page_token_expires(server, monkeypatch):
+    monkeypatch.setattr(server, "PAGE_TOKEN_TTL", -1)
+    status, out = _post(server, "/page", {"token": server.sign_page(PAGE)["token"]})
+    assert status == 400 and "expired" in out["error"]
+
+def test_workers_share_the_signing_key(server):
+    token = server.sign_page(PAGE)["token"]
+    importlib.reload(server)  # another worker process: reads the same key file
+    assert server.verify_page(token) == PAGE
+
+@pytest.mark.parametrize("request_, error", [
+    ({"page_size": True}, "'page_size' must be a positive integer"),
+    ({"page_size": 0}, "'page_size' must be a positive integer"),
+    ({"page_size": "10"}, "'page_size' must be a positive integer"),
+    ({"routing": ["auto"]}, "'routing' must be \"auto\" or \"llm\""),
+    ({"routing": None}, "'routing' must be \"auto\" or \"llm\""),
+    ({"routing": "fast"}, "Unknown routing mode: 'fast'"),
+])
+def test_query_rejects_malformed_options(server, request_, error):
+    status, out = _post(server, "/query", {"query": "how many customers", "language": "SQL", **request_})
+    assert (status, out["error"]) == (400, error)
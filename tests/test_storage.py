@@ -0,0 +1,21 @@
+# tests/test_storage.py
+import os
+
+import pandas as pd
+
+from db import storage
+from db.query_runner import init_db, run_query
+
+def test_sources_with_the_same_file_name_get_their_own_stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORE_DIR", str(tmp_path / "store"))
+    paths = {"a": tmp_path / "a" / "x.csv", "b": tmp_path / "b" / "x.csv", "p": tmp_path / "a" / "x.parquet"}
+    for i, (name, path) in enumerate(paths.items()):
+        os.makedirs(path.parent, exist_ok=True)
+        df = pd.DataFrame({"source": [name] * (i + 1)})
+        df.to_parquet(path) if path.suffix == ".parquet" else df.to_csv(path, index=False)
+
+    assert len({storage.store_path(str(p)) for p in paths.values()}) == 3
+    conn = init_db(tables={name: str(p) for name, p in paths.items()})
+    for i, name in enumerate(paths):
+        df = run_query(conn, f"SELECT source, COUNT(*) AS n FROM {name} GROUP BY source")
+        assert df.to_dict("records") == [{"source": name, "n": i + 1}]
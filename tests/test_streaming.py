@@ -0,0 +1,28 @@
+# tests/test_streaming.py
+import duckdb
+import pandas as pd
+
+from db.query_runner import ConnectionPool, _POOLS, iter_query_batches, register_table, run_query
+
+def _conn(pool_size: int):
+    conn = duckdb.connect()
+    register_table(conn, "t", pd.DataFrame({"n": range(200)}))
+    _POOLS[id(conn)] = ConnectionPool(conn, size=pool_size, timeout=1.0)
+    return conn
+
+def _stream_with_nested_query(conn):
+    rows, counts = 0, []
+    for batch in iter_query_batches(conn, "SELECT n FROM t", batch_size=50, row_budget=0):
+        rows += batch.num_rows
+        counts.append(int(run_query(conn, "SELECT COUNT(*) AS c FROM t")["c"][0]))
+    return rows, counts
+
+def test_nested_query_does_not_end_the_stream():
+    rows, counts = _stream_with_nested_query(_conn(pool_size=4))
+    assert rows == 200
+    assert counts and set(counts) == {200}
+
+def test_nested_query_shares_the_streams_slot():
+    # Pool of one: the nested query must not wait for the slot the stream holds.
+    rows, _ = _stream_with_nested_query(_conn(pool_size=1))
+    assert rows == 200
@@ -0,0 +1,19 @@
+# tests/test_supervisor_batch.py
+from agents import supervisor
+
+def test_batch_dedupes_on_the_cache_key(monkeypatch):
+    asked = []
+
+    def batch(questions, max_concurrency=8):
+        asked.extend(questions)
+        return [{"success": True, "error": None, "data": q} for q in questions]
+
+    monkeypatch.setattr(supervisor, "get_agent", lambda route, kind="sync": batch)
+    out = supervisor.run_supervisor_batch([
+        "Customers with Genre = 'Male'",
+        "customers  with genre = 'Male'?",
+        "customers with genre = 'male'",
+    ], "SQL")
+    assert asked == ["Customers with Genre = 'Male'", "customers with genre = 'male'"]
+    assert [o["deduped"] for o in out] == [False, True, False]
+    assert out[2]["data"] == "customers with genre = 'male'"
@@ -0,0 +1,60 @@
+# tests/test_translation_cache.py
+import json
+
+import pytest
+
+from agents.local_compiler import compile_local
+from agents.translation_cache import fill_template, make_template, nl_template, normalize_nl
+from db.sql_ast import parse_sql, render_sql
+
+def test_normalize_folds_case_and_spacing_outside_quotes():
+    assert normalize_nl("  Average  income of MALE customers?") == "average income of male customers"
+    assert normalize_nl("What's the customers' average age.") == "what's the customers' average age"
+
+def test_normalize_keeps_quoted_values():
+    assert normalize_nl("Customers with Genre = 'Male'") == "customers with genre = 'Male'"
+    assert normalize_nl("customers with genre = 'Male'") != normalize_nl("customers with genre = 'male'")
+    assert normalize_nl('Genre "Fe  male"?') == 'genre "Fe  male"'
+
+def _template(dialect, nl_query, value):
+    text, values = nl_template(nl_query)
+    return make_template(dialect, value, values, text)
+
+def test_derived_literal_is_not_templated():
+    assert nl_template("customers in their 40s") == ("customers in their <0>s", [40])
+    assert _template("sql", "customers in their 40s", "SELECT * FROM mytable WHERE Age BETWEEN 40 AND 49") is None
+    assert _template("mongodb", "customers in their 40s", '{"filter": {"Age": {"$gte": 40, "$lt": 50}}}') is None
+
+def test_repeated_values_are_not_templated():
+    assert nl_template("customers aged between 30 and 30") is None
+    assert nl_template("income 30 or 30.0") is None
+    assert nl_template("customers named 'Ann' or \"Ann\"") is None
+
+def test_string_literal_must_come_from_the_question():
+    sql = "SELECT * FROM mytable WHERE Genre = 'Male' AND Age > 40"
+    assert _template("sql", "male customers older than 40", sql) is not None
+    assert _template("sql", "female customers older than 40", sql) is None  # 'Male' is not a word of it
+    assert _template("sql", "customers over 40", "SELECT * FROM mytable WHERE Age > 40 AND Band = '40+'") is None
+    assert _template("mongodb", "customers over 40", '{"filter": {"Age": {"$gt": 40}, "Band": "40+"}}') is None
+
+def test_mongo_in_slots():
+    spec = _template("mongodb", "customers aged 30 or 40", '{"filter": {"Age": {"$in": [30, 40]}}}')
+    filled = fill_template("mongodb", json.loads(spec), [35, 45])
+    assert json.loads(filled) == {"filter": {"Age": {"$in": [35, 45]}}}
+    # An element the question does not name
+    assert _template("mongodb", "customers aged 30 or 40", '{"filter": {"Age": {"$in": [30, 40, 50]}}}') is None
+
+@pytest.mark.parametrize("kind", ["sql", "mongodb"])
+@pytest.mark.parametrize("asked, again", [
+    ("customers aged between 30 and 40", "customers aged between 25 and 35"),
+    ("male customers older than 40", "male customers older than 65"),
+    ("Top 5 customers by spending score", "Top 12 customers by spending score"),
+])
+def test_filled_template_renders_like_a_fresh_translation(kind, asked, again):
+    spec = _template(kind, asked, compile_local(kind, asked))
+    filled = fill_template(kind, json.loads(spec), nl_template(again)[1])
+    fresh = compile_local(kind, again)
+    if kind == "sql":
+        assert filled == render_sql(parse_sql(fresh, "duckdb"), {})
+    else:
+        assert json.loads(filled) == json.loads(fresh)